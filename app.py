@@ -1,40 +1,66 @@
 import streamlit as st
 import json  # Tidak lagi diperlukan jika hanya raw text, tapi tidak masalah jika ada
+import hashlib
 import io
 import os
 import sys
+import time
+import uuid
 
 # Tambahkan path ke direktori saat ini agar modul extraction dapat ditemukan
 sys.path.append(os.path.dirname(__file__))
 
-# Import fungsi dari extraction.py
-# Hanya perlu process_receipt_image, tidak perlu normalize_item_name
-from extraction import process_receipt_image
+# Modul berat (extraction, cv2, numpy, pytesseract) diimport lazy: UI tampil dulu, engine OCR
+# disiapkan di thread background (startup.py) dan fungsi di bawah mengimport saat dipakai
+import startup
+
+startup.start_background_warmup()
+
+# Interval polling status job OCR (detik)
+JOB_POLL_INTERVAL = 0.5
 
 
 # --- Fungsi untuk memuat dan menjalankan model OCR Anda ---
+def _get_or_submit_job(image_bytes, state_prefix, **submit_kwargs):
+    """
+    Job untuk gambar ini di sesi ini (disimpan di st.session_state dengan state_prefix);
+    job baru dikirim ke job queue hanya jika gambarnya berubah atau job lama sudah kedaluwarsa.
+    """
+    from jobs import get_job_queue
+
+    image_key = hashlib.sha256(image_bytes).hexdigest()
+    job_queue = get_job_queue()
+
+    job = job_queue.get(st.session_state.get(f'{state_prefix}_job_id'))
+    if job is None or st.session_state.get(f'{state_prefix}_image_key') != image_key:
+        st.session_state[f'{state_prefix}_job_id'] = job_queue.submit(image_bytes, **submit_kwargs)
+        st.session_state[f'{state_prefix}_image_key'] = image_key
+        job = job_queue.get(st.session_state[f'{state_prefix}_job_id'])
+    return job
+
+
 def run_ocr_and_extraction(image_file_streamlit):
     """
-    Fungsi untuk menjalankan pipeline OCR dan ekstraksi dari extraction.py.
+    Kirim gambar ke job queue OCR di background (pipeline dari extraction.py).
+    Job hanya dikirim sekali per gambar per sesi; rerun Streamlit memakai job yang sama.
 
     Args:
         image_file_streamlit: Objek UploadedFile dari Streamlit (gambar yang diunggah).
 
     Returns:
-        Dict JSON yang berisi hasil ekstraksi (akan diambil raw_text-nya saja).
+        Objek Job (status, stage, progress, result) dari jobs.py.
     """
-    original_filename = image_file_streamlit.name
-    temp_image_path = os.path.join(os.getcwd(), f"temp_{original_filename}")
+    # Gambar didecode langsung dari memori, tidak perlu file sementara di disk
+    # Penanda near-duplicate hanya membandingkan dengan struk dari sesi ini
+    dedup_scope = st.session_state.setdefault('dedup_scope', uuid.uuid4().hex)
+    return _get_or_submit_job(image_file_streamlit.getvalue(), 'ocr', dedup_scope=dedup_scope)
 
-    try:
-        with open(temp_image_path, "wb") as f:
-            f.write(image_file_streamlit.getvalue())
 
-        extracted_data = process_receipt_image(temp_image_path)
-        return extracted_data
-    finally:
-        if os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+def run_preprocess_stages(image_file_streamlit):
+    """Tahap preprocessing (termasuk OCR cadangan pemilihan binarisasi) juga lewat job queue."""
+    from jobs import preprocess_stages
+
+    return _get_or_submit_job(image_file_streamlit.getvalue(), 'preprocess', task=preprocess_stages)
 
 
 # --- Aplikasi Streamlit ---
@@ -63,19 +89,32 @@ elif upload_option == "Ambil dari Kamera":
 extracted_data_result = None
 if image_file is not None:
     st.image(image_file, caption='Gambar Struk Belanja', use_container_width=True)
-    st.write("Memproses gambar, mohon tunggu...")
-
-    try:
-        extracted_data_result = run_ocr_and_extraction(image_file)
 
-        if "error" in extracted_data_result:
-            st.error(f"OCR gagal: {extracted_data_result['error']}")
-        else:
-            st.success("OCR berhasil!")  # Hanya menampilkan status sukses
+    from jobs import QueueFullError
 
+    job = None
+    try:
+        job = run_ocr_and_extraction(image_file)
+    except QueueFullError as e:
+        st.error(f"Server sedang sibuk, silakan coba lagi sebentar lagi. ({e})")
     except Exception as e:
         st.error(f"Terjadi kesalahan saat memproses data: {e}")
-        extracted_data_result = None
+
+    if job is not None and not job.finished:
+        # Belum selesai: tampilkan progres per tahap lalu polling lagi (script thread tidak terblokir OCR)
+        st.progress(job.progress, text=f"Memproses gambar, mohon tunggu... (tahap: {job.stage})")
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+    elif job is not None and job.error:
+        st.error(f"Terjadi kesalahan saat memproses data: {job.error}")
+    elif job is not None:
+        extracted_data_result = job.result
+        st.success("OCR berhasil!")  # Hanya menampilkan status sukses
+        duplicate_of = extracted_data_result.get('duplicate_of')
+        if duplicate_of:
+            detail = ("tanggal dan total sama" if duplicate_of['fields_match']
+                      else "tetapi tanggal/total berbeda, jadi mungkin struk lain")
+            st.info(f"Struk ini mirip dengan struk yang sudah pernah Anda unggah ({detail}).")
 
 st.markdown("---")
 
@@ -87,4 +126,57 @@ if extracted_data_result:  # Pastikan ada hasil dari proses
     st.text_area("Seluruh Teks yang Ditemukan:", raw_text, height=600,
                  help="Ini adalah teks mentah yang dikenali oleh Tesseract OCR dari gambar struk.")
 
+# Tahap preprocessing hanya dihitung jika diminta (tidak ada biaya di jalur utama), sebagai job di
+# antrean yang sama supaya tetap kena admission control dan tidak memblokir script thread
+if image_file is not None and st.checkbox("Tampilkan tahap preprocessing"):
+    from jobs import QueueFullError
+
+    preprocess_job = None
+    try:
+        preprocess_job = run_preprocess_stages(image_file)
+    except QueueFullError as e:
+        st.error(f"Server sedang sibuk, silakan coba lagi sebentar lagi. ({e})")
+
+    if preprocess_job is not None and not preprocess_job.finished:
+        st.progress(preprocess_job.progress, text="Menyiapkan tahap preprocessing...")
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+    elif preprocess_job is not None and preprocess_job.error:
+        st.error(f"Terjadi kesalahan saat preprocessing: {preprocess_job.error}")
+    elif preprocess_job is not None:
+        for stage_name, stage_img in preprocess_job.result['stages'].items():
+            st.image(stage_img, caption=stage_name, use_container_width=True,
+                     channels="BGR" if stage_img.ndim == 3 else "RGB")
+
+with st.sidebar.expander("Laporan Startup"):
+    st.json(startup.get_startup_report())
+
+# Statistik lain butuh modul OCR; ditampilkan setelah warm-up selesai supaya run pertama tidak menunggu import
+if startup.is_ready() or 'extraction' in sys.modules:
+    from cache import get_default_cache
+    from dedup import get_default_dedup_index
+    from extraction import get_psm_stats
+    from jobs import get_job_queue
+    from metrics import get_stage_metrics
+
+    # Statistik PSM adaptif (urutan mode yang dipelajari lintas request)
+    with st.sidebar.expander("Statistik PSM"):
+        st.json(get_psm_stats())
+
+    with st.sidebar.expander("Statistik Cache"):
+        st.json(get_default_cache().stats())
+
+    dedup_index = get_default_dedup_index()
+    if dedup_index is not None:
+        with st.sidebar.expander("Statistik Near-Duplicate"):
+            st.json(dedup_index.stats())
+
+    with st.sidebar.expander("Statistik Job Queue"):
+        st.json(get_job_queue().stats())
+
+    with st.sidebar.expander("Durasi per Tahap"):
+        st.json(get_stage_metrics().snapshot())
+else:
+    st.sidebar.caption("Engine OCR sedang disiapkan...")
+
 # Tidak ada lagi opsi JSON atau tampilan terstruktur lainnya
\ No newline at end of file
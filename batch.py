@@ -0,0 +1,168 @@
+"""
+Pemrosesan struk secara batch (backfill arsip) dengan process pool.
+
+Contoh:
+    python batch.py arsip/2024/ -o hasil.jsonl --workers 8
+    python batch.py "arsip/**/*.jpg" manifest.txt > hasil.jsonl
+
+Input bisa berupa direktori (dicari rekursif), pola glob, atau manifest
+(.txt satu path per baris, atau .jsonl dengan field "path").
+Setiap struk yang selesai langsung ditulis sebagai satu baris JSON; error per file
+dicatat di baris tersebut tanpa menghentikan proses.
+Dengan --ocr-store, hasil OCR mentah (layout per kata) ikut disimpan ke SQLite supaya
+perubahan aturan ekstraksi cukup diproses ulang dengan reextract.py, tanpa OCR ulang.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Tambahkan path ke direktori saat ini agar modul extraction dapat ditemukan
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+MANIFEST_EXTENSIONS = ('.txt', '.jsonl')
+
+
+def _read_manifest(manifest_path):
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path = json.loads(line)['path'] if manifest_path.endswith('.jsonl') else line
+            yield path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+
+def iter_input_paths(sources):
+    """Urai daftar sumber (direktori, glob, manifest, atau file gambar) menjadi path gambar."""
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(source) and source.lower().endswith(MANIFEST_EXTENSIONS):
+            yield from _read_manifest(source)
+        elif os.path.isfile(source):
+            yield source
+        else:
+            yield from sorted(glob.glob(source, recursive=True))
+
+
+def _process_one(path, ocr_kwargs):
+    # Diimport di worker supaya cv2/tesseract diinisialisasi sekali per proses
+    from extraction import process_receipt_image
+
+    start = time.perf_counter()
+    image_hash = None
+    try:
+        # Dibaca sekali: bytes yang sama dipakai untuk hash (key OCR store) dan pipeline
+        with open(path, 'rb') as f:
+            image_bytes = f.read()
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        result = process_receipt_image(image_bytes, **ocr_kwargs)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    record = {'path': path, 'image_hash': image_hash, 'elapsed_s': round(time.perf_counter() - start, 3)}
+    if 'error' in result:
+        record['error'] = result['error']
+    else:
+        record['result'] = result
+    return record
+
+
+def process_batch(paths, workers=None, max_pending=None, **ocr_kwargs):
+    """
+    Proses banyak gambar dengan ProcessPoolExecutor dan yield record per gambar
+    begitu selesai (urutan selesai, bukan urutan input).
+    Antrean dibatasi max_pending (default 2 x workers) sehingga daftar input yang
+    besar tidak dimuat sekaligus ke pool.
+    ocr_kwargs diteruskan ke process_receipt_image; default ocr_workers=1 karena
+    paralelisme sudah di level proses.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    ocr_kwargs.setdefault('ocr_workers', 1)
+
+    paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for path in paths:
+            pending.add(executor.submit(_process_one, path, ocr_kwargs))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('sources', nargs='+', help='Direktori, pola glob, manifest, atau file gambar')
+    arg_parser.add_argument('-o', '--output', help='File JSON Lines output (default: stdout)')
+    arg_parser.add_argument('-w', '--workers', type=int, default=None, help='Jumlah proses worker')
+    arg_parser.add_argument('--max-pending', type=int, default=None, help='Batas antrean (default 2 x workers)')
+    arg_parser.add_argument('--psm-strategy', choices=['adaptive', 'sweep', 'roi'], default=None)
+    arg_parser.add_argument('--denoise-method', default=None)
+    arg_parser.add_argument('--metrics-json', help='Tulis histogram durasi per tahap ke file JSON ini')
+    arg_parser.add_argument('--ocr-store', default=os.environ.get('OCR_STORE_DB'),
+                            help='Simpan hasil OCR mentah ke SQLite ini (default env OCR_STORE_DB)')
+    arg_parser.add_argument('--log-level', default='WARNING', help='Level logging pipeline (ke stderr)')
+    args = arg_parser.parse_args(argv)
+    # Log pipeline ke stderr supaya stdout tetap JSON Lines yang bersih
+    logging.basicConfig(level=args.log_level.upper(), stream=sys.stderr)
+
+    # Worker berjalan di proses lain, jadi histogram diagregasi dari trace tiap record
+    from metrics import StageMetrics
+    stage_metrics = StageMetrics()
+    ocr_store = extractor_version = None
+    if args.ocr_store:
+        # Proses utama satu-satunya penulis SQLite; worker hanya mengirim hasil
+        from extraction import get_extractor_version
+        from ocr_store import OcrStore
+        ocr_store, extractor_version = OcrStore(args.ocr_store), get_extractor_version()
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    processed = failed = 0
+    start = time.perf_counter()
+    try:
+        records = process_batch(iter_input_paths(args.sources), workers=args.workers, max_pending=args.max_pending,
+                                psm_strategy=args.psm_strategy, denoise_method=args.denoise_method)
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+            processed += 1
+            if 'result' in record:
+                stage_metrics.observe_trace(record['result'].get('trace', {}))
+                if ocr_store is not None:
+                    ocr_store.save(record['image_hash'], record['result'], extractor_version)
+            if 'error' in record:
+                failed += 1
+                print(f"Error: {record['path']}: {record['error']}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if args.metrics_json:
+            stage_metrics.write_json(args.metrics_json)
+        if ocr_store is not None:
+            ocr_store.close()
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0
+    print(f"Selesai: {processed} gambar ({failed} gagal) dalam {elapsed:.1f}s ({rate:.2f} gambar/s)",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Benchmark tahap denoise: bandingkan waktu preprocessing dan confidence OCR
+(hasil PSM terbaik) untuk setiap metode di extraction.DENOISERS.
+
+'nlm_tiled' hanya lebih cepat dari 'nlm' jika ada core yang menganggur: NLM OpenCV sudah
+paralel di dalam satu panggilan, dan tiling menambah overlap per strip. Dengan OCR_MAX_WORKERS=1
+'nlm_tiled' sama dengan 'nlm'; di server.py (satu proses gunicorn per core) semua core sudah
+terpakai, jadi tiling biasanya tidak membantu di sana.
+
+Contoh:
+    python benchmarks/denoise_bench.py struk1.jpg struk2.jpg --repeat 3
+    python benchmarks/denoise_bench.py struk*.jpg --methods nlm gated median --no-ocr
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Tambahkan root repo ke path agar modul extraction dapat ditemukan
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import DENOISERS, load_image, preprocess_pipeline, run_psm_sweep
+
+
+def bench_method(images, method, repeat, run_ocr):
+    timings = []
+    confidences = []
+    for img in images:
+        preprocessed = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            preprocessed = preprocess_pipeline(img, denoise_method=method)
+            timings.append(time.perf_counter() - start)
+        if run_ocr and preprocessed is not None:
+            _, confidence, _, _, _ = run_psm_sweep(preprocessed)
+            confidences.append(max(confidence, 0))
+    return {
+        'method': method,
+        'median_ms': statistics.median(timings) * 1000,
+        'max_ms': max(timings) * 1000,
+        'mean_conf': statistics.mean(confidences) if confidences else None,
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('images', nargs='+', help='Path gambar struk')
+    arg_parser.add_argument('--methods', nargs='+', default=list(DENOISERS), choices=list(DENOISERS))
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Jumlah ulangan preprocessing per gambar')
+    arg_parser.add_argument('--no-ocr', action='store_true', help='Hanya ukur waktu preprocessing')
+    args = arg_parser.parse_args(argv)
+
+    # Decode sekali di awal supaya waktu decode tidak ikut terukur
+    images = [img for img in (load_image(path) for path in args.images) if img is not None]
+    if not images:
+        print("Tidak ada gambar yang bisa dibaca.")
+        return 1
+
+    print(f"{'method':<10} {'median ms':>10} {'max ms':>10} {'mean conf':>10}")
+    for method in args.methods:
+        row = bench_method(images, method, args.repeat, not args.no_ocr)
+        conf = f"{row['mean_conf']:.1f}" if row['mean_conf'] is not None else '-'
+        print(f"{row['method']:<10} {row['median_ms']:>10.1f} {row['max_ms']:>10.1f} {conf:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
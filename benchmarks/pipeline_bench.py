@@ -0,0 +1,201 @@
+"""
+Benchmark pipeline lengkap di atas struk sintetis (benchmarks/synthetic.py): latency,
+throughput, memori puncak, dan akurasi per field dalam satu perintah.
+
+Tahap yang diukur:
+    preprocess  preprocess_pipeline saja
+    ocr         tahap OCR (strategi PSM) di atas gambar hasil preprocess
+    extract     extract_entities_rule_based di atas teks ground truth (batas atas akurasi extractor)
+    e2e         process_receipt_image dari gambar mentah sampai field
+
+Contoh:
+    python benchmarks/pipeline_bench.py --count 50 --seed 0
+    python benchmarks/pipeline_bench.py --stages preprocess extract --json hasil.json
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import resource
+import sys
+import time
+import tracemalloc
+
+# Tambahkan root repo ke path agar modul extraction dapat ditemukan
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import (extract_entities_rule_based, preprocess_pipeline, process_receipt_image, psm_stats,
+                        run_psm_adaptive, run_psm_sweep, run_roi_ocr)
+from synthetic import generate_receipts
+
+STAGES = ('preprocess', 'ocr', 'extract', 'e2e')
+FIELDS = ('merchant_name', 'date', 'total', 'items')
+OCR_STRATEGIES = {'adaptive': run_psm_adaptive, 'sweep': run_psm_sweep, 'roi': run_roi_ocr}
+# Kemiripan minimum nama item (difflib ratio) agar dianggap cocok
+ITEM_NAME_MIN_RATIO = 0.8
+
+
+def _norm(value):
+    return re.sub(r'[^a-z0-9]', '', str(value).lower())
+
+
+def field_correct(field, predicted, expected):
+    if field == 'merchant_name':
+        return bool(predicted) and _norm(expected) in _norm(predicted)
+    return predicted == expected
+
+
+def item_scores(predicted, expected):
+    """Precision/recall item: cocok jika harga sama dan nama cukup mirip."""
+    unmatched = list(expected)
+    hits = 0
+    for item in predicted or []:
+        for candidate in unmatched:
+            ratio = difflib.SequenceMatcher(None, _norm(item.get('name')), _norm(candidate['name'])).ratio()
+            if item.get('price') == candidate['price'] and ratio >= ITEM_NAME_MIN_RATIO:
+                unmatched.remove(candidate)
+                hits += 1
+                break
+    return hits, len(predicted or []), len(expected)
+
+
+class StageResult:
+    def __init__(self, name):
+        self.name = name
+        self.timings = []
+        self.peak_bytes = 0
+        self.errors = 0
+        self.correct = {field: 0 for field in FIELDS if field != 'items'}
+        self.scored = 0
+        self.item_hits = self.item_predicted = self.item_expected = 0
+
+    def score(self, predicted, truth):
+        self.scored += 1
+        for field in self.correct:
+            self.correct[field] += field_correct(field, predicted.get(field), truth[field])
+        hits, n_predicted, n_expected = item_scores(predicted.get('items'), truth['items'])
+        self.item_hits += hits
+        self.item_predicted += n_predicted
+        self.item_expected += n_expected
+
+    def summary(self):
+        timings = sorted(self.timings)
+        summary = {'stage': self.name, 'runs': len(timings), 'errors': self.errors,
+                   'peak_mem_mb': round(self.peak_bytes / 2 ** 20, 2)}
+        if timings:
+            summary.update({
+                'p50_ms': round(percentile(timings, 50) * 1000, 2),
+                'p90_ms': round(percentile(timings, 90) * 1000, 2),
+                'p99_ms': round(percentile(timings, 99) * 1000, 2),
+                'throughput_per_s': round(len(timings) / sum(timings), 2) if sum(timings) else None,
+            })
+        if self.scored:
+            summary['accuracy'] = {field: round(n / self.scored, 3) for field, n in self.correct.items()}
+            precision = self.item_hits / self.item_predicted if self.item_predicted else 0.0
+            recall = self.item_hits / self.item_expected if self.item_expected else 0.0
+            summary['accuracy']['items_f1'] = round(
+                2 * precision * recall / (precision + recall), 3) if precision + recall else 0.0
+        return summary
+
+
+def percentile(sorted_values, pct):
+    """Percentile dengan interpolasi linear pada list yang sudah terurut."""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def measure(stage_result, fn, *args, **kwargs):
+    """
+    Jalankan fn dua kali: pass pertama mengukur waktu tanpa tracing, pass kedua mengukur memori
+    puncak dengan tracemalloc (termasuk buffer NumPy). Tracing memperlambat alokasi NumPy/OpenCV,
+    jadi latency tidak boleh diukur saat tracemalloc aktif. Hasil pass pertama yang dikembalikan.
+    Statistik PSM (psm_stats) dikembalikan ke keadaan sebelum pass pertama saat pass memori, jadi
+    pass kedua mengulang urutan mode yang sama dan tidak ikut dihitung ke statistik adaptive.
+    """
+    stats_before = psm_stats.snapshot()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        stage_result.errors += 1
+        print(f"Error di tahap {stage_result.name}: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+    stage_result.timings.append(time.perf_counter() - start)
+
+    stats_after = psm_stats.snapshot()
+    psm_stats.restore(stats_before)
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        stage_result.peak_bytes = max(stage_result.peak_bytes, tracemalloc.get_traced_memory()[1])
+    except Exception:
+        pass  # error sudah dicatat di pass waktu
+    finally:
+        tracemalloc.stop()
+        psm_stats.restore(stats_after)
+    return result
+
+
+def run_benchmark(receipts, stages=STAGES, psm_strategy='adaptive', denoise_method=None):
+    results = {stage: StageResult(stage) for stage in stages}
+    ocr_fn = OCR_STRATEGIES[psm_strategy]
+    for receipt in receipts:
+        image, truth = receipt['image'], receipt['truth']
+        preprocessed = None
+        if 'preprocess' in results or 'ocr' in results:
+            stage = results.get('preprocess') or StageResult('preprocess')
+            preprocessed = measure(stage, preprocess_pipeline, image, denoise_method=denoise_method)
+        if 'ocr' in results and preprocessed is not None:
+            measure(results['ocr'], ocr_fn, preprocessed)
+        if 'extract' in results:
+            predicted = measure(results['extract'], extract_entities_rule_based, receipt['text'])
+            if predicted is not None:
+                results['extract'].score(predicted, truth)
+        if 'e2e' in results:
+            predicted = measure(results['e2e'], process_receipt_image, image, psm_strategy=psm_strategy,
+                                denoise_method=denoise_method)
+            if predicted is not None and 'error' in predicted:
+                results['e2e'].errors += 1
+                predicted = {}
+            if predicted is not None:
+                results['e2e'].score(predicted, truth)
+    return [result.summary() for result in results.values()]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--count', type=int, default=20, help='Jumlah struk sintetis')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES)
+    arg_parser.add_argument('--psm-strategy', choices=list(OCR_STRATEGIES), default='adaptive')
+    arg_parser.add_argument('--denoise-method', default=None)
+    arg_parser.add_argument('--json', help='Simpan ringkasan ke file JSON')
+    args = arg_parser.parse_args(argv)
+
+    # Generate di awal supaya waktu render tidak ikut terukur
+    receipts = list(generate_receipts(args.count, args.seed))
+    summaries = run_benchmark(receipts, args.stages, args.psm_strategy, args.denoise_method)
+
+    print(f"{'stage':<11} {'runs':>5} {'err':>4} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'img/s':>7} "
+          f"{'peak MB':>8}  accuracy")
+    for row in summaries:
+        accuracy = ' '.join(f"{field}={value:.2f}" for field, value in row.get('accuracy', {}).items())
+        print(f"{row['stage']:<11} {row['runs']:>5} {row['errors']:>4} {row.get('p50_ms', 0):>9.1f} "
+              f"{row.get('p90_ms', 0):>9.1f} {row.get('p99_ms', 0):>9.1f} {row.get('throughput_per_s') or 0:>7.2f} "
+              f"{row['peak_mem_mb']:>8.1f}  {accuracy}")
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Max RSS proses: {max_rss_mb:.1f} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'max_rss_mb': round(max_rss_mb, 1), 'stages': summaries}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
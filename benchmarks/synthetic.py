@@ -0,0 +1,192 @@
+"""
+Generator struk sintetis dengan ground truth, untuk benchmark tanpa data asli.
+
+Teks struk dirender dengan PIL (font monospace), lalu diberi variasi resolusi, kemiringan,
+blur dan noise. Semua acak lewat seed sehingga hasilnya bisa direproduksi.
+
+Contoh:
+    python benchmarks/synthetic.py --count 10 --seed 0 --out /tmp/struk-sintetis
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# --- Konfigurasi Generator ---
+RECEIPT_WIDTH_CHARS = 32
+RECEIPT_FONT_SIZE = 20
+RECEIPT_MARGIN = 24
+RECEIPT_LINE_SPACING = 6
+# Variasi degradasi gambar
+SCALE_CHOICES = (0.6, 1.0, 1.5, 2.0)
+MAX_SKEW_DEGREES = 4.0
+MAX_NOISE_SIGMA = 12.0
+FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf',
+    '/usr/share/fonts/truetype/DejaVuSansMono.ttf',
+    'DejaVuSansMono.ttf',
+    'cour.ttf',
+)
+# ----------------------------------------
+
+# Nama fiktif (mis. TOKO SUMBER REJEKI) sengaja tidak ada di merchants.txt: akurasi merchant di
+# pipeline_bench harus mengukur fallback heuristik juga, bukan hanya leksikon
+MERCHANTS = [
+    ('INDOMARET', 'Jl. Merdeka No. 12, Bandung'),
+    ('ALFAMART', 'Jl. Sudirman No. 88, Jakarta'),
+    ('UMMI MART', 'Jl. Cikole No. 5, Sukabumi'),
+    ('YOMART RAMBAY', 'Jl. Rambay No. 21, Bogor'),
+    ('Pisang Juara', 'Jl. Braga No. 7, Bandung'),
+    ('TOKO SUMBER REJEKI', 'Jl. Pasar Baru No. 3, Garut'),
+]
+ITEM_NAMES = [
+    'Indomie Goreng', 'Aqua 600ml', 'Teh Botol Sosro', 'Roti Tawar', 'Susu UHT Coklat',
+    'Gula Pasir 1kg', 'Minyak Goreng 2L', 'Kopi Kapal Api', 'Sabun Lifebuoy', 'Pasta Gigi',
+    'Beras 5kg', 'Telur Ayam', 'Kecap Manis', 'Sarden ABC', 'Biskuit Roma',
+]
+TAX_RATE = 0.11
+
+
+def format_rupiah(amount):
+    """12500 -> '12.500' (titik sebagai pemisah ribuan)."""
+    return f"{amount:,}".replace(',', '.')
+
+
+def _row(left, right, width=RECEIPT_WIDTH_CHARS):
+    return f"{left}{right:>{width - len(left)}}"
+
+
+def make_receipt_text(rng):
+    """Susun teks struk acak. Mengembalikan (lines, truth)."""
+    merchant, address = rng.choice(MERCHANTS)
+    receipt_date = date.today().replace(month=1, day=1) - timedelta(days=rng.randint(0, 700))
+    items = []
+    for name in rng.sample(ITEM_NAMES, rng.randint(2, 7)):
+        qty = rng.randint(1, 3)
+        price = rng.randint(2, 100) * 500
+        items.append({'name': name, 'qty': qty, 'price': price * qty})
+    subtotal = sum(item['price'] for item in items)
+    tax = int(round(subtotal * TAX_RATE))
+    total = subtotal + tax
+    cash = -(-total // 50000) * 50000
+
+    separator = '-' * RECEIPT_WIDTH_CHARS
+    lines = [
+        merchant.center(RECEIPT_WIDTH_CHARS).rstrip(),
+        address[:RECEIPT_WIDTH_CHARS],
+        f"Tanggal: {receipt_date.strftime('%d/%m/%Y')} {rng.randint(7, 21):02d}:{rng.randint(0, 59):02d}",
+        separator,
+    ]
+    for item in items:
+        lines.append(_row(f"{item['name'][:18]} {item['qty']}", format_rupiah(item['price'])))
+    lines += [
+        separator,
+        _row('SUBTOTAL', format_rupiah(subtotal)),
+        _row('PPN 11%', format_rupiah(tax)),
+        _row('TOTAL', format_rupiah(total)),
+        _row('TUNAI', format_rupiah(cash)),
+        _row('KEMBALI', format_rupiah(cash - total)),
+        'Terima kasih'.center(RECEIPT_WIDTH_CHARS).rstrip(),
+    ]
+    truth = {
+        'merchant_name': merchant,
+        'date': receipt_date.isoformat(),
+        'total': total,
+        'subtotal': subtotal,
+        'tax': tax,
+        'items': [{'name': item['name'], 'price': item['price']} for item in items],
+    }
+    return lines, truth
+
+
+def _load_font(size):
+    for path in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def render_lines(lines, font_size=RECEIPT_FONT_SIZE):
+    """Render baris teks hitam di atas kertas putih, kembalikan array BGR."""
+    font = _load_font(font_size)
+    line_height = font_size + RECEIPT_LINE_SPACING
+    char_width = int(np.ceil(font.getlength('M')))
+    width = char_width * RECEIPT_WIDTH_CHARS + 2 * RECEIPT_MARGIN
+    height = line_height * len(lines) + 2 * RECEIPT_MARGIN
+    canvas = Image.new('L', (width, height), color=255)
+    draw = ImageDraw.Draw(canvas)
+    for i, line in enumerate(lines):
+        draw.text((RECEIPT_MARGIN, RECEIPT_MARGIN + i * line_height), line, fill=0, font=font)
+    return cv2.cvtColor(np.array(canvas), cv2.COLOR_GRAY2BGR)
+
+
+def degrade(img, rng, scale, skew, noise_sigma, blur):
+    """Terapkan resolusi, kemiringan, blur dan noise Gaussian (seperti foto/scan struk)."""
+    if scale != 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale,
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    if skew:
+        h, w = img.shape[:2]
+        matrix = cv2.getRotationMatrix2D((w // 2, h // 2), skew, 1.0)
+        img = cv2.warpAffine(img, matrix, (w, h), flags=cv2.INTER_CUBIC,
+                             borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+    if blur:
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+    if noise_sigma:
+        noise_rng = np.random.default_rng(rng.randint(0, 2 ** 32 - 1))
+        noise = noise_rng.normal(0, noise_sigma, img.shape)
+        img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    return img
+
+
+def generate_receipt(seed):
+    """
+    Buat satu struk sintetis dari seed.
+    Mengembalikan dict: image (BGR), text (teks bersih), truth (field yang diharapkan), params.
+    """
+    rng = random.Random(seed)
+    lines, truth = make_receipt_text(rng)
+    params = {
+        'seed': seed,
+        'scale': rng.choice(SCALE_CHOICES),
+        'skew': round(rng.uniform(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES), 2),
+        'noise_sigma': round(rng.uniform(0, MAX_NOISE_SIGMA), 2),
+        'blur': rng.random() < 0.3,
+    }
+    image = degrade(render_lines(lines), rng, params['scale'], params['skew'], params['noise_sigma'],
+                    params['blur'])
+    return {'image': image, 'text': '\n'.join(lines), 'truth': truth, 'params': params}
+
+
+def generate_receipts(count, seed=0):
+    for i in range(count):
+        yield generate_receipt(seed * 100003 + i)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--count', type=int, default=10)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--out', required=True, help='Direktori output (PNG + truth.jsonl)')
+    args = arg_parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, 'truth.jsonl'), 'w', encoding='utf-8') as f:
+        for i, receipt in enumerate(generate_receipts(args.count, args.seed)):
+            path = os.path.join(args.out, f"receipt_{i:04d}.png")
+            cv2.imwrite(path, receipt['image'])
+            f.write(json.dumps({'path': path, 'truth': receipt['truth'], 'params': receipt['params']}) + '\n')
+    print(f"{args.count} struk ditulis ke {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from dedup import get_default_dedup_index, perceptual_hash
+from extraction import get_extractor_version, get_pipeline_config, process_receipt_image
+from ocr_store import get_default_ocr_store
+
+# --- Konfigurasi Cache ---
+# Jumlah hasil yang disimpan di memori (LRU)
+CACHE_MAX_ENTRIES = 256
+# Path SQLite untuk tier disk (opsional). Jika None, hanya cache memori yang dipakai.
+CACHE_DB_PATH = os.environ.get('OCR_CACHE_DB')
+# Field yang dibandingkan dengan hasil near-duplicate; semuanya sama -> duplicate_of['fields_match']
+DEDUP_COMPARED_FIELDS = ('date', 'total', 'subtotal', 'tax')
+# ----------------------------------------
+
+
+def make_cache_key(image_bytes, config):
+    """
+    Cache key = sha256(bytes gambar) + sha256(config pipeline dalam JSON terurut).
+    Jika parameter preprocessing/OCR berubah, key otomatis berubah juga.
+    """
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    config_hash = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return f"{image_hash}:{config_hash}"
+
+
+class _SqliteTier:
+    """Tier disk berbasis SQLite supaya hasil tetap ada setelah restart."""
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)",
+                (key, payload, time.time()),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+
+class ReceiptResultCache:
+    """
+    Cache hasil process_receipt_image berdasarkan isi gambar + config pipeline.
+    - Tier 1: LRU di memori dengan batas jumlah entri.
+    - Tier 2 (opsional): SQLite di disk, hasilnya dinaikkan lagi ke memori saat hit.
+    Hasil error tidak disimpan.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, db_path=CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk = _SqliteTier(db_path) if db_path else None
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _put_memory(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return copy.deepcopy(value)
+
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                with self._lock:
+                    self._counters['disk_hits'] += 1
+                self._put_memory(key, value)
+                return copy.deepcopy(value)
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        if not value or 'error' in value:
+            return
+        value = copy.deepcopy(value)
+        self._put_memory(key, value)
+        if self._disk is not None:
+            self._disk.set(key, value)
+
+    def get_or_compute(self, key, compute_fn):
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        result = compute_fn()
+        self.set(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._memory)
+        stats['max_entries'] = self.max_entries
+        stats['disk_enabled'] = self._disk is not None
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Cache bersama per proses (dibuat saat pertama kali dipakai)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ReceiptResultCache()
+        return _default_cache
+
+
+def _image_bytes(image):
+    """Bytes yang di-hash untuk cache key, dari path, bytes, file-like atau NumPy array."""
+    if isinstance(image, np.ndarray):
+        return np.ascontiguousarray(image).tobytes() + repr((image.shape, str(image.dtype))).encode('utf-8')
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if hasattr(image, 'read'):
+        return image.read()
+    with open(image, 'rb') as f:
+        return f.read()
+
+
+def _store_ocr(ocr_store, key, result):
+    if ocr_store is not None:
+        ocr_store.save(key.split(':', 1)[0], result, get_extractor_version())
+
+
+def _compared_fields(result):
+    return tuple(result.get(field) for field in DEDUP_COMPARED_FIELDS)
+
+
+def _mark_duplicate(result, match):
+    """
+    Tandai hasil baru sebagai mirip hasil sebelumnya (match = (distance, (scope, key, fields))).
+    Hasil lama tidak pernah menggantikan hasil baru: field kuncinya (disimpan di index, jadi tetap
+    ada walau hasil lama sudah keluar dari cache) hanya dibandingkan.
+    """
+    distance, (_, original_key, original_fields) = match
+    fields_match = _compared_fields(result) == original_fields
+    result['duplicate_of'] = {'key': original_key, 'distance': distance, 'fields_match': fields_match}
+
+
+def cached_process_receipt_image(image, cache=None, dedup_index=None, ocr_store=None, dedup_scope=None,
+                                 **ocr_kwargs):
+    """
+    Versi process_receipt_image dengan cache di depannya.
+    image bisa berupa path, bytes, file-like atau NumPy array.
+    ocr_kwargs diteruskan ke process_receipt_image dan ikut menentukan cache key.
+    Jika dedup_scope diberikan (id pemanggil/tenant) dan index near-duplicate aktif (dedup.py,
+    opt-in), gambar hasil preprocessing dicek ke index hanya terhadap struk dari scope yang sama.
+    Struk yang mirip tetap di-OCR dan diekstraksi; hasilnya diberi penanda
+    result['duplicate_of'] = {'key', 'distance', 'fields_match'}.
+    Hasil OCR baru juga disimpan ke ocr_store (default OCR_STORE_DB, lihat ocr_store.py) jika aktif.
+    """
+    cache = cache or get_default_cache()
+    dedup_index = dedup_index or get_default_dedup_index()
+    ocr_store = ocr_store or get_default_ocr_store()
+    image_bytes = _image_bytes(image)
+    # File-like sudah terbaca habis; pipeline memakai bytes yang sama (tanpa baca ulang dari disk)
+    source = image if isinstance(image, np.ndarray) else image_bytes
+
+    config_kwargs = {k: ocr_kwargs.get(k) for k in ('psm_modes', 'psm_strategy', 'confidence_target',
+                                                     'denoise_method', 'stream')}
+    key = make_cache_key(image_bytes, get_pipeline_config(**config_kwargs))
+    start = time.perf_counter()
+    cached = cache.get(key)
+    if cached is not None:
+        # Trace tersimpan milik request lain; ganti dengan trace cache hit ini
+        cached['trace'] = {'total_ms': round((time.perf_counter() - start) * 1000, 3), 'stages': [],
+                           'cache_hit': True}
+        return cached
+    if dedup_index is None or dedup_scope is None:
+        result = process_receipt_image(source, **ocr_kwargs)
+        cache.set(key, result)
+        _store_ocr(ocr_store, key, result)
+        return result
+
+    config_suffix = key.split(':', 1)[1]
+    lookup_state = {}
+
+    def find_duplicate(preprocessed_img):
+        image_hash = lookup_state['hash'] = perceptual_hash(preprocessed_img)
+        # Hanya struk dari scope yang sama dengan config pipeline yang sama yang dibandingkan
+        lookup_state['match'] = dedup_index.find(
+            image_hash, predicate=lambda value: value[0] == dedup_scope and value[1].endswith(config_suffix))
+        # Selalu None: OCR dan ekstraksi tetap berjalan untuk gambar ini
+        return None
+
+    result = process_receipt_image(source, duplicate_lookup=find_duplicate, **ocr_kwargs)
+    # Disimpan tanpa penanda: duplicate_of hanya berlaku untuk scope pemanggil ini
+    cache.set(key, result)
+    _store_ocr(ocr_store, key, result)
+    if 'hash' not in lookup_state or 'error' in result:
+        return result
+    if lookup_state['match'] is None:
+        dedup_index.add(lookup_state['hash'], (dedup_scope, key, _compared_fields(result)))
+    else:
+        _mark_duplicate(result, lookup_state['match'])
+    return result
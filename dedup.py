@@ -0,0 +1,162 @@
+"""
+Deteksi near-duplicate struk (difoto ulang / diunggah ulang) dengan perceptual hash.
+
+Bytes foto ulang selalu berbeda, jadi cache sha256 di cache.py tidak akan hit. Di sini hash
+dihitung dari gambar biner hasil preprocess_pipeline (sudah grayscale, ter-threshold dan
+di-deskew, jadi pencahayaan dan kemiringan sudah dinormalisasi), lalu dicari di BK-tree
+berdasarkan jarak Hamming. Hash tidak cukup untuk memastikan struknya sama (struk lain dengan
+tanggal/total berbeda bisa lebih dekat dari foto ulang), jadi kecocokan hanya dipakai sebagai
+penanda; ekstraksi tetap dijalankan dan field kuncinya dibandingkan (lihat cache.py).
+"""
+import os
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+# --- Konfigurasi Near-Duplicate ---
+# Opt-in (OCR_DEDUP=1). Index hanya menandai kemiripan; hasil ekstraksi selalu dari OCR gambar itu sendiri.
+DEDUP_ENABLED = os.environ.get('OCR_DEDUP', '0') == '1'
+# pHash: koefisien DCT frekuensi rendah DEDUP_HASH_SIZE x DEDUP_HASH_SIZE -> hash 256 bit
+DEDUP_HASH_SIZE = 16
+# Jarak Hamming maksimum agar dianggap mirip. Jarak ini TIDAK membedakan foto ulang dari struk lain:
+# struk berbeda dengan isi belanja sama hanya berbeda tanggal/total bisa berjarak 2-4 bit, lebih dekat
+# dari foto ulang struk yang sama (~6). Karena itu hasil near-duplicate tidak pernah dipakai ulang.
+DEDUP_MAX_DISTANCE = 24
+# Jumlah hash yang disimpan; jika penuh, separuh entri tertua dibuang
+DEDUP_MAX_ENTRIES = 10000
+# ----------------------------------------
+
+
+def _crop_to_content(binary):
+    """Potong ke area teks (foreground > 0) supaya framing foto yang berbeda tidak memengaruhi hash."""
+    ys, xs = np.nonzero(binary)
+    if ys.size == 0:
+        return binary
+    top, bottom = np.percentile(ys, [0.5, 99.5]).astype(int)
+    left, right = np.percentile(xs, [0.5, 99.5]).astype(int)
+    return binary[top:bottom + 1, left:right + 1]
+
+
+def perceptual_hash(binary, hash_size=None):
+    """pHash (DCT) dari gambar biner/grayscale, dikembalikan sebagai int hash_size^2 bit."""
+    hash_size = hash_size or DEDUP_HASH_SIZE
+    small = cv2.resize(_crop_to_content(binary), (hash_size * 4, hash_size * 4),
+                       interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(small)[:hash_size, :hash_size].flatten()
+    bits = low_freq > np.median(low_freq[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """BK-tree untuk pencarian hash dalam jarak Hamming tertentu (tanpa membandingkan semua entri)."""
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key, value):
+        node = [key, value, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, max_distance):
+        """Semua (distance, key, value) dengan distance <= max_distance, terurut dari yang terdekat."""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = hamming_distance(key, node_key)
+            if distance <= max_distance:
+                matches.append((distance, node_key, value))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class NearDuplicateIndex:
+    """
+    Index hash -> value (misal (scope pemanggil, cache key, field kunci) hasil ekstraksi) di memori, thread-safe.
+    BK-tree tidak mendukung hapus, jadi saat penuh tree dibangun ulang dari separuh entri terbaru.
+    """
+
+    def __init__(self, max_entries=DEDUP_MAX_ENTRIES, max_distance=DEDUP_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._entries = deque()
+        self._tree = BKTree()
+        self._counters = {'lookups': 0, 'duplicates': 0, 'rebuilds': 0}
+
+    def add(self, image_hash, value):
+        with self._lock:
+            self._entries.append((image_hash, value))
+            if len(self._entries) > self.max_entries:
+                for _ in range(len(self._entries) - self.max_entries // 2):
+                    self._entries.popleft()
+                self._tree = BKTree()
+                for entry_hash, entry_value in self._entries:
+                    self._tree.add(entry_hash, entry_value)
+                self._counters['rebuilds'] += 1
+            else:
+                self._tree.add(image_hash, value)
+
+    def find(self, image_hash, predicate=None):
+        """(distance, value) terdekat dalam max_distance yang lolos predicate(value), atau None."""
+        with self._lock:
+            self._counters['lookups'] += 1
+            for distance, _, value in self._tree.search(image_hash, self.max_distance):
+                if predicate is None or predicate(value):
+                    self._counters['duplicates'] += 1
+                    return distance, value
+        return None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._tree)
+        stats['max_entries'] = self.max_entries
+        stats['max_distance'] = self.max_distance
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tree = BKTree()
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_dedup_index():
+    """Index near-duplicate bersama per proses, atau None jika DEDUP_ENABLED = False."""
+    global _default_index
+    if not DEDUP_ENABLED:
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = NearDuplicateIndex()
+        return _default_index
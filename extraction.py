@@ -1,10 +1,24 @@
+import io
+import logging
+import os
 import platform
 import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import cv2
 import numpy as np
 import pytesseract
+from PIL import Image
 from dateutil import parser
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
+
+from merchants import MERCHANT_HEADER_LINES, get_default_lexicon
+from metrics import start_trace, submit_in_context, timed, timed_stage
+
+logger = logging.getLogger(__name__)
 
 # --- Konfigurasi PyTesseract (PENTING!) ---
 if platform.system() == "Windows":
@@ -14,8 +28,250 @@ else: # Asumsi Linux di Streamlit Cloud
     # Jika '/usr/bin/tesseract' tidak berfungsi di Cloud, coba komentari baris di atas ini
     # untuk membiarkan pytesseract menemukannya di PATH default sistem Cloud
     # atau coba '/usr/local/bin/tesseract'
+
+# Mode PSM yang dicoba untuk setiap gambar (urutan ini juga dipakai sebagai tie-breaker)
+PSM_MODES = [6, 3, 4, 11, 12]
+OCR_LANG = 'eng+ind'
+# Jumlah worker paralel untuk sweep PSM. Thread sudah cukup: pytesseract menunggu subprocess
+# dan tesserocr melepas GIL selama Recognize. Thread ini persisten (pool OCR bersama, lihat
+# get_ocr_executor) supaya engine tesserocr per thread tidak dimuat ulang tiap request.
+OCR_MAX_WORKERS = min(len(PSM_MODES), os.cpu_count() or 1)
+# Strategi pemilihan PSM: 'adaptive' (berhenti begitu confidence >= target), 'sweep' (selalu semua mode)
+# atau 'roi' (deteksi pita teks header/item/total lalu OCR tiap crop sekali, lihat run_roi_ocr)
+OCR_PSM_STRATEGY = 'adaptive'
+OCR_CONFIDENCE_TARGET = 85.0
+# Backend OCR: 'pytesseract' (subprocess per panggilan), 'tesserocr' (engine persisten,
+# model dimuat sekali per thread) atau 'auto' (tesserocr jika terpasang)
+OCR_BACKEND = 'auto'
+
+# Parameter preprocessing (nilai yang menghasilkan teks "P1sang Juara")
+PREPROCESS_TARGET_WIDTH = 1000
+# Kebijakan resize: 'text_height' (skala dari estimasi tinggi karakter, lihat estimate_text_height)
+# atau 'width' (lebar tetap PREPROCESS_TARGET_WIDTH seperti sebelumnya)
+PREPROCESS_RESIZE_POLICY = 'text_height'
+# Tinggi karakter target (piksel) setelah resize; 32 px kira-kira setara struk 32 kolom di lebar 1000
+PREPROCESS_TARGET_TEXT_HEIGHT = 32
+PREPROCESS_MIN_WIDTH = 600
+PREPROCESS_MAX_WIDTH = 2000
+# Resize dilewati jika skala hanya berbeda sedikit dari 1 (hemat satu resample penuh)
+PREPROCESS_RESIZE_TOLERANCE = 0.15
+# Decode JPEG dengan resolusi dikurangi (IMREAD_REDUCED_GRAYSCALE_2/4/8) selama lebar hasil
+# decode tetap >= nilai ini
+PREPROCESS_DECODE_MIN_WIDTH = 1500
+DENOISE_H = 15
+# Metode denoise: 'nlm', 'nlm_tiled', 'bilateral', 'median', 'gated' atau 'none' (lihat DENOISERS)
+DENOISE_METHOD = 'nlm'
+# Mode 'gated': lewati denoise jika estimasi sigma noise di bawah nilai ini (gambar sudah bersih)
+DENOISE_NOISE_THRESHOLD = 3.0
+# Mode 'nlm_tiled': tinggi strip per thread dan ukuran minimum gambar agar tiling dipakai.
+# Strip diproses di pool denoise bersama (OCR_MAX_WORKERS thread); dengan 1 worker sama dengan 'nlm'
+DENOISE_TILE_HEIGHT = 256
+DENOISE_TILE_MIN_PIXELS = 1_000_000
+THRESH_BLOCK_SIZE = 21
+THRESH_C = 10
+# Binarisasi multi-varian (lihat BINARIZERS): varian dibuat dari gray hasil denoise yang sama.
+# Urutan = prioritas; varian pertama adalah default yang sudah di-tuning. Akhiran '_inv' = teks
+# terang di latar gelap. Set ke ('adaptive',) untuk mematikan pemilihan varian.
+BINARIZE_VARIANTS = ('adaptive', 'adaptive_large', 'otsu', 'sauvola', 'adaptive_inv', 'otsu_inv')
+# Skor proxy (binarization_proxy_score, 0..1) minimum agar varian dianggap bersih tanpa OCR
+BINARIZE_PROXY_CONFIDENT = 0.3
+# Varian default tetap dipakai selama skornya >= rasio ini dari skor terbaik
+BINARIZE_PROXY_TOLERANCE = 0.9
+# Jika proxy ragu (skor terbaik < BINARIZE_PROXY_CONFIDENT), sejumlah varian teratas ini di-OCR
+# sekali (satu PSM) dan dipilih berdasarkan confidence
+BINARIZE_OCR_CANDIDATES = 2
+# Foreground di atas porsi ini bukan teks (biasanya polaritas terbalik)
+BINARIZE_MAX_FOREGROUND = 0.35
+THRESH_LARGE_BLOCK_SIZE = 41
+SAUVOLA_WINDOW = 31
+SAUVOLA_K = 0.2
+# Deskew: estimasi sudut pada gambar yang diperkecil (sisi terpanjang <= nilai ini),
+# dan rotasi dilewati jika |sudut| di bawah toleransi (derajat)
+DESKEW_MAX_DIM = 600
+DESKEW_ANGLE_TOLERANCE = 0.5
+# Mode streaming struk panjang: gambar dengan tinggi/lebar >= rasio ini dipotong menjadi strip
+# horizontal (tinggi & overlap dalam piksel setelah resize) yang diproses bergantian;
+# STREAM_MAX_WORKERS > 1 memproses beberapa strip paralel (memori tetap dibatasi jumlah itu)
+STREAM_MIN_ASPECT_RATIO = 4.0
+STREAM_STRIP_HEIGHT = 1500
+STREAM_STRIP_OVERLAP = 150
+STREAM_MAX_WORKERS = 1
+# Strip disimpan sebagai PNG grayscale (kompresi cepat) selama diproses, bukan gambar utuh
+STREAM_STRIP_PNG_COMPRESSION = 1
+# Region-of-interest OCR: porsi tinggi area teks untuk pita header (atas) dan total (bawah),
+# padding crop (piksel), serta rentang tinggi komponen yang dianggap karakter
+ROI_HEADER_FRACTION = 0.25
+ROI_TOTALS_FRACTION = 0.3
+ROI_PADDING = 10
+ROI_MIN_CHAR_HEIGHT = 5
+ROI_MAX_CHAR_HEIGHT_FRACTION = 0.1
+# Tanggal numerik ambigu (kedua angka <= 12) dibaca DD/MM (format Indonesia); jika salah satu > 12
+# urutannya sudah pasti. Token tanggal yang sudah di-parse disimpan di LRU sebesar DATE_CACHE_SIZE.
+DATE_DAY_FIRST = True
+DATE_CACHE_SIZE = 4096
+# Tahun tanggal yang diterima: tahun sekarang - DATE_MAX_YEARS_BACK s.d. + DATE_MAX_YEARS_AHEAD
+DATE_MAX_YEARS_BACK = 10
+DATE_MAX_YEARS_AHEAD = 2
+# Versi aturan extract_*: naikkan setiap kali aturan ekstraksi berubah supaya hasil lama di cache
+# (ikut cache key) tidak dipakai lagi dan hasil di ocr_store diproses ulang oleh reextract.py
+EXTRACTOR_VERSION = 2
 # ----------------------------------------
 
+# --- 0. Registry Regex (dikompilasi sekali saat modul diimport) ---
+# Semua pola yang dipakai fungsi normalisasi/ekstraksi dikompilasi di sini, jadi tidak
+# bergantung pada cache regex internal Python yang kecil dan dipakai bersama seluruh proses.
+# Angka harga hanya boleh dipisah spasi/tab, tidak melintasi baris (teks OCR sekarang multi-baris)
+_PRICE_TOKEN = r'([RrPp\$]?[ \t]*[0-9.,\t ]+)'
+_LINE_PRICE = r'[RrPp\$]?\s*([0-9]{1,3}(?:[.,\s][0-9]{3})*(?:[.,\s][0-9]{1,2})?|[0-9]{3,}(?:[.,\s][0-9]{1,2})?)$'
+_LINE_AMOUNT = r'[RrPp\$]?\s*([0-9]{2,}(?:[.,\s][0-9]{3})*(?:[.,\s][0-9]{1,2})?)$'
+
+
+def _keyword_regex(keywords):
+    """Satu regex alternasi untuk cek 'any(kw in text for kw in keywords)' dalam sekali scan."""
+    return re.compile('|'.join(re.escape(kw) for kw in sorted(set(keywords), key=len, reverse=True)))
+
+
+# normalize_price
+PRICE_STRIP_RE = re.compile(r'[^\d.,]')
+WHITESPACE_RE = re.compile(r'\s')
+COMMA_DECIMAL_RE = re.compile(r',\d{1,2}$')
+DOT_DECIMAL_RE = re.compile(r'\.\d{1,2}$')
+MULTI_SPACE_RE = re.compile(r'\s+')
+DIGITS_ONLY_RE = re.compile(r'^\d+$')
+EDGE_SYMBOLS_RE = re.compile(r'^[^\w\s]+|[^\w\s]+$')
+NAME_ALLOWED_CHARS_RE = re.compile(r'[^A-Za-z0-9\s&\'\.]')
+
+# normalize_merchant_name
+MERCHANT_TRAILING_DATE_RE = re.compile(r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{2}:\d{2})\b$')
+MERCHANT_STOPWORDS_RE = re.compile(
+    r'\b(npwp|kasir|struk|no\.?|invoice|id|pos|cashier|check|bill|kassa|rcpt#|rept#|title|pax|op|gunawan|lippo|mall|kemang|j|pr|emang|vi|no|ind|cin|ctw|i|ster|cr[eÊ]perie|pt|cv|litle|rept|rpt|alun|gunungparang|kec|cikole|kota|sukabumi|jawa|barat|indonesia|karyawan)\b',
+    re.IGNORECASE)
+
+# normalize_item_name
+ITEM_QTY_EDGE_RE = re.compile(r'^\s*\d+(\s*[xX]\s*)?|\s+[xX]\s*\d+\s*$')
+ITEM_LEADING_NUMBER_RE = re.compile(r'^(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{2,})\b')
+ITEM_TRAILING_NUMBER_RE = re.compile(r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{2,})$')
+
+# extract_date
+# Ejaan nama bulan Indonesia + Inggris (penuh dan singkatan) yang diterima. Harus ejaan persis
+# (bukan sekadar awalan) supaya kata biasa seperti 'Sepatu' atau 'Marjan' tidak dianggap bulan.
+DATE_MONTHS = {
+    'jan': 1, 'januari': 1, 'january': 1,
+    'feb': 2, 'peb': 2, 'februari': 2, 'pebruari': 2, 'february': 2,
+    'mar': 3, 'maret': 3, 'march': 3,
+    'apr': 4, 'april': 4,
+    'mei': 5, 'may': 5,
+    'jun': 6, 'juni': 6, 'june': 6,
+    'jul': 7, 'juli': 7, 'july': 7,
+    'agu': 8, 'ags': 8, 'agt': 8, 'agus': 8, 'agustus': 8, 'aug': 8, 'august': 8,
+    'sep': 9, 'sept': 9, 'september': 9,
+    'okt': 10, 'oktober': 10, 'oct': 10, 'october': 10,
+    'nov': 11, 'nop': 11, 'november': 11, 'nopember': 11,
+    'des': 12, 'desember': 12, 'dec': 12, 'december': 12,
+}
+_DATE_MONTH_NAME = r'(?<![a-z])(?:' + '|'.join(sorted(DATE_MONTHS, key=len, reverse=True)) + r')(?![a-z])\.?'
+# Tahun tidak boleh diikuti digit atau pemisah ribuan ('2 Mar 25.000' adalah harga, bukan tanggal)
+_DATE_YEAR_END = r'(?!\d|[.,]\d)'
+# Semua format tanggal dalam satu alternasi (satu kali scan). Nama grup pertama tiap alternatif
+# menentukan jenisnya; urutan prioritas saat beberapa tanggal ditemukan ada di DATE_KIND_PRIORITY.
+DATE_TOKEN_RE = re.compile(
+    r'(?P<iso>(?P<iso_y>\d{4})[-/.](?P<iso_m>\d{1,2})[-/.](?P<iso_d>\d{1,2}))(?!\d)'  # YYYY-MM-DD
+    r'|(?P<num>(?P<num_a>\d{1,2})[-/.](?P<num_b>\d{1,2})[-/.](?P<num_y>\d{4}|\d{2}(?!\d)))'  # DD/MM/YYYY, MM/DD/YY
+    r'(?P<num_time>\s+\d{2}:\d{2})?'
+    r'|(?P<dmy>(?<!\d)(?P<dmy_d>\d{1,2})[\s.-]*(?P<dmy_m>' + _DATE_MONTH_NAME + r')[\s.-]*(?P<dmy_y>\d{4}|\d{2})' + _DATE_YEAR_END + ')'
+    r'|(?P<mdy>(?P<mdy_m>' + _DATE_MONTH_NAME + r')\s+(?P<mdy_d>\d{1,2}),?\s+(?P<mdy_y>\d{4}|\d{2})' + _DATE_YEAR_END + ')',
+    re.IGNORECASE)
+# Jika ada beberapa tanggal di struk: tanggal+jam transaksi dulu, lalu ISO, numerik, nama bulan
+DATE_KIND_PRIORITY = {'num_time': 0, 'iso': 1, 'num': 2, 'dmy': 3, 'mdy': 4}
+DATE_KEYWORDS_RE = re.compile(r'(tanggal|date|tgl|tgl\.|waktu|time)', re.IGNORECASE)
+DATE_KEYWORD_VALUE_STRIP = ' \t:.-'
+
+# extract_merchant_name (nama brand dicocokkan lewat leksikon di merchants.py)
+MERCHANT_KEYWORDS_TO_AVOID = [
+    'struk', 'kasir', 'tanggal', 'jam', 'npwp', 'invoice', 'no.', 'id',
+    'transaksi', 'subtotal', 'ppn', 'pajak', 'terima kasih', 'selamat datang',
+    'alamat', 'telepon', 'phone', 'telp', 'email', 'fax', 'admin', 'cashier',
+    'check', 'bill', 'kassa', 'lippo', 'mall', 'kemang', 'pos', 'title',
+    'recept', 'rcpt', 'pt', 'cv', 'pax', 'op', 'gunawan'
+]
+MERCHANT_KEYWORDS_TO_AVOID_RE = _keyword_regex(MERCHANT_KEYWORDS_TO_AVOID)
+MERCHANT_PRICE_LIKE_RE = re.compile(r'\d{3,}[.,]\d{2,}')
+MERCHANT_DATE_LINE_RE = re.compile(r'^\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}$')
+BLANK_LINE_RE = re.compile(r'^\s*$')
+MERCHANT_ADDRESS_RE = re.compile(r'(jl\.|jalan|no\.|street|st\.|road|rd\.|kpm)')
+# Leksikon merchant: teks baris header mulai dari penanda alamat/kasir/dst (sebagai kata utuh,
+# supaya 'Kopi' tidak terpotong di 'op') tidak dicocokkan, jadi 'Jl. Lawson' bukan merchant Lawson
+MERCHANT_HEADER_STOP_RE = re.compile(
+    r'(?<![a-z0-9])(?:' + '|'.join(re.escape(keyword) for keyword in sorted(
+        set(MERCHANT_KEYWORDS_TO_AVOID) | {'jl.', 'jl', 'jalan', 'street', 'st.', 'road', 'rd.', 'kpm'},
+        key=len, reverse=True)) + r')(?![a-z0-9])', re.IGNORECASE)
+
+# extract_total
+TOTAL_PATTERNS = [re.compile(pattern) for pattern in (
+    r'(?:grand\s*total|total\s*bayar|total\s*amount|amount\s*due|jumlah\s*bayar|jml\s*bayar|total\s*jual|final\s*total)\s*[:\-\=\s]*' + _PRICE_TOKEN,
+    r'(?:total|jumlah|jml)\s*[:\-\=\s]*' + _PRICE_TOKEN,
+)]
+LINE_PRICE_RE = re.compile(_LINE_PRICE)
+
+# extract_subtotal
+SUBTOTAL_PATTERNS = [re.compile(pattern) for pattern in (
+    r'(?:sub[\s\-]?total|sub[\s\-]?amt|subtotalan)\s*[:\-\=\s]*' + _PRICE_TOKEN,
+    # Tambah 'total jual'
+    r'(?:nett?[\s\-]?sales?|before[\s\-]?tax|jumlah\s*sebelum\s*pajak|jml\s*blm\s*pjk|total\s*jual)\s*[:\-\=\s]*' + _PRICE_TOKEN,
+)]
+LINE_AMOUNT_RE = re.compile(_LINE_AMOUNT)
+
+# extract_tax
+TAX_PATTERNS = [re.compile(pattern) for pattern in (
+    r'(?:tax|vat|ppn|pajak|service[\s\-]?charge|gst|pph|levy|service)\s*[:\-\=\s]*' + _PRICE_TOKEN,
+    r'(\d{1,2}\s*%)?\s*(?:tax|vat|ppn|pajak)\s*[:\-\=\s]*' + _PRICE_TOKEN,
+)]
+
+# extract_items
+# Kata kunci yang menandakan batas atas/bawah dari daftar item
+ITEM_START_KEYWORDS = ['item', 'produk', 'barang', 'desc', 'description', 'nama barang', 'qty', 'harga', 'price',
+                       'quantity', 'menu']
+ITEM_END_KEYWORDS = ['subtotal', 'total', 'tax', 'ppn', 'pajak', 'grand total', 'jumlah', 'pembayaran', 'terima kasih',
+                     'kembalian', 'cash', 'diskon', 'charge', 'change', 'total jual', 'total item', 'total jenis',
+                     'closed bill', 'amount due']
+ITEM_START_RE = _keyword_regex(ITEM_START_KEYWORDS)
+ITEM_END_RE = _keyword_regex(ITEM_END_KEYWORDS)
+ITEM_NUMBERED_LINE_RE = re.compile(r'^\s*\d+\s*[a-z]')
+ITEM_NUMBERS_ONLY_RE = re.compile(r'^[\d\s.,Rp$]+$')
+ITEM_HEADER_LINE_RE = re.compile(r'^\s*(no|check|date|time|pax|op|rcpt#|rept#)')
+# Pola A: Nama Item dengan dash/spasi lalu harga (contoh: "Mix Coklat - Rp18.000")
+# Atau nama item yang mengandung "x" lalu harga (contoh: "Tiramisu Kear 1x Rp18.000")
+# Menggunakan [ -—–] untuk berbagai jenis dash/hyphen
+ITEM_PATTERN_A = re.compile(r'(.+?)\s*(?:[-—–]|\s*1?[xX])\s*([RrPp\$]?\s*[0-9.,\s]{1,})$', re.IGNORECASE)
+# Pola B: Kuantitas di awal, Nama, Harga di akhir
+# Contoh: "1 Woman 0 74,000", "2 Ham Cheese 16,000", "1x Rp18.000" (ini harga total item, bukan harga satuan)
+ITEM_PATTERN_B = re.compile(r'^\s*(\d+)(?:\s*[xX])?\s*(.+?)([RrPp\$]?\s*[0-9.,\s]{1,})$', re.IGNORECASE)
+# Pola C: Nama (opsional 'x Qty'), Harga di akhir (jika tidak ada qty di awal dan tidak ada dash)
+# Contoh: "Ice Java Tea 16,000", "MAHI MAHI FILLETS 8.99 B" (dari Whole Foods)
+ITEM_PATTERN_C = re.compile(r'(.+?)\s+(?:(?:x\s*(\d+))|\s*(\d+)\s+)?([RrPp\$]?\s*[0-9.,\s]{1,})$', re.IGNORECASE)
+ITEM_TRAILING_QTY_RE = re.compile(r'\s*\d+(?:\.\d+)?\s*$')
+ITEM_SMALL_PRICE_OK_RE = re.compile(r'(disc|off|diskon|change|kembali|tax|ppn|pajak|point)')
+
+# ReceiptText: semua keyword yang dipakai fallback per baris, di-scan sekali untuk seluruh teks.
+# Lookahead supaya keyword yang tumpang tindih tetap terdeteksi di setiap posisi.
+LINE_KEYWORDS_RE = re.compile(
+    r'(?=(total|jumlah|jml|tax|ppn|pajak|vat|service|gst|levy|tanggal|date|tgl|waktu|time))', re.IGNORECASE)
+LINE_KEYWORD_GROUPS = {
+    'total': {'total', 'jumlah', 'jml'},  # baris kandidat total
+    'subtotal_anchor': {'tax', 'ppn', 'pajak', 'total'},  # subtotal dicari di baris sebelumnya ('grand total' memuat 'total')
+    'tax': {'tax', 'ppn', 'pajak', 'vat', 'service', 'gst', 'levy'},  # baris kandidat pajak
+    'date': {'tanggal', 'date', 'tgl', 'waktu', 'time'},  # = DATE_KEYWORDS_RE
+}
+
+# extract_items_from_layout: kata yang berupa harga / kuantitas
+LAYOUT_PRICE_WORD_RE = re.compile(r'^[RrPp\$]*[0-9][0-9.,]*$')
+LAYOUT_QTY_WORD_RE = re.compile(r'^(\d{1,3})[xX]?$')
+
+# process_receipt_image (post-processing teks OCR, per baris)
+OCR_NOISE_CHARS_RE = re.compile(r'[^\w\s.,:/$\-Rp]')
+HORIZONTAL_SPACE_RE = re.compile(r'[ \t]+')
+
+
 # --- 1. Fungsi Normalisasi Dasar ---
 def normalize_price(price):
     """
@@ -30,21 +286,21 @@ def normalize_price(price):
 
     # Hapus semua karakter yang bukan digit, titik, atau koma.
     # Juga hapus spasi jika ada di tengah angka (misal "175, 000" -> "175,000")
-    price_str = re.sub(r'[^\d.,]', '', price_str)
-    price_str = re.sub(r'\s', '', price_str)
+    price_str = PRICE_STRIP_RE.sub('', price_str)
+    price_str = WHITESPACE_RE.sub('', price_str)
 
     # Menangani pemisah ribuan dan desimal (Asumsi: di Indo koma adalah desimal, titik adalah ribuan)
     # Ini adalah asumsi yang paling aman untuk format umum Indonesia
     if ',' in price_str:
         # Jika koma diikuti 1 atau 2 digit, asumsikan desimal (contoh: 123,45)
-        if re.search(r',\d{1,2}$', price_str):
+        if COMMA_DECIMAL_RE.search(price_str):
             price_str = price_str.replace('.', '')  # Hapus titik ribuan
             price_str = price_str.replace(',', '.')  # Ubah koma desimal ke titik
         else:
             # Jika koma tidak diikuti 1-2 digit, asumsikan pemisah ribuan (contoh: 1,000)
             price_str = price_str.replace(',', '')
     # Jika hanya ada titik, dan diikuti 1-2 digit, asumsikan desimal (contoh: 123.45)
-    elif '.' in price_str and re.search(r'\.\d{1,2}$', price_str):
+    elif '.' in price_str and DOT_DECIMAL_RE.search(price_str):
         pass  # Biarkan saja, sudah format float yang benar
     # Jika hanya ada titik, dan tidak diikuti 1-2 digit, asumsikan pemisah ribuan (contoh: 1.000)
     elif '.' in price_str:
@@ -73,22 +329,16 @@ def normalize_merchant_name(name: str) -> str | None:
         return None
     name = name.strip()
     # Buang tanggal/angka/waktu di akhir nama (biasa hasil OCR dari struk)
-    name = re.sub(r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{2}:\d{2})\b$', '', name).strip()
+    name = MERCHANT_TRAILING_DATE_RE.sub('', name).strip()
     # Tambahkan lebih banyak keyword yang sering muncul di header struk tapi bukan nama merchant.
-    name = re.sub(
-        r'\b(npwp|kasir|struk|no\.?|invoice|id|pos|cashier|check|bill|kassa|rcpt#|rept#|title|pax|op|gunawan|lippo|mall|kemang|j|pr|emang|vi|no|ind|cin|ctw|i|ster|cr[eÊ]perie|pt|cv|litle|rept|rpt|alun|gunungparang|kec|cikole|kota|sukabumi|jawa|barat|indonesia|karyawan)\b',
-        '', name, flags=re.IGNORECASE).strip()
+    name = MERCHANT_STOPWORDS_RE.sub('', name).strip()
 
     # Hapus simbol di awal/akhir dan karakter yang tidak umum dalam nama merchant
-    name = re.sub(r'^[^\w\s]+|[^\w\s]+$', '', name).strip()
-    name = re.sub(r'[^A-Za-z0-9\s&\'\.]', '', name).strip()  # Hanya izinkan huruf, angka, spasi, &, ', .
-    name = re.sub(r'\s+', ' ', name)  # Hapus spasi berlebih
+    name = EDGE_SYMBOLS_RE.sub('', name).strip()
+    name = NAME_ALLOWED_CHARS_RE.sub('', name).strip()  # Hanya izinkan huruf, angka, spasi, &, ', .
+    name = MULTI_SPACE_RE.sub(' ', name)  # Hapus spasi berlebih
     name = name.title()
-
-    # Perbaiki specific OCR errors dari 'MOMI & TOY\'S' jika masih muncul
-    name = name.replace("O Mall", "").replace("Momi Antoys", "Momi & Toy's").replace("O Momi Antoys",
-                                                                                     "Momi & Toy's").strip()
-    name = re.sub(r'cr[eÊ]perie', 'Crêperie', name, flags=re.IGNORECASE)
+    # Ejaan/alias nama brand (mis. salah baca 'Momi Antoys') ditangani leksikon merchant (merchants.txt)
 
     # Final cleanup jika hanya tersisa kata-kata generik setelah normalisasi
     if name.lower() in ['mall', 'kemang', 'lippo', 'o', 'pr', 'j', 'vi', 'no', 'l', 'alun', 'gunungparang', 'kec',
@@ -97,7 +347,7 @@ def normalize_merchant_name(name: str) -> str | None:
         return None
 
     # Filter nama yang terlalu pendek atau hanya angka
-    if len(name) < 3 or re.match(r'^\d+$', name):
+    if len(name) < 3 or DIGITS_ONLY_RE.match(name):
         return None
     return name.strip()
 
@@ -113,14 +363,14 @@ def normalize_item_name(name: str) -> str | None:
         return None
     name = name.strip()
     # Buang angka (kuantitas, dll) di awal atau akhir yang bisa salah terdeteksi
-    name = re.sub(r'^\s*\d+(\s*[xX]\s*)?|\s+[xX]\s*\d+\s*$', '', name).strip()
+    name = ITEM_QTY_EDGE_RE.sub('', name).strip()
     # Buang tanggal/angka yang tidak relevan di awal/akhir
-    name = re.sub(r'^(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{2,})\b', '', name).strip()
-    name = re.sub(r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{2,})$', '', name).strip()
+    name = ITEM_LEADING_NUMBER_RE.sub('', name).strip()
+    name = ITEM_TRAILING_NUMBER_RE.sub('', name).strip()
     # Hapus simbol aneh di depan/belakang
-    name = re.sub(r'^[^\w\s]+|[^\w\s]+$', '', name).strip()
+    name = EDGE_SYMBOLS_RE.sub('', name).strip()
     # Hapus spasi berlebih
-    name = re.sub(r'\s+', ' ', name)
+    name = MULTI_SPACE_RE.sub(' ', name)
     # Kapitalisasi awal tiap kata
     name = name.title()
     if len(name) < 2:  # Item name should be at least 2 chars
@@ -129,105 +379,201 @@ def normalize_item_name(name: str) -> str | None:
 
 
 # --- 2. Fungsi Ekstraksi Entitas Individual ---
+class ReceiptText:
+    """
+    Representasi teks struk yang sudah di-tokenisasi sekali dan dipakai bersama oleh
+    semua extract_*:
+    - lower: teks lowercase
+    - raw_lines: text.split('\\n'); lines/lines_lower: text.strip().split('\\n')
+    - keyword_lines(group): indeks baris (raw_lines) yang memuat keyword grup tertentu,
+      dari satu scan LINE_KEYWORDS_RE atas seluruh teks
+    - price()/line_amount(): normalisasi harga yang di-memo per token/baris
+    - merchant_match(): hasil pencocokan baris header ke leksikon merchant (di-memo)
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.lower = text.lower()
+        self.raw_lines = text.split('\n')
+        self.lines = text.strip().split('\n')
+        self.lines_lower = [line.lower() for line in self.lines]
+        # Jumlah baris kosong di awal yang hilang karena strip(): indeks lines = indeks raw_lines - offset
+        self.strip_line_offset = text[:len(text) - len(text.lstrip())].count('\n')
+        self._keyword_lines = None
+        self._prices = {}
+        self._line_amounts = {}
+        self._merchant_match = False
+
+    def _scan_keywords(self):
+        hits = {group: [] for group in LINE_KEYWORD_GROUPS}
+        line_index = 0
+        line_end = self.text.find('\n')
+        for match in LINE_KEYWORDS_RE.finditer(self.text):
+            while line_end != -1 and match.start() > line_end:
+                line_index += 1
+                line_end = self.text.find('\n', line_end + 1)
+            keyword = match.group(1).lower()
+            for group, keywords in LINE_KEYWORD_GROUPS.items():
+                if keyword in keywords and (not hits[group] or hits[group][-1] != line_index):
+                    hits[group].append(line_index)
+        self._keyword_lines = hits
+
+    def keyword_lines(self, group, stripped=False):
+        """Indeks baris (urut naik) yang memuat keyword dari LINE_KEYWORD_GROUPS[group]."""
+        if self._keyword_lines is None:
+            self._scan_keywords()
+        indices = self._keyword_lines[group]
+        if stripped:
+            return [i - self.strip_line_offset for i in indices]
+        return indices
+
+    def price(self, token):
+        """normalize_price(token) dengan memo per token."""
+        if token not in self._prices:
+            self._prices[token] = normalize_price(token)
+        return self._prices[token]
+
+    def line_amount(self, index):
+        """Harga di ujung raw_lines[index] (LINE_AMOUNT_RE), dinormalisasi; None jika tidak ada."""
+        if index not in self._line_amounts:
+            number_match = LINE_AMOUNT_RE.search(self.raw_lines[index])
+            self._line_amounts[index] = self.price(number_match.group(1)) if number_match else None
+        return self._line_amounts[index]
+
+    def merchant_match(self):
+        """{'name', 'score', 'text', 'line'} dari leksikon merchant untuk baris header, atau None."""
+        if self._merchant_match is False:
+            header = [MERCHANT_HEADER_STOP_RE.split(line, maxsplit=1)[0] for line in self.lines[:MERCHANT_HEADER_LINES]]
+            self._merchant_match = get_default_lexicon().match(header)
+        return self._merchant_match
+
+
+def as_receipt(text):
+    """Terima str atau ReceiptText; str ditokenisasi di sini."""
+    return text if isinstance(text, ReceiptText) else ReceiptText(text)
+
+
+def _day_month(first, second, day_first=True):
+    """
+    Urutan (hari, bulan) dari dua angka tanggal numerik. Jika salah satu > 12 urutannya pasti;
+    jika keduanya <= 12 dipakai day_first. None jika keduanya tidak mungkin bulan.
+    """
+    if first > 12 and second > 12:
+        return None
+    if first > 12:
+        return first, second
+    if second > 12:
+        return second, first
+    return (first, second) if day_first else (second, first)
+
+
+def _full_year(year_str):
+    year = int(year_str)
+    return year + 2000 if len(year_str) == 2 else year
+
+
+def _date_from_match(match):
+    """(jenis, date) dari satu match DATE_TOKEN_RE; date None jika angkanya bukan tanggal valid."""
+    if match.group('iso'):
+        kind = 'iso'
+        # YYYY-MM-DD; YYYY-DD-MM hanya jika bagian tengah jelas bukan bulan
+        day_month = _day_month(int(match.group('iso_d')), int(match.group('iso_m')))
+        year = int(match.group('iso_y'))
+    elif match.group('num'):
+        kind = 'num_time' if match.group('num_time') else 'num'
+        day_month = _day_month(int(match.group('num_a')), int(match.group('num_b')), DATE_DAY_FIRST)
+        year = _full_year(match.group('num_y'))
+    elif match.group('dmy'):
+        kind = 'dmy'
+        day_month = (int(match.group('dmy_d')), DATE_MONTHS[match.group('dmy_m').rstrip('.').lower()])
+        year = _full_year(match.group('dmy_y'))
+    else:
+        kind = 'mdy'
+        day_month = (int(match.group('mdy_d')), DATE_MONTHS[match.group('mdy_m').rstrip('.').lower()])
+        year = _full_year(match.group('mdy_y'))
+    if day_month is None:
+        return kind, None
+    try:
+        return kind, date(year, day_month[1], day_month[0])
+    except ValueError:
+        return kind, None
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date_token(token):
+    """
+    Parse satu token tanggal (mis. '12/03/2024 14:05', '2024-03-12', '5 Agu 24') dengan tabel
+    format DATE_TOKEN_RE. Mengembalikan (jenis, datetime.date) atau None; hasil di-cache (LRU).
+    """
+    match = DATE_TOKEN_RE.fullmatch(token)
+    if match is None:
+        return None
+    kind, parsed = _date_from_match(match)
+    return (kind, parsed) if parsed else None
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_date_fallback(value):
+    """dateutil untuk format di luar tabel; tanpa tahun eksplisit dianggap gagal (tahun 1)."""
+    try:
+        return parser.parse(value, dayfirst=DATE_DAY_FIRST, default=datetime(1, 1, 1)).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+@timed_stage('extract_date')
 def extract_date(text):
     """
-    Ekstrak tanggal dari teks dengan regex yang lebih fleksibel dan dateutil.parser.
-    Mencoba beberapa format umum.
-    """
-    date_patterns = [
-        r'(\d{2}/\d{2}/\d{4})\s+\d{2}:\d{2}',  # MM/DD/YYYY HH:MM (for 8.jpg, Costco)
-        r'(\d{2}/\d{2}/\d{2})\s+\d{2}:\d{2}',  # MM/DD/YY HH:MM (for 0.jpg, Walmart)
-        r'(\d{4}[-/.]\d{1,2}[-/.]\d{1,2})',  #InBackground-MM-DD/MM/DD
-        r'(\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4})',  # DD/MM/YYYY or MM/DD/YYYY
-        r'(\d{1,2}\s+(?:Januari|Februari|Maret|April|Mei|Juni|Juli|Agustus|September|Oktober|November|Desember)[a-z]*\s+\d{2,4})',
-        r'(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|Mei|Jun|Jul|Agu|Sep|Okt|Nov|Des)[a-z]*\s+\d{2,4})',
-        r'(?:Januari|Februari|Maret|April|Mei|Juni|Juli|Agustus|September|Oktober|November|Desember)[a-z]*\s+\d{1,2},\s+\d{2,4}',
-        r'(?:Jan|Feb|Mar|Apr|Mei|Jun|Jul|Agu|Sep|Okt|Nov|Des)[a-z]*\s+\d{1,2},\s+\d{2,4}',
-        r'\b(\d{1,2}/\d{1,2}/\d{2})\b',  # For simpler MM/DD/YY (e.g. Primo 5/3/19)
-    ]
-
-    for pattern in date_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        for match_str in matches:
-            try:
-                # Try parsing with dayfirst=True
-                dt = parser.parse(match_str, dayfirst=True)
-                current_year = datetime.now().year
-                if (current_year - 10) <= dt.year <= (current_year + 2):
-                    return dt.strftime('%Y-%m-%d')
-            except ValueError:
-                # If dayfirst fails, try monthfirst if it looks like MM/DD/YY or MM/DD/YYYY
-                # And if the first part is plausible month (<=12) and second part is plausible day (<=31)
-                parts = re.split(r'[/.-]', match_str)
-                if len(parts) >= 2 and parts[0].isdigit() and parts[1].isdigit():
-                    m1 = int(parts[0])
-                    m2 = int(parts[1])
-                    if m1 <= 12 and m2 > 12:  # Looks like MM/DD where DD > 12
-                        try:
-                            dt = parser.parse(match_str, monthfirst=True)
-                            current_year = datetime.now().year
-                            if (current_year - 10) <= dt.year <= (current_year + 2):
-                                return dt.strftime('%Y-%m-%d')
-                        except ValueError:
-                            pass
-                continue  # Continue to next pattern/match if all parsing failed for this one
-
-    # Fallback: search in lines containing date keywords
-    date_keywords = r'(tanggal|date|tgl|tgl\.|waktu|time)'
-    for line in text.split('\n'):
-        if re.search(date_keywords, line, re.IGNORECASE):
-            date_match = re.search(r"(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}[/.-]\d{1,2}[/.-]\d{1,2})", line)
-            if date_match:
-                try:
-                    dt = parser.parse(date_match.group(1), dayfirst=True)
-                    current_year = datetime.now().year
-                    if (current_year - 10) <= dt.year <= (current_year + 2):
-                        return dt.strftime('%Y-%m-%d')
-                except ValueError:
-                    pass
+    Ekstrak tanggal (format 'YYYY-MM-DD') dengan satu kali scan DATE_TOKEN_RE.
+    Jika ada beberapa kandidat, dipilih menurut DATE_KIND_PRIORITY lalu posisi di teks.
+    dateutil hanya dipakai untuk nilai di baris ber-keyword tanggal yang tidak cocok dengan tabel.
+    """
+    receipt = as_receipt(text)
+    current_year = datetime.now().year
+    min_year, max_year = current_year - DATE_MAX_YEARS_BACK, current_year + DATE_MAX_YEARS_AHEAD
+
+    best_rank, best_date = None, None
+    for match in DATE_TOKEN_RE.finditer(receipt.text):
+        parsed = parse_date_token(match.group(0))
+        if parsed is None:
+            continue
+        kind, parsed_date = parsed
+        rank = DATE_KIND_PRIORITY[kind]
+        if min_year <= parsed_date.year <= max_year and (best_rank is None or rank < best_rank):
+            best_rank, best_date = rank, parsed_date
+            if rank == 0:
+                break
+    if best_date is not None:
+        return best_date.strftime('%Y-%m-%d')
+
+    # Fallback terakhir: nilai setelah keyword tanggal diparse dateutil
+    for i in receipt.keyword_lines('date'):
+        line = receipt.raw_lines[i]
+        keyword_match = DATE_KEYWORDS_RE.search(line)
+        if keyword_match is None:
+            continue
+        value = line[keyword_match.end():].strip(DATE_KEYWORD_VALUE_STRIP)
+        parsed_date = _parse_date_fallback(value) if value else None
+        if parsed_date is not None and min_year <= parsed_date.year <= max_year:
+            return parsed_date.strftime('%Y-%m-%d')
     return None
 
 
-def extract_merchant_name(text: str) -> str | None:
+@timed_stage('extract_merchant_name')
+def extract_merchant_name(text: str | ReceiptText) -> str | None:
     """
     Ambil nama merchant dari 1–7 baris teratas struk.
     Hindari kata kunci umum dan angka besar.
     Coba gunakan baris dengan jumlah karakter alfanumerik terbanyak di awal.
-    Prioritaskan pencarian pola brand yang unik.
-    """
-    keywords_to_avoid = [
-        'struk', 'kasir', 'tanggal', 'jam', 'npwp', 'invoice', 'no.', 'id',
-        'transaksi', 'subtotal', 'ppn', 'pajak', 'terima kasih', 'selamat datang',
-        'alamat', 'telepon', 'phone', 'telp', 'email', 'fax', 'admin', 'cashier',
-        'check', 'bill', 'kassa', 'lippo', 'mall', 'kemang', 'pos', 'title',
-        'recept', 'rcpt', 'pt', 'cv', 'pax', 'op', 'gunawan'
-    ]
-    lines = text.strip().split('\n')
-
-    # Prioritaskan pencarian pola brand yang unik dari seluruh teks (paling efektif)
-    brand_patterns = [
-        r'MOMI\s*&\s*TOY\'S\s*CR[EÊ]PERIE',
-        r'MOMI\s*&\s*TOY\'S',
-        r'CR[EÊ]PERIE',
-        r'YOMART\s*RAMBAY',
-        r'UMMI\s*MART',
-        r'INDOMARET',
-        r'Pisang\s*Juara',
-        r'TOSERBA\s*YOGYA\s*SUKABUMI',
-        r'ALFAMART',
-        r'WAL\s*\W?MART',  # Untuk Walmart
-        r'COSTCO\s*WHOLESALE',  # Untuk Costco
-        r'Primo(?:\s*Family\s*Restaurant)?',  # Untuk Primo
-        r'WHOLE\s*FOODS\s*MARKET',  # Untuk Whole Foods
-        r'MIGUELS\s*MEXICAN',  # Untuk Miguels
-    ]
-
-    for bp in brand_patterns:
-        brand_match = re.search(bp, text, re.IGNORECASE)
-        if brand_match:
-            normalized = normalize_merchant_name(brand_match.group(0))
-            if normalized:
-                return normalized
+    Prioritaskan nama kanonik dari leksikon merchant (fuzzy, lihat merchants.py).
+    """
+    receipt = as_receipt(text)
+    lines = receipt.lines
+
+    # Prioritaskan merchant yang dikenal leksikon (toleran typo OCR, cukup baris header)
+    merchant_match = receipt.merchant_match()
+    if merchant_match:
+        return merchant_match['name']
 
     # Fallback to top lines processing
     best_merchant_name = None
@@ -238,20 +584,20 @@ def extract_merchant_name(text: str) -> str | None:
 
         if len(clean_line) < 5 or len(clean_line) > 50:
             continue
-        if re.search(r'\d{3,}[.,]\d{2,}', clean_line):
+        if MERCHANT_PRICE_LIKE_RE.search(clean_line):
             continue
-        if any(kw in clean_line.lower() for kw in keywords_to_avoid):
+        if MERCHANT_KEYWORDS_TO_AVOID_RE.search(clean_line.lower()):
             continue
-        if re.search(r'^\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}$', clean_line):
+        if MERCHANT_DATE_LINE_RE.search(clean_line):
             continue
-        if re.search(r'^\s*$', clean_line):
+        if BLANK_LINE_RE.search(clean_line):
             continue
 
         normalized = normalize_merchant_name(clean_line)
         if normalized:
             score = len(normalized) * (10 - line_num)
 
-            if re.search(r'(jl\.|jalan|no\.|street|st\.|road|rd\.|kpm)', normalized.lower()):
+            if MERCHANT_ADDRESS_RE.search(normalized.lower()):
                 score *= 0.5
 
             if len(normalized.split()) <= 2 and len(normalized) <= 7:
@@ -263,46 +609,39 @@ def extract_merchant_name(text: str) -> str | None:
 
     return best_merchant_name
 
+@timed_stage('extract_total')
 def extract_total(text):
     """
     Cari baris yang mengandung 'total' lalu ambil angka di kanannya.
     Fallback: cari baris terakhir yang berupa angka besar.
     Prioritaskan 'GRAND TOTAL' atau 'TOTAL BAYAR'.
     """
-    text_lower = text.lower()
-
-    total_patterns = [
-        r'(?:grand\s*total|total\s*bayar|total\s*amount|amount\s*due|jumlah\s*bayar|jml\s*bayar|total\s*jual|final\s*total)\s*[:\-\=\s]*([RrPp\$]?\s*[0-9.,\s]+)',
-        r'(?:total|jumlah|jml)\s*[:\-\=\s]*([RrPp\$]?\s*[0-9.,\s]+)',
-    ]
+    receipt = as_receipt(text)
+    text_lower = receipt.lower
 
-    for pattern_str in total_patterns:
-        match = re.search(pattern_str, text_lower)
+    for pattern in TOTAL_PATTERNS:
+        match = pattern.search(text_lower)
         if match:
-            return normalize_price(match.group(1))
+            return receipt.price(match.group(1))
 
     # Fallback 1: Cari "Total" di satu baris dan angka di baris berikutnya (dekat)
-    lines = text.strip().split('\n')
-    for i, line in enumerate(lines):
-        if re.search(r'(total|jumlah|jml)', line, re.IGNORECASE) and i + 1 < len(lines):
+    lines = receipt.lines
+    for i in receipt.keyword_lines('total', stripped=True):
+        if i + 1 < len(lines):
             next_line = lines[i + 1]
-            number_match = re.search(
-                r'[RrPp\$]?\s*([0-9]{1,3}(?:[.,\s][0-9]{3})*(?:[.,\s][0-9]{1,2})?|[0-9]{3,}(?:[.,\s][0-9]{1,2})?)$',
-                next_line.strip())
+            number_match = LINE_PRICE_RE.search(next_line.strip())
             if number_match:
-                price = normalize_price(number_match.group(1))
+                price = receipt.price(number_match.group(1))
                 if price is not None and price > 0:
                     return price
 
     # Fallback 2: Cari angka terbesar di 5 baris terakhir
     potential_totals = []
     for line in reversed(lines[-8:]):
-        numbers = re.findall(
-            r'[RrPp\$]?\s*([0-9]{1,3}(?:[.,\s][0-9]{3})*(?:[.,\s][0-9]{1,2})?|[0-9]{3,}(?:[.,\s][0-9]{1,2})?)$',
-            line.strip())
+        numbers = LINE_PRICE_RE.findall(line.strip())
         for num_str_tuple in numbers:
             num_str = num_str_tuple[0]
-            price = normalize_price(num_str)
+            price = receipt.price(num_str)
             if price is not None and price > 0:
                 potential_totals.append(price)
 
@@ -311,59 +650,44 @@ def extract_total(text):
     return None
 
 
+@timed_stage('extract_subtotal')
 def extract_subtotal(text):
     """
     Cari subtotal dengan beberapa variasi keyword dan typo.
     Fallback: angka besar sebelum baris 'tax' atau 'total'.
     """
-    text_lower = text.lower()
-    subtotal_patterns = [
-        r'(?:sub[\s\-]?total|sub[\s\-]?amt|subtotalan)\s*[:\-\=\s]*([RrPp\$]?\s*[0-9.,\s]+)',
-        r'(?:nett?[\s\-]?sales?|before[\s\-]?tax|jumlah\s*sebelum\s*pajak|jml\s*blm\s*pjk|total\s*jual)\s*[:\-\=\s]*([RrPp\$]?\s*[0-9.,\s]+)',
-        # Tambah 'total jual'
-    ]
-    for pattern_str in subtotal_patterns:
-        match = re.search(pattern_str, text_lower)
+    receipt = as_receipt(text)
+    for pattern in SUBTOTAL_PATTERNS:
+        match = pattern.search(receipt.lower)
         if match:
-            return normalize_price(match.group(1))
+            return receipt.price(match.group(1))
 
     # Fallback 1: Cari di baris sebelum 'tax' atau 'total'
-    lines = text.split('\n')
-    for i, line in enumerate(lines):
-        if re.search(r'(tax|ppn|pajak|total|grand\s*total)', line, re.IGNORECASE):
-            for j in range(max(0, i - 3), i):
-                prev_line = lines[j]
-                number_match = re.search(r'[RrPp\$]?\s*([0-9]{2,}(?:[.,\s][0-9]{3})*(?:[.,\s][0-9]{1,2})?)$', prev_line)
-                if number_match:
-                    potential_subtotal = normalize_price(number_match.group(1))
-                    if potential_subtotal is not None and potential_subtotal > 0:
-                        return potential_subtotal
+    for i in receipt.keyword_lines('subtotal_anchor'):
+        for j in range(max(0, i - 3), i):
+            potential_subtotal = receipt.line_amount(j)
+            if potential_subtotal is not None and potential_subtotal > 0:
+                return potential_subtotal
     return None
 
+@timed_stage('extract_tax')
 def extract_tax(text):
     """
     Cari tax/ppn/pajak/service charge/vat/gst/levy pada struk.
     """
-    text_lower = text.lower()
-    tax_patterns = [
-        r'(?:tax|vat|ppn|pajak|service[\s\-]?charge|gst|pph|levy|service)\s*[:\-\=\s]*([RrPp\$]?\s*[0-9.,\s]+)',
-        r'(\d{1,2}\s*%)?\s*(?:tax|vat|ppn|pajak)\s*[:\-\=\s]*([RrPp\$]?\s*[0-9.,\s]+)',
-    ]
-    for pattern_str in tax_patterns:
-        match = re.search(pattern_str, text_lower)
+    receipt = as_receipt(text)
+    for pattern in TAX_PATTERNS:
+        match = pattern.search(receipt.lower)
         if match:
-            return normalize_price(match.groups()[-1])
+            return receipt.price(match.groups()[-1])
 
-    lines = text.split('\n')
-    for line in lines:
-        if re.search(r'(tax|ppn|pajak|vat|service|gst|levy)', line, re.IGNORECASE):
-            number_match = re.search(r'[RrPp\$]?\s*([0-9]{2,}(?:[.,\s][0-9]{3})*(?:[.,\s][0-9]{1,2})?)$', line)
-            if number_match:
-                potential_tax = normalize_price(number_match.group(1))
-                if potential_tax is not None and potential_tax > 0:
-                    return potential_tax
+    for i in receipt.keyword_lines('tax'):
+        potential_tax = receipt.line_amount(i)
+        if potential_tax is not None and potential_tax > 0:
+            return potential_tax
     return None
 
+@timed_stage('extract_items')
 def extract_items(text):
     """
     Ekstrak item belanja.
@@ -372,66 +696,38 @@ def extract_items(text):
     Mencoba pola yang lebih toleran terhadap karakter acak di tengah.
     Prioritaskan mencari item di antara subtotal/total.
     """
-    lines = text.strip().split('\n')
+    receipt = as_receipt(text)
     items = []
 
-    # Kata kunci yang menandakan batas atas/bawah dari daftar item
-    start_keywords = ['item', 'produk', 'barang', 'desc', 'description', 'nama barang', 'qty', 'harga', 'price',
-                      'quantity', 'menu']
-    end_keywords = ['subtotal', 'total', 'tax', 'ppn', 'pajak', 'grand total', 'jumlah', 'pembayaran', 'terima kasih',
-                    'kembalian', 'cash', 'diskon', 'charge', 'change', 'total jual', 'total item', 'total jenis',
-                    'total jual',
-                    'closed bill', 'amount due']
-
     item_section_lines = []
     in_item_section = False
 
-    for line in lines:
-        line_lower = line.lower()
-        if not in_item_section and (any(kw in line_lower for kw in start_keywords) or re.search(r'^\s*\d+\s*[a-z]',
-                                                                                                line_lower)):  # Start if keyword or line starts with number then letter
+    for line, line_lower in zip(receipt.lines, receipt.lines_lower):
+        # Start if keyword or line starts with number then letter
+        if not in_item_section and (ITEM_START_RE.search(line_lower) or ITEM_NUMBERED_LINE_RE.search(line_lower)):
             in_item_section = True
             # Don't continue, process this line if it's an item line
 
         if in_item_section:
-            if any(kw in line_lower for kw in end_keywords):
+            if ITEM_END_RE.search(line_lower):
                 break
 
             # Filter baris yang jelas-jelas bukan item
             if len(line.strip()) < 3 or len(line.strip()) > 70 or \
-                    re.match(r'^[\d\s.,Rp$]+$', line.strip()) or \
-                    re.match(r'^\s*(no|check|date|time|pax|op|rcpt#|rept#)', line_lower) or \
-                    any(kw in line_lower for kw in start_keywords):  # Ensure not to re-process header lines
+                    ITEM_NUMBERS_ONLY_RE.match(line.strip()) or \
+                    ITEM_HEADER_LINE_RE.match(line_lower) or \
+                    ITEM_START_RE.search(line_lower):  # Ensure not to re-process header lines
                 continue
             item_section_lines.append(line)
 
     for line in item_section_lines:
         current_item = None
 
-        # Pola A: Nama Item dengan dash/spasi lalu harga (contoh: "Mix Coklat - Rp18.000")
-        # Atau nama item yang mengandung "x" lalu harga (contoh: "Tiramisu Kear 1x Rp18.000")
-        # Menggunakan [ -—–] untuk berbagai jenis dash/hyphen
-        item_match_A = re.search(
-            r'(.+?)\s*(?:[-—–]|\s*1?[xX])\s*([RrPp\$]?\s*[0-9.,\s]{1,})$',
-            line.strip(),
-            re.IGNORECASE
-        )
-
-        # Pola B: Kuantitas di awal, Nama, Harga di akhir
-        # Contoh: "1 Woman 0 74,000", "2 Ham Cheese 16,000", "1x Rp18.000" (ini harga total item, bukan harga satuan)
-        item_match_B = re.search(
-            r'^\s*(\d+)(?:\s*[xX])?\s*(.+?)([RrPp\$]?\s*[0-9.,\s]{1,})$',
-            line.strip(),
-            re.IGNORECASE
-        )
-
-        # Pola C: Nama (opsional 'x Qty'), Harga di akhir (jika tidak ada qty di awal dan tidak ada dash)
-        # Contoh: "Ice Java Tea 16,000", "MAHI MAHI FILLETS 8.99 B" (dari Whole Foods)
-        item_match_C = re.search(
-            r'(.+?)\s+(?:(?:x\s*(\d+))|\s*(\d+)\s+)?([RrPp\$]?\s*[0-9.,\s]{1,})$',
-            line.strip(),
-            re.IGNORECASE
-        )
+        # Pola A/B/C: lihat ITEM_PATTERN_A/B/C di registry regex
+        stripped_line = line.strip()
+        item_match_A = ITEM_PATTERN_A.search(stripped_line)
+        item_match_B = ITEM_PATTERN_B.search(stripped_line)
+        item_match_C = ITEM_PATTERN_C.search(stripped_line)
 
         # Urutan prioritas pola
         if item_match_A:  # Cocok untuk Pisang Juara: "Mix Coklat - Rp18.000"
@@ -440,10 +736,10 @@ def extract_items(text):
             qty = 1  # Asumsi qty 1 jika pola ini cocok
 
             normalized_name = normalize_item_name(name_part)
-            normalized_price = normalize_price(price_str)
+            normalized_price = receipt.price(price_str)
 
             if normalized_name and normalized_price is not None and normalized_price >= 0:
-                if not any(kw in normalized_name.lower() for kw in end_keywords):
+                if not ITEM_END_RE.search(normalized_name.lower()):
                     current_item = {
                         'name': normalized_name,
                         'price': normalized_price,
@@ -455,15 +751,15 @@ def extract_items(text):
             price_str = item_match_B.group(3)
 
             qty = int(qty_str) if qty_str.isdigit() else 1
-            normalized_price = normalize_price(price_str)
+            normalized_price = receipt.price(price_str)
 
-            cleaned_name_part = re.sub(r'\s*\d+(?:\.\d+)?\s*$', '', name_part).strip()
-            cleaned_name_part = re.sub(r'[^A-Za-z0-9\s&\'\.]', '', cleaned_name_part).strip()
+            cleaned_name_part = ITEM_TRAILING_QTY_RE.sub('', name_part).strip()
+            cleaned_name_part = NAME_ALLOWED_CHARS_RE.sub('', cleaned_name_part).strip()
 
             normalized_name = normalize_item_name(cleaned_name_part)
 
             if normalized_name and normalized_price is not None and normalized_price >= 0:
-                if not any(kw in normalized_name.lower() for kw in end_keywords):
+                if not ITEM_END_RE.search(normalized_name.lower()):
                     current_item = {
                         'name': normalized_name,
                         'price': normalized_price,
@@ -475,10 +771,10 @@ def extract_items(text):
             price_str = item_match_C.group(4)
 
             normalized_name = normalize_item_name(name_part)
-            normalized_price = normalize_price(price_str)
+            normalized_price = receipt.price(price_str)
 
             if normalized_name and normalized_price is not None and normalized_price >= 0:
-                if not any(kw in normalized_name.lower() for kw in end_keywords):
+                if not ITEM_END_RE.search(normalized_name.lower()):
                     current_item = {
                         'name': normalized_name,
                         'price': normalized_price,
@@ -488,6 +784,11 @@ def extract_items(text):
         if current_item:
             items.append(current_item)
 
+    return _finalize_items(items, receipt.text)
+
+
+def _finalize_items(items, text):
+    """Buang duplikat, nama generik, dan harga yang terlalu kecil; urutkan sesuai posisi di teks."""
     # Final processing for items, removing duplicates and very generic entries.
     final_items = []
     seen_names = set()
@@ -495,13 +796,12 @@ def extract_items(text):
         # Check for potential item price being too low to be real item price for most cases (e.g. 0 or 1)
         # unless it is specifically 'Change' or 'Discount' etc.
         if item['name'] and item['name'].lower() not in seen_names and \
-                not re.match(r'^\d+$', item['name']) and \
+                not DIGITS_ONLY_RE.match(item['name']) and \
                 len(item['name']) >= 2 and \
                 item['price'] is not None and item['price'] >= 0:  # Ensure price is not negative
 
             # Additional filter for very small prices, unless it's a known small item or discount
-            if item['price'] < 500 and not re.search(r'(disc|off|diskon|change|kembali|tax|ppn|pajak|point)',
-                                                     item['name'].lower()):
+            if item['price'] < 500 and not ITEM_SMALL_PRICE_OK_RE.search(item['name'].lower()):
                 continue  # Filter items that are too cheap to be valid unless they are discounts etc.
 
             final_items.append(item)
@@ -515,37 +815,104 @@ def extract_items(text):
     return final_items
 
 
+@timed_stage('extract_items_from_layout')
+def extract_items_from_layout(layout):
+    """
+    Ekstrak item dari layout OCR (lihat build_ocr_layout) berdasarkan kolom:
+    - Kolom harga = median tepi kanan kata-harga paling kanan di tiap baris.
+    - Baris item = baris yang kata-harga paling kanannya sejajar kolom harga;
+      kata di kirinya adalah nama (angka kecil di awal dianggap kuantitas).
+    Batas atas/bawah daftar item memakai ITEM_START_RE / ITEM_END_RE seperti extract_items.
+    """
+    if not layout or not layout.get('lines'):
+        return []
+    lines = layout['lines']
+
+    # Batas atas: baris header item (qty/harga/...); jika tidak ada, mulai dari atas.
+    # Baris non-item di atas daftar (nama toko, tanggal) tidak punya harga di kolom harga.
+    start = next((index for index, line in enumerate(lines) if ITEM_START_RE.search(line['text'].lower())), 0)
+
+    candidates = []
+    for line in lines[start:]:
+        line_lower = line['text'].lower()
+        if ITEM_END_RE.search(line_lower):
+            break
+        if ITEM_START_RE.search(line_lower) or ITEM_HEADER_LINE_RE.match(line_lower):
+            continue
+        words = line['words']
+        price_index = next((i for i in range(len(words) - 1, 0, -1)
+                            if LAYOUT_PRICE_WORD_RE.match(words[i]['text'])), None)
+        if price_index is not None:
+            candidates.append((line, price_index))
+    if not candidates:
+        return []
+
+    right_edges = sorted(line['words'][i]['bbox'][2] for line, i in candidates)
+    column_right = right_edges[len(right_edges) // 2]
+    tolerance = max(0.05 * layout.get('width', 0), 2 * layout.get('median_word_height', 0), 10)
+
+    items = []
+    for line, price_index in candidates:
+        price_word = line['words'][price_index]
+        if abs(price_word['bbox'][2] - column_right) > tolerance:
+            continue
+        name_words = [w['text'] for w in line['words'][:price_index]]
+        qty = 1
+        qty_match = LAYOUT_QTY_WORD_RE.match(name_words[0]) if name_words else None
+        if qty_match and len(name_words) > 1:
+            qty = int(qty_match.group(1)) or 1
+            name_words = name_words[1:]
+
+        normalized_name = normalize_item_name(NAME_ALLOWED_CHARS_RE.sub('', ' '.join(name_words)))
+        normalized_price = normalize_price(price_word['text'])
+        if normalized_name and normalized_price is not None and normalized_price >= 0 and \
+                not ITEM_END_RE.search(normalized_name.lower()):
+            items.append({'name': normalized_name, 'price': normalized_price, 'qty': qty})
+
+    return _finalize_items(items, layout_text(layout))
+
+
 # --- 3. Fungsi Pipeline Utama Ekstraksi ---
-def extract_entities_rule_based(text):
+def extract_entities_rule_based(text, layout=None):
     """
     Pipeline ekstraksi entitas rule-based.
     Kali ini lebih fokus pada menampilkan raw_text, dengan sedikit usaha ekstraksi entitas kunci.
+    Jika layout OCR (build_ocr_layout) tersedia, item dicocokkan per kolom nama/harga dulu;
+    extract_items berbasis teks dipakai sebagai fallback.
     """
     extracted_data = {}
-    # 1. Coba ekstrak Merchant Name (dengan prioritas pola brand)
-    merchant_name = extract_merchant_name(text)
+    # Tokenisasi sekali, dipakai bersama semua extractor
+    receipt = as_receipt(text)
+    text = receipt.text
+
+    # 1. Coba ekstrak Merchant Name (dengan prioritas leksikon merchant)
+    merchant_name = extract_merchant_name(receipt)
     extracted_data['merchant_name'] = merchant_name
+    merchant_match = receipt.merchant_match()
+    extracted_data['merchant_score'] = merchant_match['score'] if merchant_match else None
 
     # 2. Coba ekstrak Date
-    date = extract_date(text)
+    date = extract_date(receipt)
     extracted_data['date'] = date
 
     # 3. Coba ekstrak Total
-    total = extract_total(text)
+    total = extract_total(receipt)
     extracted_data['total'] = total
 
     # 4. Coba ekstrak Subtotal dan Tax (jika ada dan mudah)
-    subtotal = extract_subtotal(text)
+    subtotal = extract_subtotal(receipt)
     extracted_data['subtotal'] = subtotal
 
-    tax = extract_tax(text)
+    tax = extract_tax(receipt)
     extracted_data['tax'] = tax
 
     # 5. Untuk Items, karena ini yang paling sulit, kita akan lewati detailnya.
     # Atau, kita bisa mencoba ekstraksi item yang sangat dasar sebagai contoh saja.
     # Untuk deadline, mungkin lebih baik fokus pada raw text.
     # Jika ingin tetap ada upaya items, gunakan extract_items seperti biasa, tapi jangan terlalu berharap akurat.
-    items = extract_items(text)  # Tetap panggil, siapa tahu ada yang berhasil
+    items = extract_items_from_layout(layout) if layout else []
+    if not items:
+        items = extract_items(receipt)  # Tetap panggil, siapa tahu ada yang berhasil
     extracted_data['items'] = items
 
     # Tambahkan raw_text yang sudah ada
@@ -555,111 +922,1174 @@ def extract_entities_rule_based(text):
 
 
 # --- 4. Fungsi Preprocessing Gambar ---
-def preprocess_pipeline(image_path):
+def estimate_noise(gray):
+    """
+    Estimasi sigma noise gambar grayscale (metode Immerkaer: konvolusi Laplacian
+    selisih dua orde, lalu rata-rata nilai absolut). Murah dan cukup untuk gating.
+    """
+    h, w = gray.shape[:2]
+    if h < 3 or w < 3:
+        return 0.0
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = cv2.filter2D(gray.astype(np.float32), -1, kernel, borderType=cv2.BORDER_REFLECT)
+    return float(np.abs(response[1:-1, 1:-1]).sum() * np.sqrt(0.5 * np.pi) / (6.0 * (w - 2) * (h - 2)))
+
+
+def _denoise_nlm(gray):
+    # Fast Nl Means Denoising - h=15 adalah titik awal yang baik, memberikan denoising yang moderat.
+    return cv2.fastNlMeansDenoising(gray, h=DENOISE_H, templateWindowSize=7, searchWindowSize=21)
+
+
+_denoise_executor = None
+_denoise_executor_lock = threading.Lock()
+
+
+def get_denoise_executor():
+    """Pool thread denoise per strip bersama per proses (OCR_MAX_WORKERS thread, dibuat saat pertama dipakai)."""
+    global _denoise_executor
+    with _denoise_executor_lock:
+        if _denoise_executor is None:
+            _denoise_executor = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS, thread_name_prefix='denoise-tile')
+        return _denoise_executor
+
+
+def _denoise_nlm_tiled(gray, tile_height=None):
+    """
+    NLM per strip horizontal secara paralel (OpenCV melepas GIL) di pool denoise bersama, jadi
+    jumlah thread per proses tetap dibatasi budget worker OCR, bukan os.cpu_count() per panggilan.
+    Tiap strip diberi overlap setengah search window + template window supaya
+    tepi strip mendapat konteks yang sama dengan NLM satu gambar penuh.
+    """
+    tile_height = tile_height or DENOISE_TILE_HEIGHT
+    h = gray.shape[0]
+    if gray.size < DENOISE_TILE_MIN_PIXELS or h <= tile_height or OCR_MAX_WORKERS <= 1:
+        return _denoise_nlm(gray)
+
+    overlap = 21 // 2 + 7 // 2
+    bounds = [(top, min(top + tile_height, h)) for top in range(0, h, tile_height)]
+
+    def denoise_tile(bound):
+        top, bottom = bound
+        padded_top, padded_bottom = max(0, top - overlap), min(h, bottom + overlap)
+        tile = _denoise_nlm(gray[padded_top:padded_bottom])
+        return tile[top - padded_top:top - padded_top + (bottom - top)]
+
+    tiles = list(get_denoise_executor().map(denoise_tile, bounds))
+    return np.vstack(tiles)
+
+
+def _denoise_bilateral(gray):
+    return cv2.bilateralFilter(gray, 7, 50, 50)
+
+
+def _denoise_median(gray):
+    return cv2.medianBlur(gray, 3)
+
+
+def _denoise_gated(gray):
+    # Struk hasil scan yang bersih tidak perlu NLM sama sekali
+    if estimate_noise(gray) < DENOISE_NOISE_THRESHOLD:
+        return gray
+    return _denoise_nlm(gray)
+
+
+DENOISERS = {
+    'nlm': _denoise_nlm,
+    'nlm_tiled': _denoise_nlm_tiled,
+    'bilateral': _denoise_bilateral,
+    'median': _denoise_median,
+    'gated': _denoise_gated,
+    'none': lambda gray: gray,
+}
+
+
+def denoise(gray, method=None):
+    """Jalankan tahap denoise sesuai method (default DENOISE_METHOD)."""
+    method = method or DENOISE_METHOD
+    if method not in DENOISERS:
+        raise ValueError(f"Unknown denoise method: {method}")
+    return DENOISERS[method](gray)
+
+
+def _threshold_adaptive(gray, block_size=None):
+    # Gaussian_C seringkali lebih baik dari Mean_C; blockSize=21, C=10 menghasilkan teks "P1sang Juara".
+    # THRESH_BINARY memberi teks hitam, lalu dibalik supaya teks = foreground putih.
+    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                   block_size or THRESH_BLOCK_SIZE, THRESH_C)
+    return cv2.bitwise_not(thresh)
+
+
+def _threshold_otsu(gray):
+    # Satu ambang global; bagus untuk struk pudar dengan pencahayaan rata
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+
+
+def _threshold_sauvola(gray, window=None, k=None):
+    """Sauvola: ambang lokal mean * (1 + k * (std / 128 - 1)), mean/std dari box filter."""
+    window = window or SAUVOLA_WINDOW
+    k = SAUVOLA_K if k is None else k
+    values = gray.astype(np.float32)
+    mean = cv2.boxFilter(values, -1, (window, window), borderType=cv2.BORDER_REPLICATE)
+    mean_sq = cv2.boxFilter(values * values, -1, (window, window), borderType=cv2.BORDER_REPLICATE)
+    std = np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+    return np.where(values < mean * (1 + k * (std / 128 - 1)), 255, 0).astype(np.uint8)
+
+
+BINARIZERS = {
+    'adaptive': _threshold_adaptive,
+    'adaptive_large': lambda gray: _threshold_adaptive(gray, THRESH_LARGE_BLOCK_SIZE),
+    'otsu': _threshold_otsu,
+    'sauvola': _threshold_sauvola,
+}
+
+
+def binarize_variant(gray, variant):
+    """
+    Threshold + morph open satu varian (teks = foreground 255). Varian berakhiran '_inv'
+    memakai binarizer yang sama pada gray yang dibalik (teks terang di latar gelap).
+    """
+    inverted = variant.endswith('_inv')
+    method = variant[:-len('_inv')] if inverted else variant
+    if method not in BINARIZERS:
+        raise ValueError(f"Unknown binarization variant: {variant}")
+    with timed('threshold'):
+        thresh = BINARIZERS[method](cv2.bitwise_not(gray) if inverted else gray)
+    # Kernel (2,2) dan MORPH_OPEN sebelumnya menghasilkan teks "P1sang Juara"
+    with timed('morph'):
+        morphed = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    return thresh, morphed
+
+
+def _char_components(stats, h, w):
+    """Mask connected component berukuran karakter (bukan tepi kertas/noise kecil); label 0 = background."""
+    widths, heights, areas = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT], stats[:, cv2.CC_STAT_AREA]
+    max_height = max(ROI_MIN_CHAR_HEIGHT, h * ROI_MAX_CHAR_HEIGHT_FRACTION)
+    keep = (heights >= ROI_MIN_CHAR_HEIGHT) & (heights <= max_height) & (widths <= w * 0.5) & (areas >= 10)
+    keep[0] = False
+    return keep
+
+
+def binarization_proxy_score(gray, binary, inverted=False):
+    """
+    Skor murah (0..1) seberapa mirip hasil binarisasi dengan teks, tanpa OCR:
+    porsi piksel foreground yang berada di komponen berukuran karakter, dikali kontras
+    gray antara foreground dan background (arah sesuai polaritas, dinormalisasi rentang gray).
+    Polaritas terbalik, halo di sekitar huruf dan noise besar mendapat skor rendah.
+    """
+    h, w = binary.shape[:2]
+    foreground = cv2.countNonZero(binary)
+    if foreground == 0 or foreground > BINARIZE_MAX_FOREGROUND * h * w:
+        return 0.0
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    areas = stats[:, cv2.CC_STAT_AREA]
+    char_fraction = float(areas[_char_components(stats, h, w)].sum()) / float(areas[1:].sum())
+
+    fg_mean = cv2.mean(gray, mask=binary)[0]
+    bg_mean = cv2.mean(gray, mask=cv2.bitwise_not(binary))[0]
+    low, high = np.percentile(gray[::4, ::4], [1, 99])
+    contrast = (fg_mean - bg_mean if inverted else bg_mean - fg_mean) / max(float(high - low), 1.0)
+    return char_fraction * max(0.0, min(1.0, contrast))
+
+
+def select_binarization(gray, variants=None, deskew_angle=None, debug_sink=None, ocr_workers=None):
+    """
+    Pilih varian binarisasi (BINARIZE_VARIANTS) untuk gray hasil denoise.
+    - Varian default (pertama) dipakai langsung jika skor proxy-nya >= BINARIZE_PROXY_CONFIDENT.
+    - Jika tidak, semua varian dibuat dan diskor; default tetap menang selama skornya
+      >= BINARIZE_PROXY_TOLERANCE x skor terbaik, selain itu varian terbaik dipakai.
+    - Jika skor terbaik pun < BINARIZE_PROXY_CONFIDENT, BINARIZE_OCR_CANDIDATES varian teratas
+      di-deskew dan di-OCR sekali (PSM yang paling sering menang, paling banyak ocr_workers
+      thread; default OCR_MAX_WORKERS), confidence tertinggi dipilih.
+    Mengembalikan (thresholded, morphed, info) dengan info berisi
+    'variant', 'selected_by' ('default'/'proxy'/'ocr') dan 'scores'.
+    """
+    variants = list(variants or BINARIZE_VARIANTS)
+    debug_sink = debug_sink or NullDebugSink()
+    default = variants[0]
+    binaries = {default: binarize_variant(gray, default)}
+    scores = {default: binarization_proxy_score(gray, binaries[default][1], default.endswith('_inv'))}
+
+    def selected(variant, selected_by):
+        info = {'variant': variant, 'selected_by': selected_by,
+                'scores': {name: round(score, 3) for name, score in scores.items()}}
+        return binaries[variant][0], binaries[variant][1], info
+
+    if len(variants) == 1 or scores[default] >= BINARIZE_PROXY_CONFIDENT:
+        return selected(default, 'default')
+
+    for variant in variants[1:]:
+        binaries[variant] = binarize_variant(gray, variant)
+        scores[variant] = binarization_proxy_score(gray, binaries[variant][1], variant.endswith('_inv'))
+        debug_sink.add(f"variant_{variant}", binaries[variant][1])
+    ranked = sorted(variants, key=lambda name: -scores[name])
+    best = ranked[0]
+    if scores[default] >= BINARIZE_PROXY_TOLERANCE * scores[best]:
+        return selected(default, 'proxy')
+    if scores[best] >= BINARIZE_PROXY_CONFIDENT or BINARIZE_OCR_CANDIDATES < 2:
+        return selected(best, 'proxy')
+
+    candidates = ranked[:BINARIZE_OCR_CANDIDATES]
+    psm = psm_stats.ordered(PSM_MODES)[0]
+    with timed('binarize_ocr_select'):
+        deskewed = [deskew(binaries[name][1], angle=deskew_angle)[0] for name in candidates]
+        confidences = _map_ocr(lambda _, img: _run_psm_safe(img, psm)[0], None, deskewed,
+                              ocr_workers or OCR_MAX_WORKERS)
+    logger.debug("Binarisasi: proxy ragu, confidence OCR %s", dict(zip(candidates, confidences)))
+    scored = [(conf, name) for name, conf in zip(candidates, confidences) if conf is not None]
+    if not scored:
+        return selected(best, 'proxy')
+    winner = max(scored, key=lambda item: item[0])[1]
+    return selected(winner, 'ocr')
+
+
+class NullDebugSink:
+    """Sink default: tahap preprocessing tidak disimpan ke mana pun (tanpa biaya encode PNG)."""
+
+    def add(self, stage, image):
+        pass
+
+
+class DirectoryDebugSink:
+    """
+    Simpan setiap tahap sebagai PNG di direktori unik per request
+    (misal /tmp/ocr-debug/abc123/01_resized.png), jadi request paralel tidak saling menimpa.
+    """
+
+    def __init__(self, base_dir=None):
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='ocr-debug-', dir=base_dir)
+        self._count = 0
+
+    def add(self, stage, image):
+        self._count += 1
+        cv2.imwrite(os.path.join(self.directory, f"{self._count:02d}_{stage}.png"), image)
+
+
+class MemoryDebugSink:
+    """Simpan setiap tahap di memori (self.stages: nama tahap -> array), misal untuk ditampilkan di app."""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def add(self, stage, image):
+        self.stages[stage] = image
+
+
+def describe_image_source(image):
+    """Deskripsi singkat sumber gambar untuk log (tanpa mencetak isi bytes)."""
+    if isinstance(image, (str, os.PathLike)):
+        return str(image)
+    if isinstance(image, np.ndarray):
+        return f"<ndarray {image.shape} {image.dtype}>"
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return f"<bytes {len(image)}>"
+    return f"<{type(image).__name__}>"
+
+
+REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+# Tag EXIF Orientation: nilai 5-8 = gambar diputar 90/270 derajat (cv2.imread/imdecode menerapkannya)
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def peek_image_size(source):
+    """
+    (width, height) dari header gambar (path atau bytes) tanpa decode piksel; None jika gagal.
+    Orientasi EXIF ikut diperhitungkan supaya ukurannya sama dengan hasil decode OpenCV.
+    """
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source) as im:
+            width, height = im.size
+            if im.getexif().get(EXIF_ORIENTATION_TAG) in EXIF_TRANSPOSED_ORIENTATIONS:
+                return height, width
+            return width, height
+    except Exception:
+        return None
+
+
+def decode_reduction(width, min_width=None):
+    """Faktor reduksi decode terbesar (8, 4, 2 atau 1) yang menjaga lebar >= min_width."""
+    min_width = min_width or PREPROCESS_DECODE_MIN_WIDTH
+    for factor in (8, 4, 2):
+        if width // factor >= min_width:
+            return factor
+    return 1
+
+
+def load_image(image, grayscale=False, reduce_to_width=None, info=None):
+    """
+    Muat gambar dari path, bytes, file-like (punya .read()) atau NumPy array.
+    Bytes/file-like didecode langsung di memori dengan cv2.imdecode (tanpa file sementara).
+    grayscale=True mendecode langsung ke grayscale (1/3 memori BGR). Jika reduce_to_width diisi,
+    gambar yang jauh lebih lebar didecode dengan IMREAD_REDUCED_GRAYSCALE_2/4/8 (libjpeg
+    men-skip koefisien DCT, jadi array resolusi penuh tidak pernah dibuat).
+    info (dict, opsional) diisi 'decode_reduction'.
+    Mengembalikan array BGR atau grayscale, atau None jika gagal.
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim == 3 and image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        return image
+    if hasattr(image, 'read'):
+        image = image.read()
+    if isinstance(image, (bytes, bytearray, memoryview)) and len(image) == 0:
+        return None
+    if not isinstance(image, (str, os.PathLike, bytes, bytearray, memoryview)):
+        return None
+
+    flag = cv2.IMREAD_COLOR
+    if grayscale:
+        size = peek_image_size(image) if reduce_to_width else None
+        factor = decode_reduction(size[0], reduce_to_width) if size else 1
+        flag = REDUCED_GRAYSCALE_FLAGS[factor]
+        if info is not None:
+            info['decode_reduction'] = factor
+
+    if isinstance(image, (str, os.PathLike)):
+        return cv2.imread(os.fspath(image), flag)
+    return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flag)
+
+
+def estimate_text_height(gray):
+    """
+    Estimasi tinggi karakter (median tinggi connected component, piksel) dari gambar grayscale.
+    Teks dianggap lebih gelap dari kertas (Otsu terbalik). None jika komponen terlalu sedikit.
+    """
+    h, w = gray.shape[:2]
+    _, binary = cv2.threshold(cv2.medianBlur(gray, 3), 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    widths, heights, areas = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    keep = (heights >= ROI_MIN_CHAR_HEIGHT) & (heights <= h * ROI_MAX_CHAR_HEIGHT_FRACTION) & \
+           (widths <= w * 0.5) & (areas >= 10)
+    if keep.sum() < 20:
+        return None
+    return float(np.median(heights[keep]))
+
+
+def choose_resize_scale(gray, policy=None, info=None):
+    """
+    Skala resize sesuai PREPROCESS_RESIZE_POLICY.
+    - 'width': lebar tetap PREPROCESS_TARGET_WIDTH (hanya jika lebih lebar, atau < setengahnya).
+    - 'text_height': tinggi karakter dibawa ke PREPROCESS_TARGET_TEXT_HEIGHT, lebar hasil dibatasi
+      PREPROCESS_MIN_WIDTH..PREPROCESS_MAX_WIDTH; fallback ke 'width' jika estimasi gagal.
+    Mengembalikan 1.0 jika resize tidak perlu.
+    """
+    width = gray.shape[1]
+    policy = policy or PREPROCESS_RESIZE_POLICY
+    if policy == 'text_height':
+        text_height = estimate_text_height(gray)
+        if info is not None:
+            info['text_height'] = text_height
+        if text_height:
+            target_width = width * PREPROCESS_TARGET_TEXT_HEIGHT / text_height
+            target_width = min(max(target_width, PREPROCESS_MIN_WIDTH), PREPROCESS_MAX_WIDTH)
+            scale = target_width / width
+            return 1.0 if abs(scale - 1) <= PREPROCESS_RESIZE_TOLERANCE else scale
+    elif policy != 'width':
+        raise ValueError(f"Unknown resize policy: {policy}")
+
+    target_width = PREPROCESS_TARGET_WIDTH
+    if width > target_width or width < target_width * 0.5:
+        return target_width / width
+    return 1.0
+
+
+def estimate_skew_angle(binary, max_dim=None):
+    """
+    Estimasi sudut kemiringan teks (derajat, dalam rentang -45..45) dari gambar biner.
+    Gambar diperkecil dulu ke sisi terpanjang max_dim (default DESKEW_MAX_DIM) sehingga
+    minAreaRect hanya menerima sebagian kecil titik foreground (cv2.findNonZero, int32),
+    bukan array N x 2 int64 berisi semua piksel.
+    """
+    max_dim = max_dim or DESKEW_MAX_DIM
+    h, w = binary.shape[:2]
+    scale = min(1.0, max_dim / max(h, w))
+    if scale < 1.0:
+        binary = cv2.resize(binary, (max(1, int(w * scale)), max(1, int(h * scale))),
+                            interpolation=cv2.INTER_NEAREST)
+
+    points = cv2.findNonZero(binary)
+    if points is None:
+        return 0.0
+    angle = cv2.minAreaRect(points)[-1]
+    # Rentang sudut minAreaRect berbeda antar versi OpenCV; normalisasi ke -45..45
+    angle = angle % 90
+    if angle > 45:
+        angle -= 90
+    return float(angle)
+
+
+def deskew(binary, tolerance=None, angle=None):
+    """
+    Luruskan gambar biner. Mengembalikan (gambar, sudut).
+    Jika |sudut| < tolerance (default DESKEW_ANGLE_TOLERANCE), gambar dikembalikan apa adanya
+    tanpa warpAffine. angle (opsional) dipakai langsung tanpa estimasi (misal sudut yang sama
+    untuk semua strip struk panjang).
+    """
+    tolerance = DESKEW_ANGLE_TOLERANCE if tolerance is None else tolerance
+    angle = estimate_skew_angle(binary) if angle is None else angle
+    if abs(angle) < tolerance:
+        return binary, angle
+
+    (h, w) = binary.shape[:2]
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    rotated = cv2.warpAffine(binary, M, (w, h),
+                             flags=cv2.INTER_CUBIC,
+                             borderMode=cv2.BORDER_REPLICATE)
+    return rotated, angle
+
+
+def resize_gray(gray, scale):
+    if scale == 1.0:
+        return gray
+    with timed('resize'):
+        return cv2.resize(gray, None, fx=scale, fy=scale,
+                          interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+
+
+def preprocess_pipeline(image, debug_sink=None, denoise_method=None, info=None, ocr_workers=None):
     """
     Pipeline preprocessing yang lebih kuat untuk gambar struk.
     Menambahkan langkah-langkah tambahan untuk kontras dan denoising.
+    image bisa berupa path, bytes, file-like atau NumPy array (lihat load_image).
+    Langkah setelah resize ada di binarize_receipt.
+    debug_sink (opsional) menerima tahap antara: gray, resized, denoised, variant_<nama> (jika
+    varian lain dicoba), thresholded, morphed, deskewed. Default NullDebugSink (tidak menyimpan apa pun).
+    denoise_method memilih denoiser dari DENOISERS (default DENOISE_METHOD).
+    info (dict, opsional) diisi metadata preprocessing: 'decode_reduction', 'text_height',
+    'resize_scale', 'binarization' (varian terpilih, lihat select_binarization) dan 'deskew_angle'.
+    ocr_workers membatasi thread OCR cadangan saat memilih varian binarisasi (default OCR_MAX_WORKERS).
     """
-    img = cv2.imread(image_path)
+    debug_sink = debug_sink or NullDebugSink()
+    info = {} if info is None else info
+    # Path/bytes didecode langsung ke grayscale, dengan reduksi resolusi untuk foto yang sangat besar
+    with timed('decode'):
+        img = load_image(image, grayscale=True, reduce_to_width=PREPROCESS_DECODE_MIN_WIDTH, info=info)
     if img is None:
-        print(f"Error: Gagal membaca gambar dari {image_path}")
+        logger.error("Gagal membaca gambar dari %s", describe_image_source(image))
         return None
 
-    height, width = img.shape[:2]
+    # 1. Konversi ke grayscale (hanya untuk input NumPy berwarna)
+    with timed('gray'):
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    debug_sink.add('gray', gray)
 
-    # 1. Resize gambar (opsional) - Tetap 1000 lebar target
-    target_width = 1000
-    if width > target_width or width < target_width * 0.5:
-        scale = target_width / width
-        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
-        height, width = img.shape[:2]
-
-    # 2. Konversi ke grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    # 3. Denoise (Fast Nl Means Denoising) - h=15 adalah titik awal yang baik
-    # Ini memberikan denoising yang moderat.
-    denoised = cv2.fastNlMeansDenoising(gray, h=15, templateWindowSize=7, searchWindowSize=21)
-
-    # 4. Adaptive Thresholding - Binarisasi gambar
-    # Parameter ini sangat penting. Kita akan gunakan set yang sebelumnya berhasil.
-    thresh = cv2.adaptiveThreshold(
-        denoised, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,  # Gaussian_C seringkali lebih baik dari Mean_C
-        cv2.THRESH_BINARY,              # Tetap THRESH_BINARY
-        21,                             # <--- blockSize=21 (yang menghasilkan teks "P1sang Juara")
-        10                              # <--- C=10 (yang menghasilkan teks "P1sang Juara")
-    )
-
-    # 5. Optional: Inverse (jika teks putih di latar belakang gelap)
-    # PENTING: BARIS INI AKAN DIKEMBALIKAN AKTIF, KARENA INI YANG MENGHASILKAN TEKS "P1sang Juara" SEBELUMNYA.
-    thresh = cv2.bitwise_not(thresh) # <--- AKTIFKAN BARIS INI (uncomment)
-
-    # 6. Morphological Operations (untuk membersihkan teks)
-    # Kernel (2,2) dan MORPH_OPEN sebelumnya menghasilkan teks "P1sang Juara"
-    kernel_morph = np.ones((2, 2), np.uint8) # <--- Ubah kernel ke (2,2)
-    cleaned_morph = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel_morph) # <--- Aktifkan MORPH_OPEN
+    # 2. Resize (skala dari tinggi karakter atau lebar target, lihat choose_resize_scale)
+    scale = choose_resize_scale(gray, info=info)
+    info['resize_scale'] = round(scale, 3)
+    gray = resize_gray(gray, scale)
+    debug_sink.add('resized', gray)
 
-    # Pastikan baris lain untuk cleaned_morph dikomentari/dihapus
-    # cleaned_morph = thresh
-    # cleaned_morph = cv2.dilate(thresh, kernel_morph, iterations=1)
+    return binarize_receipt(gray, debug_sink=debug_sink, denoise_method=denoise_method, info=info,
+                            ocr_workers=ocr_workers)
 
 
+def binarize_receipt(gray, debug_sink=None, denoise_method=None, info=None, deskew_angle=None, ocr_workers=None):
+    """
+    Tahap preprocessing setelah resize: denoise, binarisasi (select_binarization), morph open dan deskew.
+    Dipakai preprocess_pipeline (gambar utuh) dan mode streaming struk panjang (per strip,
+    dengan deskew_angle yang sama untuk semua strip).
+    """
+    debug_sink = debug_sink or NullDebugSink()
+    info = {} if info is None else info
+    # 3. Denoise (default Fast Nl Means Denoising, bisa diganti lewat denoise_method)
+    with timed(f"denoise_{denoise_method or DENOISE_METHOD}"):
+        denoised = denoise(gray, denoise_method)
+    debug_sink.add('denoised', denoised)
+
+    # 4-6. Binarisasi (threshold + inversi + morph open): varian default atau varian lain
+    # yang dipilih skor proxy / confidence OCR (lihat select_binarization)
+    # Durasi threshold dan morph per varian dicatat terpisah di binarize_variant
+    with timed('binarize'):
+        thresh, cleaned_morph, info['binarization'] = select_binarization(
+            denoised, deskew_angle=deskew_angle, debug_sink=debug_sink, ocr_workers=ocr_workers)
+    debug_sink.add('thresholded', thresh)
+    debug_sink.add('morphed', cleaned_morph)
+
     # 7. Deskew (perbaiki kemiringan)
-    coords = np.column_stack(np.where(cleaned_morph > 0))
-    if coords.shape[0] > 0:
-        angle = cv2.minAreaRect(coords)[-1]
-        if angle < -45:
-            angle = 90 + angle
-        (h, w) = cleaned_morph.shape[:2]
-        center = (w // 2, h // 2)
-        M = cv2.getRotationMatrix2D(center, angle, 1.0)
-        rotated = cv2.warpAffine(cleaned_morph, M, (w, h),
-                                 flags=cv2.INTER_CUBIC,
-                                 borderMode=cv2.BORDER_REPLICATE)
-    else:
-        rotated = cleaned_morph
+    with timed('deskew'):
+        rotated, angle = deskew(cleaned_morph, angle=deskew_angle)
+    logger.debug("Deskew angle: %.2f derajat", angle)
+    info['deskew_angle'] = angle
 
-    cv2.imwrite("preprocessed_output_debug.png", rotated) # Pastikan ini tetap aktif untuk debugging lokal
+    # Debug output sekarang opt-in lewat debug_sink (misal DirectoryDebugSink untuk debugging lokal)
+    debug_sink.add('deskewed', rotated)
     return rotated
 
-# --- 5. Fungsi Utama Pemrosesan Gambar (dipanggil dari app.py) ---
-def process_receipt_image(image_path):
+# --- 5. Fungsi OCR (backend + sweep PSM) ---
+def build_tesseract_config(psm):
+    return f'--oem 3 --psm {psm} -l {OCR_LANG} --dpi 300'
+
+
+class PytesseractBackend:
+    """Backend default: satu subprocess tesseract per panggilan (model dimuat ulang setiap kali)."""
+
+    name = 'pytesseract'
+
+    def image_to_data(self, image, psm):
+        return pytesseract.image_to_data(image, config=build_tesseract_config(psm),
+                                         output_type=pytesseract.Output.DICT)
+
+
+class TesserocrBackend:
+    """
+    Backend persisten via tesserocr (binding C API tesseract).
+    Satu PyTessBaseAPI per thread (API tesseract tidak thread-safe); traineddata
+    dimuat sekali lalu dipakai ulang lintas mode PSM dan request.
+    Output image_to_data memakai format dict yang sama dengan pytesseract.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, lang=None):
+        import tesserocr  # dependensi opsional
+        self._tesserocr = tesserocr
+        self.lang = lang or OCR_LANG
+        self._local = threading.local()
+
+    def _get_api(self):
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = self._tesserocr.PyTessBaseAPI(lang=self.lang, oem=self._tesserocr.OEM.DEFAULT)
+            api.SetVariable('user_defined_dpi', '300')
+            self._local.api = api
+        return api
+
+    def image_to_data(self, image, psm):
+        tesserocr = self._tesserocr
+        RIL = tesserocr.RIL
+        api = self._get_api()
+
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        api.SetPageSegMode(psm)
+        api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        api.Recognize()
+
+        data = {key: [] for key in ('block_num', 'par_num', 'line_num', 'word_num',
+                                    'left', 'top', 'width', 'height', 'conf', 'text')}
+        block_num = par_num = line_num = word_num = 0
+        iterator = api.GetIterator()
+        if iterator is not None:
+            for word in tesserocr.iterate_level(iterator, RIL.WORD):
+                if word.IsAtBeginningOf(RIL.BLOCK):
+                    block_num, par_num, line_num = block_num + 1, 0, 0
+                if word.IsAtBeginningOf(RIL.PARA):
+                    par_num, line_num = par_num + 1, 0
+                if word.IsAtBeginningOf(RIL.TEXTLINE):
+                    line_num, word_num = line_num + 1, 0
+                word_num += 1
+
+                text = word.GetUTF8Text(RIL.WORD) or ''
+                box = word.BoundingBox(RIL.WORD) or (0, 0, 0, 0)
+                data['block_num'].append(block_num)
+                data['par_num'].append(par_num)
+                data['line_num'].append(line_num)
+                data['word_num'].append(word_num)
+                data['left'].append(box[0])
+                data['top'].append(box[1])
+                data['width'].append(box[2] - box[0])
+                data['height'].append(box[3] - box[1])
+                data['conf'].append(word.Confidence(RIL.WORD))
+                data['text'].append(text)
+        api.Clear()
+        return data
+
+
+_ocr_backend = None
+_ocr_backend_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    """Backend OCR bersama per proses sesuai OCR_BACKEND (dibuat saat pertama kali dipakai)."""
+    global _ocr_backend
+    with _ocr_backend_lock:
+        if _ocr_backend is None:
+            if OCR_BACKEND == 'pytesseract':
+                _ocr_backend = PytesseractBackend()
+            elif OCR_BACKEND == 'tesserocr':
+                _ocr_backend = TesserocrBackend()
+            else:
+                # Pastikan engine benar-benar bisa diinisialisasi (traineddata tersedia)
+                try:
+                    backend = TesserocrBackend()
+                    backend._get_api()
+                    _ocr_backend = backend
+                except (ImportError, RuntimeError):
+                    _ocr_backend = PytesseractBackend()
+        return _ocr_backend
+
+
+def set_ocr_backend(backend):
+    """Ganti backend OCR (misal PytesseractBackend() untuk memaksa subprocess)."""
+    global _ocr_backend
+    with _ocr_backend_lock:
+        _ocr_backend = backend
+
+
+def build_ocr_layout(data, width=0):
+    """
+    Susun output image_to_data menjadi baris teks dengan bounding box dan confidence per kata.
+    Kata dikelompokkan per (block_num, par_num, line_num) lalu baris yang sejajar secara
+    vertikal digabung (PSM 11/12 sering memecah nama dan harga ke baris Tesseract berbeda).
+
+    Returns:
+        {'width': w, 'median_word_height': h, 'lines': [{'text', 'conf', 'bbox', 'words'}]}
+        dengan bbox = [left, top, right, bottom] dan words = [{'text', 'conf', 'bbox'}].
+    """
+    groups = OrderedDict()
+    for i, word_text in enumerate(data['text']):
+        word_text = word_text.strip()
+        if not word_text:
+            continue
+        left, top = int(data['left'][i]), int(data['top'][i])
+        word = {
+            'text': word_text,
+            'conf': float(data['conf'][i]),
+            'bbox': [left, top, left + int(data['width'][i]), top + int(data['height'][i])],
+        }
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        groups.setdefault(key, []).append(word)
+
+    raw_lines = sorted(groups.values(), key=lambda words: min(w['bbox'][1] for w in words))
+    heights = sorted(w['bbox'][3] - w['bbox'][1] for words in raw_lines for w in words)
+    median_height = heights[len(heights) // 2] if heights else 0
+
+    # Gabungkan baris yang tumpang tindih vertikal > 50% tinggi baris yang lebih kecil
+    rows = []
+    for words in raw_lines:
+        top = min(w['bbox'][1] for w in words)
+        bottom = max(w['bbox'][3] for w in words)
+        if rows:
+            row = rows[-1]
+            overlap = min(bottom, row['bottom']) - max(top, row['top'])
+            if overlap > 0.5 * min(bottom - top, row['bottom'] - row['top']):
+                row['words'].extend(words)
+                row['top'], row['bottom'] = min(top, row['top']), max(bottom, row['bottom'])
+                continue
+        rows.append({'words': list(words), 'top': top, 'bottom': bottom})
+
+    lines = []
+    for row in rows:
+        words = sorted(row['words'], key=lambda w: w['bbox'][0])
+        confs = [w['conf'] for w in words if w['conf'] != -1]
+        lines.append({
+            'text': ' '.join(w['text'] for w in words),
+            'conf': sum(confs) / len(confs) if confs else 0,
+            'bbox': [min(w['bbox'][0] for w in words), row['top'], max(w['bbox'][2] for w in words), row['bottom']],
+            'words': words,
+        })
+    if not width:
+        width = max((line['bbox'][2] for line in lines), default=0)
+    return {'width': width, 'median_word_height': median_height, 'lines': lines}
+
+
+def layout_text(layout):
+    """Teks per baris dari layout (dipisah newline)."""
+    return '\n'.join(line['text'] for line in layout['lines']) if layout else ''
+
+
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+
+def get_ocr_executor():
+    """Pool thread OCR bersama per proses (OCR_MAX_WORKERS thread, dibuat saat pertama kali dipakai)."""
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS, thread_name_prefix='ocr')
+        return _ocr_executor
+
+
+def _map_ocr(fn, preprocessed_img, items, max_workers):
+    """
+    fn(preprocessed_img, item) untuk tiap item, hasil sesuai urutan items.
+    Paralel di pool OCR bersama dengan paling banyak max_workers tugas berjalan untuk panggilan ini.
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(preprocessed_img, item) for item in items]
+    executor = get_ocr_executor()
+    results = [None] * len(items)
+    pending = {}
+    queue = list(enumerate(items))
+    while queue or pending:
+        while queue and len(pending) < max_workers:
+            index, item = queue.pop(0)
+            pending[submit_in_context(executor, fn, preprocessed_img, item)] = index
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+    return results
+
+
+def warm_up_ocr(threads=None):
+    """
+    Jalankan satu OCR dummy di thread pemanggil dan di `threads` thread pool OCR (default
+    OCR_MAX_WORKERS), supaya traineddata (tesserocr) atau binary tesseract + page cache
+    (pytesseract) sudah siap sebelum request pertama. threads <= 1 (OCR per request berjalan
+    di thread pemanggil, lihat _map_ocr) hanya me-warm-up thread pemanggil supaya pool tidak
+    membuat engine yang tidak pernah dipakai. Mengembalikan jumlah thread yang di-warm-up.
+    """
+    dummy = np.zeros((60, 320), np.uint8)
+    cv2.putText(dummy, 'TOTAL 12.500', (5, 42), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 255, 2)
+    backend = get_ocr_backend()
+    backend.image_to_data(dummy, PSM_MODES[0])
+    threads = OCR_MAX_WORKERS if threads is None else min(threads, OCR_MAX_WORKERS)
+    if threads <= 1:
+        return 1
+
+    # Barrier memaksa tiap tugas berjalan di thread berbeda (pool membuat thread baru selama
+    # tidak ada yang idle), jadi setiap thread memuat engine-nya sendiri
+    barrier = threading.Barrier(threads)
+
+    def warm_thread():
+        backend.image_to_data(dummy, PSM_MODES[0])
+        try:
+            barrier.wait(timeout=30)
+        except threading.BrokenBarrierError:
+            pass
+
+    futures = [get_ocr_executor().submit(warm_thread) for _ in range(threads)]
+    for future in futures:
+        future.result()
+    return threads + 1
+
+
+def run_psm(preprocessed_img, psm):
+    """
+    Jalankan satu pass OCR dengan PSM tertentu.
+    Mengembalikan tuple (avg_confidence, text, layout); text = baris-baris layout dipisah newline.
+    Jika tidak ada teks, avg_confidence = None.
+    """
+    with timed(f"ocr_psm{psm}"):
+        data = get_ocr_backend().image_to_data(preprocessed_img, psm)
+    layout = build_ocr_layout(data, width=preprocessed_img.shape[1])
+    current_text = layout_text(layout)
+    if not current_text:
+        return None, current_text, layout
+
+    confs = [float(conf) for conf in data['conf'] if float(conf) != -1]
+    avg_confidence = sum(confs) / len(confs) if confs else 0
+    return avg_confidence, current_text, layout
+
+
+def _run_psm_safe(preprocessed_img, psm):
+    try:
+        return run_psm(preprocessed_img, psm)
+    except Exception as e_inner:
+        logger.warning("OCR failed for PSM %s with error: %s", psm, e_inner)
+        return None, "", None
+
+
+def run_psm_sweep(preprocessed_img, psm_modes=None, max_workers=None):
+    """
+    Jalankan OCR untuk semua mode PSM secara paralel lalu pilih hasil dengan
+    rata-rata confidence tertinggi.
+    Pemenang sama dengan loop serial sebelumnya: hasil dibandingkan sesuai urutan
+    psm_modes dan hanya diganti jika confidence-nya lebih besar (bukan sama).
+
+    Returns:
+        (best_text, best_confidence, best_psm, psm_scores, best_layout) dengan psm_scores berisi
+        {psm: avg_confidence atau None jika gagal/kosong}.
+    """
+    psm_modes = list(psm_modes or PSM_MODES)
+    max_workers = OCR_MAX_WORKERS if max_workers is None else max_workers
+
+    results = _map_ocr(_run_psm_safe, preprocessed_img, psm_modes, max_workers)
+
+    best_text = ""
+    best_psm = None
+    best_layout = None
+    max_confidence_score = -1
+    psm_scores = {}
+    for psm, (avg_confidence, current_text, layout) in zip(psm_modes, results):
+        psm_scores[psm] = avg_confidence
+        if avg_confidence is not None and avg_confidence > max_confidence_score:
+            max_confidence_score = avg_confidence
+            best_text = current_text
+            best_psm = psm
+            best_layout = layout
+
+    return best_text, max_confidence_score, best_psm, psm_scores, best_layout
+
+
+class PsmWinStats:
+    """
+    Statistik kemenangan per mode PSM yang disimpan lintas request (thread-safe).
+    Dipakai strategi adaptive untuk menjalankan mode yang paling sering menang lebih dulu.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._wins = {}
+        self._early_exits = {}
+
+    def record_run(self, psm):
+        with self._lock:
+            self._runs[psm] = self._runs.get(psm, 0) + 1
+
+    def record_win(self, psm, early_exit=False):
+        with self._lock:
+            self._wins[psm] = self._wins.get(psm, 0) + 1
+            if early_exit:
+                self._early_exits[psm] = self._early_exits.get(psm, 0) + 1
+
+    def ordered(self, psm_modes):
+        """Urutkan mode berdasarkan jumlah menang (terbanyak dulu); seri tetap pakai urutan asal."""
+        with self._lock:
+            wins = dict(self._wins)
+        return sorted(psm_modes, key=lambda psm: -wins.get(psm, 0))
+
+    def snapshot(self):
+        with self._lock:
+            modes = sorted(set(self._runs) | set(self._wins))
+            return {
+                psm: {
+                    'runs': self._runs.get(psm, 0),
+                    'wins': self._wins.get(psm, 0),
+                    'early_exits': self._early_exits.get(psm, 0),
+                }
+                for psm in modes
+            }
+
+    def reset(self):
+        with self._lock:
+            self._runs.clear()
+            self._wins.clear()
+            self._early_exits.clear()
+
+    def restore(self, snapshot):
+        """Kembalikan statistik ke hasil snapshot() sebelumnya."""
+        with self._lock:
+            self._runs = {psm: counts['runs'] for psm, counts in snapshot.items() if counts['runs']}
+            self._wins = {psm: counts['wins'] for psm, counts in snapshot.items() if counts['wins']}
+            self._early_exits = {psm: counts['early_exits'] for psm, counts in snapshot.items()
+                                 if counts['early_exits']}
+
+
+psm_stats = PsmWinStats()
+
+
+def get_psm_stats():
+    """Statistik PSM saat ini beserta urutan yang akan dipakai strategi adaptive."""
+    return {'modes': psm_stats.snapshot(), 'order': psm_stats.ordered(PSM_MODES)}
+
+
+def run_psm_adaptive(preprocessed_img, psm_modes=None, confidence_target=None, max_workers=None, stats=None):
+    """
+    Pemilihan PSM adaptif:
+    - Mode dijalankan sesuai urutan statistik kemenangan (mode yang biasa menang dulu).
+    - Mode pertama dijalankan sendiri, sisanya per batch max_workers mode paralel
+      (max_workers=1: satu per satu).
+    - Setelah setiap batch, hasil dibaca per mode sesuai urutan; begitu hasil terbaik sejauh ini
+      mencapai confidence_target, berhenti dan sisa hasil batch itu diabaikan. Pemenang, psm_scores
+      dan statistik jadi sama persis dengan menjalankan mode satu per satu, tidak bergantung
+      max_workers (yang tidak ikut cache key). Jika tidak ada yang mencapai target, hasil terbaik
+      semua mode dipilih.
+
+    Returns: sama dengan run_psm_sweep.
+    """
+    stats = psm_stats if stats is None else stats
+    confidence_target = OCR_CONFIDENCE_TARGET if confidence_target is None else confidence_target
+    max_workers = max(1, OCR_MAX_WORKERS if max_workers is None else max_workers)
+    ordered_modes = stats.ordered(list(psm_modes or PSM_MODES))
+    batches = [ordered_modes[:1]] + [ordered_modes[i:i + max_workers]
+                                     for i in range(1, len(ordered_modes), max_workers)]
+
+    best_text, max_confidence_score, best_psm, best_layout = "", -1, None, None
+    psm_scores = {}
+    for batch in batches:
+        results = _map_ocr(_run_psm_safe, preprocessed_img, batch, max_workers)
+        for psm, (confidence, text, layout) in zip(batch, results):
+            stats.record_run(psm)
+            psm_scores[psm] = confidence
+            # Hanya diganti jika lebih besar: seri tetap dimenangkan mode yang urutannya lebih dulu
+            if confidence is not None and confidence > max_confidence_score:
+                best_text, max_confidence_score, best_psm, best_layout = text, confidence, psm, layout
+            if best_psm is not None and max_confidence_score >= confidence_target:
+                stats.record_win(best_psm, early_exit=True)
+                return best_text, max_confidence_score, best_psm, psm_scores, best_layout
+
+    if best_psm is not None:
+        stats.record_win(best_psm)
+    return best_text, max_confidence_score, best_psm, psm_scores, best_layout
+
+
+def detect_text_lines(binary):
+    """
+    Deteksi baris teks pada gambar biner hasil preprocess_pipeline (teks = foreground > 0).
+    Connected components yang tidak berukuran karakter (tepi kertas, noise kecil) dibuang,
+    lalu baris = rentang vertikal berurutan yang memuat komponen karakter.
+    Mengembalikan list [left, top, right, bottom] berurutan dari atas.
+    """
+    h, w = binary.shape[:2]
+    _, labels, stats, _ = cv2.connectedComponentsWithStats((binary > 0).astype(np.uint8), connectivity=8)
+    mask = _char_components(stats, h, w)[labels]
+
+    text_rows = np.append(mask.any(axis=1), False)
+    lines = []
+    top = None
+    for y, is_text in enumerate(text_rows):
+        if is_text and top is None:
+            top = y
+        elif not is_text and top is not None:
+            if y - top >= ROI_MIN_CHAR_HEIGHT:
+                cols = np.flatnonzero(mask[top:y].any(axis=0))
+                lines.append([int(cols[0]), top, int(cols[-1]) + 1, y])
+            top = None
+    return lines
+
+
+def detect_text_bands(binary):
+    """
+    Kelompokkan baris teks menjadi pita 'header', 'items', dan 'totals' berdasarkan posisi
+    vertikal di dalam area teks (ROI_HEADER_FRACTION / ROI_TOTALS_FRACTION).
+    Mengembalikan list {'name', 'bbox', 'lines'}; pita tanpa baris dilewati.
+    """
+    lines = detect_text_lines(binary)
+    if not lines:
+        return []
+    text_top, text_bottom = lines[0][1], lines[-1][3]
+    header_limit = text_top + ROI_HEADER_FRACTION * (text_bottom - text_top)
+    totals_limit = text_bottom - ROI_TOTALS_FRACTION * (text_bottom - text_top)
+
+    grouped = OrderedDict((name, []) for name in ('header', 'items', 'totals'))
+    for line in lines:
+        if line[1] < header_limit:
+            grouped['header'].append(line)
+        elif line[1] >= totals_limit:
+            grouped['totals'].append(line)
+        else:
+            grouped['items'].append(line)
+
+    bands = []
+    for name, band_lines in grouped.items():
+        if band_lines:
+            bbox = [min(l[0] for l in band_lines), band_lines[0][1],
+                    max(l[2] for l in band_lines), band_lines[-1][3]]
+            bands.append({'name': name, 'bbox': bbox, 'lines': len(band_lines)})
+    return bands
+
+
+def _shift_layout(layout, dx, dy):
+    for line in layout['lines']:
+        line['bbox'] = [line['bbox'][0] + dx, line['bbox'][1] + dy, line['bbox'][2] + dx, line['bbox'][3] + dy]
+        for word in line['words']:
+            word['bbox'] = [word['bbox'][0] + dx, word['bbox'][1] + dy, word['bbox'][2] + dx, word['bbox'][3] + dy]
+    return layout
+
+
+def _ocr_band(preprocessed_img, band):
+    left, top, right, bottom = band['bbox']
+    # Pita satu baris -> PSM 7 (single line), lebih dari satu -> PSM 6 (satu blok teks)
+    psm = 7 if band['lines'] == 1 else 6
+    crop = cv2.copyMakeBorder(preprocessed_img[top:bottom, left:right], ROI_PADDING, ROI_PADDING,
+                              ROI_PADDING, ROI_PADDING, cv2.BORDER_CONSTANT, value=0)
+    try:
+        with timed(f"ocr_roi_{band['name']}"):
+            data = get_ocr_backend().image_to_data(crop, psm)
+    except Exception as e_inner:
+        logger.warning("OCR failed for band %s (PSM %s) with error: %s", band['name'], psm, e_inner)
+        return psm, [], None
+    layout = _shift_layout(build_ocr_layout(data, width=crop.shape[1]), left - ROI_PADDING, top - ROI_PADDING)
+    confs = [float(conf) for conf in data['conf'] if float(conf) != -1]
+    return psm, confs, layout
+
+
+def run_roi_ocr(preprocessed_img, max_workers=None):
+    """
+    OCR per region: deteksi pita header/items/totals (detect_text_bands), crop, lalu OCR
+    tiap pita sekali secara paralel dengan PSM 7 atau 6. Tesseract hanya memproses piksel
+    teks, bukan seluruh halaman lima kali.
+
+    Returns: sama dengan run_psm_sweep; best_psm = 'roi', psm_scores = {nama_pita: confidence},
+    dan layout['bands'] berisi bbox/PSM/confidence/teks per pita. Pita hanya dilaporkan (diagnostik):
+    ekstraksi tetap membaca layout['lines'] (baris semua pita, urut dari atas) seperti strategi lain,
+    jadi re-ekstraksi dari ocr_store (yang tidak menyimpan pita) memberi hasil yang sama.
+    """
+    bands = detect_text_bands(preprocessed_img)
+    if not bands:
+        return "", -1, None, {}, None
+
+    max_workers = OCR_MAX_WORKERS if max_workers is None else max_workers
+    results = _map_ocr(_ocr_band, preprocessed_img, bands, max_workers)
+
+    all_confs = []
+    scores = {}
+    layout = {'width': preprocessed_img.shape[1], 'median_word_height': 0, 'lines': [], 'bands': []}
+    for band, (psm, confs, band_layout) in zip(bands, results):
+        band_conf = sum(confs) / len(confs) if confs else None
+        scores[band['name']] = band_conf
+        all_confs.extend(confs)
+        layout['bands'].append({'name': band['name'], 'bbox': band['bbox'], 'psm': psm, 'conf': band_conf,
+                                'text': layout_text(band_layout)})
+        if band_layout:
+            layout['lines'].extend(band_layout['lines'])
+            layout['median_word_height'] = max(layout['median_word_height'], band_layout['median_word_height'])
+
+    text = layout_text(layout)
+    if not text:
+        return "", -1, None, scores, None
+    avg_confidence = sum(all_confs) / len(all_confs) if all_confs else 0
+    return text, avg_confidence, 'roi', scores, layout
+
+
+OCR_STRATEGIES = {
+    'adaptive': lambda img, psm_modes, confidence_target, workers: run_psm_adaptive(
+        img, psm_modes, confidence_target, workers),
+    'sweep': lambda img, psm_modes, confidence_target, workers: run_psm_sweep(img, psm_modes, workers),
+    'roi': lambda img, psm_modes, confidence_target, workers: run_roi_ocr(img, workers),
+}
+
+
+def run_ocr_strategy(preprocessed_img, psm_strategy=None, psm_modes=None, confidence_target=None, max_workers=None):
+    """Jalankan OCR sesuai strategi (OCR_STRATEGIES); return sama dengan run_psm_sweep."""
+    return OCR_STRATEGIES[psm_strategy or OCR_PSM_STRATEGY](preprocessed_img, psm_modes, confidence_target,
+                                                             max_workers)
+
+
+def clean_ocr_text(raw_text):
+    """Rapikan spasi dan karakter noise per baris; baris kosong dibuang, newline dipertahankan."""
+    clean_lines = (OCR_NOISE_CHARS_RE.sub('', HORIZONTAL_SPACE_RE.sub(' ', line)).strip()
+                   for line in raw_text.strip().split('\n'))
+    return '\n'.join(line for line in clean_lines if line)
+
+
+def get_extractor_version():
+    """Versi hasil ekstraksi: EXTRACTOR_VERSION + versi leksikon merchant (isi merchants.txt)."""
+    return f"{EXTRACTOR_VERSION}:{get_default_lexicon().version}"
+
+
+def extract_from_layout(layout, raw_text=None):
+    """
+    Tahap setelah OCR: teks per baris dari layout -> clean_ocr_text -> extract_entities_rule_based.
+    Dipakai pipeline utama dan re-ekstraksi dari hasil OCR tersimpan (reextract.py), sehingga
+    hasilnya sama tanpa OCR ulang. Mengembalikan field ekstraksi + 'raw_text' dan 'layout'.
+    """
+    raw_text = layout_text(layout) if raw_text is None else raw_text
+    # Post-processing per baris, newline dipertahankan supaya fallback berbasis baris berjalan
+    clean_text = clean_ocr_text(raw_text)
+    logger.debug("Clean text before extraction:\n%s", clean_text)
+    extracted_data = extract_entities_rule_based(clean_text, layout=layout)
+    extracted_data['raw_text'] = raw_text
+    extracted_data['layout'] = layout
+    return extracted_data
+
+
+def get_pipeline_config(psm_modes=None, psm_strategy=None, confidence_target=None, denoise_method=None,
+                        stream=None):
+    """
+    Parameter preprocessing + OCR + versi extractor yang memengaruhi hasil process_receipt_image.
+    Dipakai sebagai bagian dari cache key (lihat cache.py), termasuk tier SQLite yang bertahan
+    setelah restart: perubahan aturan ekstraksi (EXTRACTOR_VERSION) atau leksikon merchant
+    membuat key baru sehingga hasil lama tidak dipakai lagi.
     """
-    Fungsi utama dengan konfigurasi OCR yang dioptimalkan
+    return {
+        'target_width': PREPROCESS_TARGET_WIDTH,
+        'resize_policy': PREPROCESS_RESIZE_POLICY,
+        'target_text_height': PREPROCESS_TARGET_TEXT_HEIGHT,
+        'width_range': [PREPROCESS_MIN_WIDTH, PREPROCESS_MAX_WIDTH],
+        'decode_min_width': PREPROCESS_DECODE_MIN_WIDTH,
+        'denoise_h': DENOISE_H,
+        'denoise_method': denoise_method or DENOISE_METHOD,
+        'denoise_noise_threshold': DENOISE_NOISE_THRESHOLD,
+        'thresh_block_size': THRESH_BLOCK_SIZE,
+        'thresh_c': THRESH_C,
+        'binarize': [list(BINARIZE_VARIANTS), BINARIZE_PROXY_CONFIDENT, BINARIZE_PROXY_TOLERANCE,
+                     BINARIZE_OCR_CANDIDATES, BINARIZE_MAX_FOREGROUND, THRESH_LARGE_BLOCK_SIZE,
+                     SAUVOLA_WINDOW, SAUVOLA_K],
+        'deskew_max_dim': DESKEW_MAX_DIM,
+        'deskew_angle_tolerance': DESKEW_ANGLE_TOLERANCE,
+        'psm_modes': list(psm_modes or PSM_MODES),
+        'ocr_lang': OCR_LANG,
+        'ocr_backend': get_ocr_backend().name,
+        'text_layout': 'lines',
+        'roi': [ROI_HEADER_FRACTION, ROI_TOTALS_FRACTION, ROI_PADDING],
+        'psm_strategy': psm_strategy or OCR_PSM_STRATEGY,
+        'stream': [stream, STREAM_MIN_ASPECT_RATIO, STREAM_STRIP_HEIGHT, STREAM_STRIP_OVERLAP],
+        'confidence_target': OCR_CONFIDENCE_TARGET if confidence_target is None else confidence_target,
+        'extractor_version': get_extractor_version(),
+    }
+
+
+# --- 6. Fungsi Utama Pemrosesan Gambar (dipanggil dari app.py) ---
+def process_receipt_image(image, psm_modes=None, ocr_workers=None, psm_strategy=None,
+                          confidence_target=None, debug_sink=None, denoise_method=None, progress_callback=None,
+                          duplicate_lookup=None, stream=None, on_strip=None):
     """
-    print(f"Memproses gambar: {image_path}")
+    Fungsi utama dengan konfigurasi OCR yang dioptimalkan.
+    image bisa berupa path, bytes, file-like atau NumPy array.
+    Parameter OCR opsional; default ke PSM_MODES, OCR_MAX_WORKERS, OCR_PSM_STRATEGY
+    dan OCR_CONFIDENCE_TARGET. debug_sink dan denoise_method diteruskan ke preprocess_pipeline.
+    progress_callback (opsional) dipanggil dengan nama tahap: 'preprocess', 'ocr', 'extract'.
+    duplicate_lookup (opsional) dipanggil dengan gambar hasil preprocessing; jika mengembalikan
+    dict hasil (near-duplicate, lihat dedup.py), OCR dan ekstraksi dilewati dan hasil itu dipakai.
+    stream: None = otomatis untuk gambar dengan tinggi/lebar >= STREAM_MIN_ASPECT_RATIO, True/False
+    memaksa mode streaming strip (lihat _process_long_receipt; debug_sink dan duplicate_lookup
+    tidak dipakai di mode ini). on_strip (opsional) menerima event per strip yang selesai.
+    Durasi tiap tahap dicatat di result['trace'] dan di histogram metrics.stage_metrics.
+    """
+    if hasattr(image, 'read'):
+        image = image.read()  # dibaca sekali: ukuran header dicek dulu untuk memilih mode
+    if stream is None:
+        aspect_ratio = image_aspect_ratio(image)
+        stream = aspect_ratio is not None and aspect_ratio >= STREAM_MIN_ASPECT_RATIO
+
+    with start_trace() as trace:
+        with timed('total'):
+            if stream:
+                result = _process_long_receipt(image, psm_modes, ocr_workers, psm_strategy, confidence_target,
+                                               denoise_method, progress_callback, on_strip)
+            else:
+                result = _process_receipt_image(image, psm_modes, ocr_workers, psm_strategy, confidence_target,
+                                                debug_sink, denoise_method, progress_callback, duplicate_lookup)
+    result['trace'] = trace.to_dict()
+    return result
+
+
+def _process_receipt_image(image, psm_modes, ocr_workers, psm_strategy, confidence_target,
+                           debug_sink, denoise_method, progress_callback, duplicate_lookup):
+    report_progress = progress_callback or (lambda stage: None)
+    logger.info("Memproses gambar: %s", describe_image_source(image))
     # 1. Preprocessing
-    preprocessed_img = preprocess_pipeline(image_path)
+    report_progress('preprocess')
+    preprocess_info = {}
+    with timed('preprocess'):
+        preprocessed_img = preprocess_pipeline(image, debug_sink=debug_sink, denoise_method=denoise_method,
+                                               info=preprocess_info, ocr_workers=ocr_workers)
     if preprocessed_img is None:
         return {"error": "Gagal melakukan preprocessing gambar."}
 
-    # 2. OCR dengan konfigurasi yang dioptimalkan
+    if duplicate_lookup is not None:
+        with timed('duplicate_lookup'):
+            duplicate = duplicate_lookup(preprocessed_img)
+        if duplicate is not None:
+            return duplicate
+
+    # 2. OCR dengan konfigurasi yang dioptimalkan (adaptive: early-exit, sweep: semua PSM paralel)
+    report_progress('ocr')
+    psm_strategy = psm_strategy or OCR_PSM_STRATEGY
+    if psm_strategy not in OCR_STRATEGIES:
+        return {"error": f"Unknown PSM strategy: {psm_strategy}"}
     try:
-        psm_modes = [6, 3, 4, 11, 12]  # Try more PSM modes for better results
-        best_text = ""
-        max_confidence_score = -1
-
-        for psm in psm_modes:
-            config = f'--oem 3 --psm {psm} -l eng+ind --dpi 300'
-            try:
-                data = pytesseract.image_to_data(preprocessed_img, config=config, output_type=pytesseract.Output.DICT)
-                current_text = " ".join([word for word in data['text'] if word.strip() != ''])
-
-                if current_text:
-                    total_conf = sum([float(conf) for conf in data['conf'] if float(conf) != -1])
-                    num_words = sum([1 for conf in data['conf'] if float(conf) != -1])
-                    avg_confidence = total_conf / num_words if num_words > 0 else 0
-
-                    if avg_confidence > max_confidence_score:
-                        max_confidence_score = avg_confidence
-                        best_text = current_text
-            except Exception as e_inner:
-                print(f"Warning: OCR failed for PSM {psm} with error: {e_inner}")
-                continue
+        with timed('ocr'):
+            best_text, max_confidence_score, best_psm, psm_scores, best_layout = run_ocr_strategy(
+                preprocessed_img, psm_strategy, psm_modes, confidence_target, ocr_workers)
 
         raw_text = best_text
-        print(f"Raw text from OCR (best_psm): \n{raw_text[:500]}...")
+        logger.debug("Raw text from OCR (PSM %s):\n%s", best_psm, raw_text)
 
         if not raw_text.strip():
             return {"error": "OCR did not detect any text on the image."}
@@ -669,14 +2099,221 @@ def process_receipt_image(image_path):
     except Exception as e:
         return {"error": f"An error occurred during OCR: {str(e)}"}
 
-    # 3. Post-processing text
-    clean_text = raw_text.strip()
-    clean_text = re.sub(r'\s+', ' ', clean_text)
-    clean_text = re.sub(r'[^\w\s.,:/$\-Rp]', '', clean_text)
+    # 3-4. Post-processing text lalu extract entities
+    report_progress('extract')
+    with timed('extract'):
+        extracted_data = extract_from_layout(best_layout, raw_text)
+    extracted_data['ocr'] = {'psm': best_psm, 'confidence': max_confidence_score, 'psm_scores': psm_scores,
+                             'strategy': psm_strategy}
+    extracted_data['preprocess'] = preprocess_info
+    return extracted_data
 
-    print(f"Clean text before extraction: \n{clean_text[:500]}...")
 
-    # 4. Extract entities
-    extracted_data = extract_entities_rule_based(clean_text)
-    extracted_data['raw_text'] = raw_text
-    return extracted_data
\ No newline at end of file
+# --- 7. Mode Streaming untuk Struk Panjang (strip vertikal) ---
+def image_aspect_ratio(image):
+    """Tinggi/lebar gambar dari header (path/bytes) atau shape (NumPy) tanpa decode penuh; None jika gagal."""
+    if isinstance(image, np.ndarray):
+        height, width = image.shape[:2]
+    else:
+        size = peek_image_size(image)
+        if not size:
+            return None
+        width, height = size
+    return height / width if width else None
+
+
+def iter_strip_bounds(height, strip_height=None, overlap=None):
+    """(top, bottom) strip horizontal yang saling overlap dan menutupi 0..height."""
+    strip_height = strip_height or STREAM_STRIP_HEIGHT
+    overlap = STREAM_STRIP_OVERLAP if overlap is None else overlap
+    if overlap >= strip_height:
+        raise ValueError("Overlap strip harus lebih kecil dari tinggi strip")
+    top = 0
+    while True:
+        bottom = min(top + strip_height, height)
+        yield top, bottom
+        if bottom >= height:
+            return
+        top += strip_height - overlap
+
+
+def cut_strips(gray, strip_height=None, overlap=None):
+    """
+    Potong gambar (sudah di-resize) menjadi strip yang overlap, masing-masing dikompresi PNG.
+    Mengembalikan list ((top, bottom), png_bytes); gambar utuh boleh dilepas setelahnya.
+    """
+    params = [cv2.IMWRITE_PNG_COMPRESSION, STREAM_STRIP_PNG_COMPRESSION]
+    strips = []
+    for top, bottom in iter_strip_bounds(gray.shape[0], strip_height, overlap):
+        ok, encoded = cv2.imencode('.png', gray[top:bottom], params)
+        if not ok:
+            raise ValueError("Gagal mengompresi strip")
+        strips.append(((top, bottom), encoded.tobytes()))
+    return strips
+
+
+def _ocr_strip(strip, deskew_angle, ocr_args, denoise_method):
+    """Decode, binarisasi dan OCR satu strip dari cut_strips; bbox layout digeser ke koordinat struk utuh."""
+    bounds, png_bytes = strip
+    gray = cv2.imdecode(np.frombuffer(png_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    ocr_workers = ocr_args[-1]  # (psm_strategy, psm_modes, confidence_target, ocr_workers)
+    binary = binarize_receipt(gray, denoise_method=denoise_method, deskew_angle=deskew_angle,
+                              ocr_workers=ocr_workers)
+    text, confidence, psm, _, layout = run_ocr_strategy(binary, *ocr_args)
+    if layout:
+        _shift_layout(layout, 0, bounds[0])
+    return {'bounds': bounds, 'confidence': confidence, 'psm': psm, 'layout': layout}
+
+
+def estimate_gray_skew_angle(gray, max_dim=None):
+    """
+    Sudut kemiringan seluruh struk dari gambar grayscale yang diperkecil (Otsu, teks = foreground).
+    Untuk mode strip: minAreaRect pada satu strip selalu ~0 karena strip terpotong horizontal,
+    jadi sudut diestimasi sekali dari gambar utuh lalu dipakai semua strip.
+    """
+    max_dim = max_dim or DESKEW_MAX_DIM
+    h, w = gray.shape[:2]
+    scale = min(1.0, max_dim / max(h, w))
+    small = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return estimate_skew_angle(binary, max_dim)
+
+
+def _iter_strip_results(process_strip, strips, max_workers):
+    """Hasil strip sesuai urutan; paralel dengan paling banyak max_workers strip di memori sekaligus."""
+    if max_workers <= 1:
+        for strip in strips:
+            yield process_strip(strip)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr-strip') as executor:
+        pending = []
+        for strip in strips:
+            pending.append(submit_in_context(executor, process_strip, strip))
+            if len(pending) >= max_workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def _owned_lines(layout, bounds, overlap, height, previous_bottom=None):
+    """
+    Baris yang "dimiliki" strip ini: pusat vertikalnya di antara tengah overlap atas dan bawah.
+    Batas dihitung dalam koordinat integer yang sama untuk kedua strip tetangga (batas bawah strip
+    ini = batas atas strip berikutnya). Posisi baris yang sama bisa bergeser sedikit antar strip
+    (threshold/deskew per strip), jadi di zona +-overlap/4 sekitar batas atas sebuah baris diambil
+    hanya jika pusatnya di bawah tepi bawah baris terakhir strip sebelumnya (previous_bottom):
+    baris di sekitar batas tidak hilang dan tidak terhitung dua kali.
+    """
+    top, bottom = bounds
+    upper = bottom - overlap + overlap // 2 if bottom < height else bottom
+    if top == 0:
+        return [line for line in layout['lines'] if (line['bbox'][1] + line['bbox'][3]) / 2 < upper]
+    lower = top + overlap // 2
+    slack = overlap // 4
+    owned = []
+    for line in layout['lines']:
+        center = (line['bbox'][1] + line['bbox'][3]) / 2
+        if center >= upper or center < lower - slack:
+            continue
+        if center < lower + slack and previous_bottom is not None and center <= previous_bottom:
+            continue
+        owned.append(line)
+    return owned
+
+
+def _process_long_receipt(image, psm_modes, ocr_workers, psm_strategy, confidence_target,
+                          denoise_method, progress_callback, on_strip):
+    """
+    Mode streaming untuk struk yang sangat panjang: gambar grayscale di-resize sekali, dipotong
+    menjadi strip horizontal (STREAM_STRIP_HEIGHT, overlap STREAM_STRIP_OVERLAP) yang disimpan
+    terkompresi (cut_strips), lalu gambar utuh dilepas. Strip didecode, dibinarisasi dan di-OCR
+    satu per satu (atau STREAM_MAX_WORKERS sekaligus), jadi memori kerja (NLM, threshold, OCR)
+    sebanding dengan satu strip, bukan panjang struk.
+    Sudut deskew diestimasi sekali dari gambar utuh yang diperkecil dan dipakai semua strip.
+    Baris dari strip yang overlap digabung tanpa duplikat (_owned_lines). Setiap strip selesai,
+    on_strip menerima {'strip', 'bounds', 'lines', 'items'} dengan items = item dari baris baru strip itu.
+    """
+    report_progress = progress_callback or (lambda stage: None)
+    psm_strategy = psm_strategy or OCR_PSM_STRATEGY
+    if psm_strategy not in OCR_STRATEGIES:
+        return {"error": f"Unknown PSM strategy: {psm_strategy}"}
+    logger.info("Memproses struk panjang (streaming): %s", describe_image_source(image))
+
+    report_progress('preprocess')
+    preprocess_info = {}
+    with timed('decode'):
+        img = load_image(image, grayscale=True, reduce_to_width=PREPROCESS_DECODE_MIN_WIDTH, info=preprocess_info)
+    if img is None:
+        logger.error("Gagal membaca gambar dari %s", describe_image_source(image))
+        return {"error": "Gagal melakukan preprocessing gambar."}
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    del img
+
+    # Skala resize diestimasi dari potongan tengah (maks 3x lebar), berlaku untuk semua strip
+    source_height, source_width = gray.shape
+    sample_top = max(0, source_height // 2 - source_width * 3 // 2)
+    scale = choose_resize_scale(gray[sample_top:sample_top + source_width * 3], info=preprocess_info)
+    preprocess_info['resize_scale'] = round(scale, 3)
+    with timed('deskew_estimate'):
+        deskew_angle = estimate_gray_skew_angle(gray)
+    preprocess_info['deskew_angle'] = deskew_angle
+    # Resize sekali untuk seluruh struk: koordinat strip yang overlap identik (tanpa pembulatan per
+    # strip). Setelah dipotong, hanya strip terkompresi yang disimpan selama OCR.
+    gray = resize_gray(gray, scale)
+    height, width = gray.shape
+    with timed('cut_strips'):
+        strips = cut_strips(gray)
+    del gray
+    preprocess_info['strips'] = len(strips)
+
+    report_progress('ocr')
+    ocr_args = (psm_strategy, psm_modes, confidence_target, ocr_workers)
+    layout = {'width': width, 'median_word_height': 0, 'lines': []}
+    psm_scores = {}
+    weighted_conf = word_count = 0
+    items_ended = False
+
+    def process_strip(strip):
+        return _ocr_strip(strip, deskew_angle, ocr_args, denoise_method)
+
+    try:
+        for index, strip in enumerate(_iter_strip_results(process_strip, strips, STREAM_MAX_WORKERS)):
+            strips[index] = None  # strip terkompresi tidak dibutuhkan lagi
+            psm_scores[f"strip_{index}"] = strip['confidence'] if strip['psm'] is not None else None
+            owned = []
+            if strip['layout']:
+                previous_bottom = layout['lines'][-1]['bbox'][3] if layout['lines'] else None
+                owned = _owned_lines(strip['layout'], strip['bounds'], STREAM_STRIP_OVERLAP, height,
+                                     previous_bottom)
+                layout['median_word_height'] = max(layout['median_word_height'],
+                                                   strip['layout']['median_word_height'])
+            layout['lines'].extend(owned)
+            for line in owned:
+                words = len(line['words'])
+                weighted_conf += line['conf'] * words
+                word_count += words
+
+            if on_strip is not None:
+                # Hanya baris baru strip ini; setelah baris penutup daftar item (total dst) tidak ada item lagi
+                new_items = [] if items_ended else extract_items_from_layout({**layout, 'lines': owned})
+                items_ended = items_ended or any(ITEM_END_RE.search(line['text'].lower()) for line in owned)
+                on_strip({'strip': index, 'bounds': list(strip['bounds']), 'lines': [line['text'] for line in owned],
+                          'items': new_items})
+    except pytesseract.TesseractNotFoundError:
+        return {"error": "Tesseract OCR not found. Please ensure it's installed and in your PATH."}
+    except Exception as e:
+        return {"error": f"An error occurred during OCR: {str(e)}"}
+
+    raw_text = layout_text(layout)
+    if not raw_text.strip():
+        return {"error": "OCR did not detect any text on the image."}
+
+    report_progress('extract')
+    with timed('extract'):
+        extracted_data = extract_from_layout(layout, raw_text)
+    extracted_data['ocr'] = {'psm': 'stream', 'confidence': weighted_conf / word_count if word_count else 0,
+                             'psm_scores': psm_scores, 'strategy': psm_strategy}
+    extracted_data['preprocess'] = preprocess_info
+    extracted_data['stream'] = {'strips': len(strips), 'strip_height': STREAM_STRIP_HEIGHT,
+                                'overlap': STREAM_STRIP_OVERLAP}
+    return extracted_data
@@ -0,0 +1,35 @@
+"""
+Konfigurasi gunicorn untuk server.py.
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Semua nilai bisa dioverride lewat environment (OCR_WORKERS, OCR_TIMEOUT, dst).
+"""
+import os
+
+bind = os.environ.get('OCR_BIND', '0.0.0.0:8000')
+# OCR murni CPU-bound: satu proses per core, satu thread per proses
+workers = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))
+threads = int(os.environ.get('OCR_THREADS', 1))
+# Muat server/extraction (cv2, numpy, pytesseract) sekali di master sebelum fork
+preload_app = True
+# Batas waktu per request (detik); worker yang melewati batas ini di-restart gunicorn
+timeout = int(os.environ.get('OCR_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('OCR_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+# Recycle worker berkala supaya fragmentasi memori OpenCV/Tesseract tidak menumpuk
+max_requests = int(os.environ.get('OCR_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+# Batas ukuran baris/header HTTP
+limit_request_line = 4094
+limit_request_fields = 100
+
+
+def post_fork(server, worker):
+    # Backend OCR (mis. tesserocr API) dibuat per worker setelah fork, bukan diwarisi dari master,
+    # lalu satu OCR dummy per thread OCR yang dipakai request (OCR_REQUEST_WORKERS; default 1 =
+    # hanya thread ini) supaya request pertama tidak membayar load traineddata
+    from server import SERVER_OCR_WORKERS
+    from startup import warm_up
+    report = warm_up(ocr_threads=SERVER_OCR_WORKERS)
+    server.log.info("Worker %s warm-up: %s", worker.pid, report)
@@ -0,0 +1,165 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import cached_process_receipt_image
+from extraction import MemoryDebugSink, preprocess_pipeline
+
+# --- Konfigurasi Job Queue ---
+# Jumlah job OCR yang berjalan bersamaan untuk seluruh sesi Streamlit dalam satu proses.
+# Tiap job sendiri sudah memakai beberapa thread OCR (OCR_MAX_WORKERS), jadi nilai ini kecil.
+JOB_MAX_WORKERS = 2
+# Batas job yang menunggu (admission control). Jika penuh, submit ditolak dengan QueueFullError.
+JOB_MAX_QUEUED = 16
+# Lama hasil job disimpan setelah selesai (detik)
+JOB_RESULT_TTL_SECONDS = 600
+# ----------------------------------------
+
+# Status job dan perkiraan progres per tahap (untuk progress bar)
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_ERROR = 'error'
+STAGE_PROGRESS = {'queued': 0.0, 'preprocess': 0.1, 'ocr': 0.3, 'extract': 0.9, 'done': 1.0}
+
+
+class QueueFullError(Exception):
+    """Dilempar saat antrean job sudah penuh (JOB_MAX_QUEUED)."""
+
+
+def preprocess_stages(image_bytes, progress_callback=None, **ocr_kwargs):
+    """Task job untuk tampilan tahap preprocessing: {'stages': {nama tahap: gambar}}."""
+    if progress_callback is not None:
+        progress_callback('preprocess')
+    debug_sink = MemoryDebugSink()
+    if preprocess_pipeline(image_bytes, debug_sink=debug_sink, **ocr_kwargs) is None:
+        return {'error': "Gagal melakukan preprocessing gambar."}
+    return {'stages': debug_sink.stages}
+
+
+class Job:
+    def __init__(self, job_id, image_bytes, ocr_kwargs, task=None):
+        self.id = job_id
+        self.image_bytes = image_bytes
+        self.ocr_kwargs = ocr_kwargs
+        self.task = task or cached_process_receipt_image
+        self.status = JOB_QUEUED
+        self.stage = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def progress(self):
+        return STAGE_PROGRESS.get(self.stage, 0.0)
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_ERROR)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Antrean job OCR bersama dengan worker pool terbatas.
+    submit() langsung mengembalikan job id; UI melakukan polling lewat get().
+    Job yang menunggu dibatasi max_queued supaya lonjakan trafik mengantre, bukan
+    membebani CPU; di atas batas itu submit() melempar QueueFullError.
+    """
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS, max_queued=JOB_MAX_QUEUED, result_ttl=JOB_RESULT_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+
+        def on_progress(stage):
+            job.stage = stage
+
+        try:
+            result = job.task(job.image_bytes, progress_callback=on_progress, **job.ocr_kwargs)
+            job.result = result
+            if 'error' in result:
+                job.status, job.error = JOB_ERROR, result['error']
+            else:
+                job.status = JOB_DONE
+        except Exception as e:
+            job.status, job.error = JOB_ERROR, f"{type(e).__name__}: {e}"
+        finally:
+            job.stage = 'done'
+            job.finished_at = time.time()
+            job.image_bytes = None  # bebaskan memori gambar setelah selesai
+
+    def submit(self, image_bytes, task=None, **ocr_kwargs):
+        """
+        Masukkan gambar ke antrean dan kembalikan job id.
+        task(image_bytes, progress_callback=..., **ocr_kwargs) default cached_process_receipt_image;
+        pekerjaan lain (misal preprocess_stages) tetap lewat antrean dan admission control yang sama.
+        """
+        with self._lock:
+            self._prune()
+            if self._pending_count() >= self.max_queued:
+                raise QueueFullError(f"Antrean OCR penuh ({self.max_queued} job menunggu).")
+            job = Job(uuid.uuid4().hex, image_bytes, ocr_kwargs, task)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _pending_count(self):
+        return sum(1 for job in self._jobs.values() if job.status == JOB_QUEUED)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'max_workers': self.max_workers,
+            'max_queued': self.max_queued,
+            'queued': statuses.count(JOB_QUEUED),
+            'running': statuses.count(JOB_RUNNING),
+            'done': statuses.count(JOB_DONE),
+            'error': statuses.count(JOB_ERROR),
+        }
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Job queue bersama per proses (dipakai semua sesi Streamlit)."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,228 @@
+"""
+Leksikon merchant: daftar nama toko dari file (MERCHANT_LEXICON_PATH) dengan index fuzzy.
+
+Setiap nama/alias dinormalisasi menjadi key (huruf kecil, tanpa aksen, hanya a-z0-9) lalu
+di-index gaya SymSpell: semua variasi hasil menghapus 1..d karakter dari prefix key disimpan di dict.
+Pencarian untuk satu potongan teks cukup membangkitkan variasi hapus dari potongan itu dan
+mencarinya di dict, jadi waktunya tidak bergantung jumlah merchant di leksikon (hanya memori
+index yang bertambah). Kandidat diverifikasi dengan edit distance (Damerau/OSA).
+
+Format file (UTF-8), satu merchant per baris, alias dipisah '|', baris '#' = komentar:
+    Momi & Toy's Crêperie | Momi & Toy's | Momi Antoys
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# --- Konfigurasi Leksikon Merchant ---
+MERCHANT_LEXICON_PATH = os.environ.get(
+    'OCR_MERCHANT_LEXICON', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'merchants.txt'))
+# Jarak edit maksimum menurut panjang key: (panjang minimum, jarak). Key pendek harus sama persis.
+MERCHANT_EDIT_DISTANCES = ((10, 2), (6, 1))
+# Variasi hapus hanya dibuat dari prefix key sepanjang ini (prefix SymSpell): index lebih kecil
+# dan pencarian lebih cepat; kandidat tetap diverifikasi dengan edit distance key penuh
+MERCHANT_PREFIX_LENGTH = 7
+# Skor minimum (1 - jarak / panjang key terpanjang) agar dianggap cocok
+MERCHANT_MIN_SCORE = 0.8
+# Hanya baris header (teratas) yang dicocokkan ke leksikon
+MERCHANT_HEADER_LINES = 10
+# ----------------------------------------
+
+WORD_RE = re.compile(r'\S+')
+NON_KEY_CHARS_RE = re.compile(r'[^a-z0-9]')
+
+
+def normalize_key(text):
+    """'Momi & Toy's Crêperie' -> 'momitoyscreperie' (tanpa aksen, spasi dan tanda baca)."""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return NON_KEY_CHARS_RE.sub('', text.lower())
+
+
+def count_key_words(text):
+    """Jumlah kata yang menyumbang ke key ('Momi & Toy's' -> 2, '&' tidak dihitung)."""
+    return sum(1 for word in WORD_RE.findall(text) if normalize_key(word))
+
+
+def max_edit_distance(length):
+    for min_length, distance in MERCHANT_EDIT_DISTANCES:
+        if length >= min_length:
+            return distance
+    return 0
+
+
+def delete_variants(key, max_distance):
+    """Semua string hasil menghapus 1..max_distance karakter dari key (minimal sisa 1 karakter)."""
+    variants = set()
+    level = {key}
+    for _ in range(max_distance):
+        level = {word[:i] + word[i + 1:] for word in level if len(word) > 1 for i in range(len(word))}
+        variants |= level
+    return variants
+
+
+def edit_distance(a, b, max_distance):
+    """Jarak Damerau-Levenshtein (optimal string alignment), atau max_distance + 1 jika lebih."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def load_lexicon_entries(path):
+    """Baca file leksikon -> list (nama_kanonik, [nama + alias])."""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            names = [name.strip() for name in line.split('|') if name.strip()]
+            entries.append((names[0], names))
+    return entries
+
+
+class MerchantLexicon:
+    """Index key -> nama kanonik (exact) dan variasi hapus -> key (fuzzy). Read-only setelah dibuat."""
+
+    def __init__(self, entries, version=None):
+        self.version = version
+        self._canonical = {}
+        self._deletes = {}
+        self._key_words = {}
+        self._max_words = 1
+        for canonical, names in entries:
+            for name in names:
+                key = normalize_key(name)
+                if not key or key in self._canonical:
+                    continue
+                self._canonical[key] = canonical
+                self._key_words[key] = count_key_words(name)
+                self._max_words = max(self._max_words, len(name.split()))
+                distance = max_edit_distance(len(key))
+                if distance:
+                    prefix = key[:MERCHANT_PREFIX_LENGTH]
+                    for variant in delete_variants(prefix, distance) | {prefix}:
+                        self._deletes.setdefault(variant, []).append(key)
+        lengths = [len(key) for key in self._canonical] or [0]
+        self._min_length = min(lengths) - MERCHANT_EDIT_DISTANCES[0][1]
+        self._max_length = max(lengths) + MERCHANT_EDIT_DISTANCES[0][1]
+
+    def __len__(self):
+        return len(set(self._canonical.values()))
+
+    def lookup(self, text, exact_only=False):
+        """
+        Cocokkan satu potongan teks ke leksikon. Match fuzzy ke alias multi-kata hanya jika teks
+        memuat sebanyak kata alias itu ('Circle' tidak cocok ke 'Circle K').
+        Mengembalikan (nama_kanonik, skor, key) terbaik atau None.
+        """
+        key = normalize_key(text)
+        if not self._min_length <= len(key) <= self._max_length or key.isdigit():
+            return None
+        canonical = self._canonical.get(key)
+        if canonical is not None:
+            return canonical, 1.0, key
+
+        query_distance = max_edit_distance(len(key))
+        if query_distance == 0 or exact_only:
+            return None
+        best = None
+        seen = set()
+        text_words = count_key_words(text)
+        prefix = key[:MERCHANT_PREFIX_LENGTH]
+        for variant in delete_variants(prefix, query_distance) | {prefix}:
+            for candidate in self._deletes.get(variant, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if text_words < self._key_words[candidate]:
+                    continue
+                allowed = min(query_distance, max_edit_distance(len(candidate)))
+                distance = edit_distance(key, candidate, allowed)
+                if distance > allowed:
+                    continue
+                score = 1.0 - distance / max(len(key), len(candidate))
+                if best is None or score > best[1]:
+                    best = (self._canonical[candidate], score, candidate)
+        if best is None or best[1] < MERCHANT_MIN_SCORE:
+            return None
+        return best
+
+    def match(self, lines, max_lines=None):
+        """
+        Cari merchant di baris header: setiap jendela 1..N kata berurutan di tiap baris dicocokkan
+        (N = jumlah kata alias terpanjang). Terbaik = skor tertinggi, lalu key terpanjang, lalu
+        posisi paling atas. Setelah ada match persis, jendela berikutnya cukup dicek persis.
+        Mengembalikan dict {'name', 'score', 'text', 'line'} atau None.
+        """
+        best, best_rank = None, None
+        for line_index, line in enumerate(lines[:max_lines or MERCHANT_HEADER_LINES]):
+            words = WORD_RE.findall(line)
+            key_lengths = [len(normalize_key(word)) for word in words]
+            for start in range(len(words)):
+                key_length = 0
+                for end in range(start + 1, min(start + self._max_words, len(words)) + 1):
+                    key_length += key_lengths[end - 1]
+                    if key_length > self._max_length:
+                        break
+                    text = ' '.join(words[start:end])
+                    found = self.lookup(text, exact_only=best_rank is not None and best_rank[0] == -1.0)
+                    if found is None:
+                        continue
+                    canonical, score, key = found
+                    rank = (-score, -len(key), line_index, start)
+                    if best_rank is None or rank < best_rank:
+                        best_rank = rank
+                        best = {'name': canonical, 'score': round(score, 3), 'text': text, 'line': line_index}
+        return best
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'merchants': len(self),
+            'keys': len(self._canonical),
+            'delete_variants': len(self._deletes),
+        }
+
+
+def load_lexicon(path=None):
+    """Bangun MerchantLexicon dari file; file tidak ada -> leksikon kosong (dengan warning)."""
+    path = path or MERCHANT_LEXICON_PATH
+    try:
+        with open(path, 'rb') as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:12]
+        entries = load_lexicon_entries(path)
+    except OSError as e:
+        logger.warning("Leksikon merchant %s tidak bisa dibaca: %s", path, e)
+        return MerchantLexicon([], version=None)
+    lexicon = MerchantLexicon(entries, version=version)
+    logger.info("Leksikon merchant dimuat: %s", lexicon.stats())
+    return lexicon
+
+
+_default_lexicon = None
+_default_lexicon_lock = threading.Lock()
+
+
+def get_default_lexicon():
+    """Leksikon bersama per proses, dibangun sekali dari MERCHANT_LEXICON_PATH."""
+    global _default_lexicon
+    with _default_lexicon_lock:
+        if _default_lexicon is None:
+            _default_lexicon = load_lexicon()
+        return _default_lexicon
@@ -0,0 +1,145 @@
+"""
+Instrumentasi waktu per tahap pipeline OCR.
+
+- timed(stage) / timed_stage(stage): ukur durasi satu tahap (decode, resize, denoise, ocr_psm6,
+  extract_total, ...). Durasi masuk ke histogram global dan ke trace request yang sedang aktif.
+- start_trace(): buka trace per request (contextvars); hasilnya ditempel ke result['trace'].
+- submit_in_context(): submit ke executor dengan context yang sama supaya tahap di thread
+  worker (sweep PSM, denoise tiled) tetap tercatat di trace request-nya.
+- StageMetrics: histogram agregat per tahap, ekspor ke format teks Prometheus atau file JSON.
+"""
+import contextvars
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Konfigurasi Metrics ---
+# Batas bucket histogram (detik), seperti default client Prometheus ditambah bucket kecil
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PREFIX = 'receipt_ocr'
+# ----------------------------------------
+
+
+class Trace:
+    """Daftar durasi tahap untuk satu request (thread-safe, tahap bisa dicatat dari thread worker)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.stages = []
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages.append({'stage': stage, 'ms': round(seconds * 1000, 3)})
+
+    def to_dict(self):
+        with self._lock:
+            stages = list(self.stages)
+        return {'total_ms': round((time.perf_counter() - self._start) * 1000, 3), 'stages': stages}
+
+
+class StageMetrics:
+    """Histogram durasi per tahap (kumulatif, gaya Prometheus) untuk seluruh proses."""
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry['counts'][i] += 1
+            entry['sum'] += seconds
+            entry['count'] += 1
+
+    def observe_trace(self, trace):
+        """Masukkan trace hasil (result['trace']) ke histogram, misal dari proses worker lain."""
+        for stage in trace.get('stages', []):
+            self.observe(stage['stage'], stage['ms'] / 1000)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                stage: {
+                    'count': entry['count'],
+                    'sum_s': round(entry['sum'], 6),
+                    'mean_ms': round(entry['sum'] / entry['count'] * 1000, 3) if entry['count'] else None,
+                    'buckets': {str(bound): n for bound, n in zip(self.buckets, entry['counts'])},
+                }
+                for stage, entry in sorted(self._stages.items())
+            }
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        name = f"{prefix}_stage_duration_seconds"
+        lines = [f"# HELP {name} Durasi tiap tahap pipeline OCR struk.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage, entry in sorted(self._stages.items()):
+                for bound, n in zip(self.buckets, entry['counts']):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {n}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {entry["sum"]:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {entry["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+stage_metrics = StageMetrics()
+_current_trace = contextvars.ContextVar('ocr_trace', default=None)
+
+
+def get_stage_metrics():
+    return stage_metrics
+
+
+@contextmanager
+def start_trace():
+    """Buka trace baru untuk request ini; tahap yang di-timed() di dalamnya tercatat ke trace."""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stage_metrics.observe(stage, seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+
+def timed_stage(stage):
+    """Decorator versi timed() untuk fungsi (misal extract_*)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit yang membawa context (trace aktif) ke thread worker."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,208 @@
+"""
+Penyimpanan hasil OCR mentah per struk (SQLite) untuk re-ekstraksi tanpa OCR ulang.
+
+Tabel ocr_results menyimpan layout OCR per gambar (key = sha256 bytes gambar): teks, bbox dan
+confidence per kata, bbox/confidence per baris, serta PSM/strategi yang dipakai. Kata disimpan
+kolumnar (satu list per atribut) dalam JSON terkompresi zlib supaya ringkas.
+Tabel extractions menyimpan hasil extract_* terakhir beserta versi extractor
+(extraction.get_extractor_version); reextract.py hanya memproses record yang versinya basi.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# --- Konfigurasi OCR Store ---
+# Path SQLite; jika None, hasil OCR tidak disimpan
+OCR_STORE_DB_PATH = os.environ.get('OCR_STORE_DB')
+OCR_STORE_COMPRESSION_LEVEL = 6
+# Field hasil yang tidak disimpan di tabel extractions (layout ada di ocr_results, trace per request)
+OCR_STORE_SKIPPED_FIELDS = ('layout', 'raw_text', 'trace')
+# ----------------------------------------
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS ocr_results (
+        image_hash TEXT PRIMARY KEY,
+        psm TEXT,
+        strategy TEXT,
+        confidence REAL,
+        width INTEGER NOT NULL,
+        median_word_height REAL NOT NULL,
+        word_count INTEGER NOT NULL,
+        words BLOB NOT NULL,
+        created_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS extractions (
+        image_hash TEXT PRIMARY KEY REFERENCES ocr_results(image_hash) ON DELETE CASCADE,
+        extractor_version TEXT NOT NULL,
+        result TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS extractions_version ON extractions (extractor_version)",
+)
+
+
+def encode_layout(layout):
+    """Layout OCR (build_ocr_layout) -> blob zlib berisi JSON kolumnar per kata dan per baris."""
+    lines = layout['lines']
+    words = [(line_index, word) for line_index, line in enumerate(lines) for word in line['words']]
+    columns = {
+        'line_bbox': [line['bbox'] for line in lines],
+        'line_conf': [line['conf'] for line in lines],
+        'word_line': [line_index for line_index, _ in words],
+        'word_text': [word['text'] for _, word in words],
+        'word_conf': [word['conf'] for _, word in words],
+        'word_bbox': [word['bbox'] for _, word in words],
+    }
+    payload = json.dumps(columns, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return zlib.compress(payload, OCR_STORE_COMPRESSION_LEVEL)
+
+
+def _ocr_meta(psm, strategy, confidence):
+    """Meta OCR dari kolom SQLite; psm numerik kembali ke int seperti process_receipt_image ('roi'/'stream' tetap)."""
+    if psm is not None and psm.isdigit():
+        psm = int(psm)
+    return {'psm': psm, 'strategy': strategy, 'confidence': confidence}
+
+
+def decode_layout(blob, width, median_word_height):
+    """Kebalikan encode_layout: susun ulang {'width', 'median_word_height', 'lines'}."""
+    columns = json.loads(zlib.decompress(blob))
+    lines = [{'text': '', 'conf': conf, 'bbox': bbox, 'words': []}
+             for bbox, conf in zip(columns['line_bbox'], columns['line_conf'])]
+    for line_index, text, conf, bbox in zip(columns['word_line'], columns['word_text'], columns['word_conf'],
+                                            columns['word_bbox']):
+        lines[line_index]['words'].append({'text': text, 'conf': conf, 'bbox': bbox})
+    for line in lines:
+        line['text'] = ' '.join(word['text'] for word in line['words'])
+    return {'width': width, 'median_word_height': median_word_height, 'lines': lines}
+
+
+class OcrStore:
+    """Akses thread-safe ke database OCR store (satu koneksi per instance)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def save(self, image_hash, result, extractor_version=None):
+        """
+        Simpan layout OCR dari hasil process_receipt_image (hasil error/tanpa layout dilewati),
+        plus hasil ekstraksinya jika extractor_version diberikan.
+        """
+        layout = result.get('layout') if result else None
+        if not layout or 'error' in result:
+            return False
+        ocr = result.get('ocr') or {}
+        blob = encode_layout(layout)
+        word_count = sum(len(line['words']) for line in layout['lines'])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (image_hash, psm, strategy, confidence, width, "
+                "median_word_height, word_count, words, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (image_hash, None if ocr.get('psm') is None else str(ocr['psm']), ocr.get('strategy'),
+                 ocr.get('confidence'), layout['width'], layout['median_word_height'], word_count, blob,
+                 time.time()),
+            )
+            if extractor_version is not None:
+                self._write_extraction(image_hash, result, extractor_version)
+            self._conn.commit()
+        return True
+
+    def _write_extraction(self, image_hash, result, extractor_version):
+        fields = {k: v for k, v in result.items() if k not in OCR_STORE_SKIPPED_FIELDS}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO extractions (image_hash, extractor_version, result, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (image_hash, extractor_version, json.dumps(fields, ensure_ascii=False), time.time()),
+        )
+
+    def save_extractions(self, results, extractor_version):
+        """Simpan banyak hasil re-ekstraksi [(image_hash, result)] dalam satu transaksi."""
+        with self._lock:
+            for image_hash, result in results:
+                self._write_extraction(image_hash, result, extractor_version)
+            self._conn.commit()
+
+    def get_layout(self, image_hash):
+        """(layout, ocr_meta) tersimpan untuk gambar ini, atau None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT words, width, median_word_height, psm, strategy, confidence FROM ocr_results "
+                "WHERE image_hash = ?", (image_hash,)).fetchone()
+        if row is None:
+            return None
+        blob, width, median_word_height, psm, strategy, confidence = row
+        return decode_layout(blob, width, median_word_height), _ocr_meta(psm, strategy, confidence)
+
+    def get_extraction(self, image_hash):
+        """(extractor_version, result) terakhir untuk gambar ini, atau None."""
+        with self._lock:
+            row = self._conn.execute("SELECT extractor_version, result FROM extractions WHERE image_hash = ?",
+                                     (image_hash,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def stale_hashes(self, extractor_version, force=False):
+        """image_hash yang belum punya hasil ekstraksi versi extractor_version (semua jika force)."""
+        query = "SELECT o.image_hash FROM ocr_results o"
+        params = ()
+        if not force:
+            query += (" LEFT JOIN extractions e ON e.image_hash = o.image_hash"
+                      " WHERE e.extractor_version IS NULL OR e.extractor_version != ?")
+            params = (extractor_version,)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query + " ORDER BY o.image_hash", params)]
+
+    def iter_records(self, image_hashes, batch_size=200):
+        """Yield list [(image_hash, words_blob, width, median_word_height, ocr_meta)] per batch."""
+        for start in range(0, len(image_hashes), batch_size):
+            chunk = image_hashes[start:start + batch_size]
+            placeholders = ','.join('?' * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT image_hash, words, width, median_word_height, psm, strategy, confidence "
+                    f"FROM ocr_results WHERE image_hash IN ({placeholders})", chunk).fetchall()
+            yield [(image_hash, blob, width, median_word_height, _ocr_meta(psm, strategy, confidence))
+                   for image_hash, blob, width, median_word_height, psm, strategy, confidence in rows]
+
+    def stats(self, extractor_version=None):
+        with self._lock:
+            records, words = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(word_count), 0) FROM ocr_results").fetchone()
+            versions = dict(self._conn.execute(
+                "SELECT extractor_version, COUNT(*) FROM extractions GROUP BY extractor_version").fetchall())
+        stats = {'records': records, 'words': words, 'extractor_versions': versions}
+        if extractor_version is not None:
+            stats['stale'] = records - versions.get(extractor_version, 0)
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_ocr_store():
+    """OCR store bersama per proses dari OCR_STORE_DB_PATH, atau None jika tidak dikonfigurasi."""
+    global _default_store
+    if not OCR_STORE_DB_PATH:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = OcrStore(OCR_STORE_DB_PATH)
+            logger.info("OCR store: %s", OCR_STORE_DB_PATH)
+        return _default_store
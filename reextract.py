@@ -0,0 +1,117 @@
+"""
+Re-ekstraksi struk dari hasil OCR tersimpan (ocr_store) tanpa menjalankan OCR ulang.
+
+Contoh:
+    python reextract.py --db ocr.db -w 8
+    python reextract.py --db ocr.db --all -o hasil.jsonl
+
+Hanya record yang hasil ekstraksinya dibuat oleh versi extractor lain (EXTRACTOR_VERSION atau
+leksikon merchant berubah) yang diproses, kecuali dengan --all. Layout per kata dibaca dari
+SQLite dalam batch, aturan ekstraksi (extract_from_layout) dijalankan di process pool, lalu
+hasil baru disimpan kembali dengan versi extractor saat ini.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Tambahkan path ke direktori saat ini agar modul extraction dapat ditemukan
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _reextract_chunk(rows):
+    # Diimport di worker supaya leksikon merchant dibangun sekali per proses
+    from extraction import extract_from_layout
+    from ocr_store import decode_layout
+
+    records = []
+    for image_hash, blob, width, median_word_height, ocr_meta in rows:
+        try:
+            result = extract_from_layout(decode_layout(blob, width, median_word_height))
+            result.pop('layout', None)
+            result.pop('raw_text', None)
+            result['ocr'] = ocr_meta
+            records.append({'image_hash': image_hash, 'result': result})
+        except Exception as e:
+            records.append({'image_hash': image_hash, 'error': f"{type(e).__name__}: {e}"})
+    return records
+
+
+def reextract(store, image_hashes, workers=None, max_pending=None, batch_size=200):
+    """
+    Jalankan ulang ekstraksi untuk image_hashes dan yield list record per batch
+    (urutan selesai). Antrean batch dibatasi max_pending (default 2 x workers).
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for rows in store.iter_records(image_hashes, batch_size=batch_size):
+            pending.add(executor.submit(_reextract_chunk, rows))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--db', default=os.environ.get('OCR_STORE_DB'),
+                            help='SQLite OCR store (default env OCR_STORE_DB)')
+    arg_parser.add_argument('--all', action='store_true', help='Proses semua record, bukan hanya yang basi')
+    arg_parser.add_argument('-o', '--output', help='Tulis juga hasil baru ke file JSON Lines ini')
+    arg_parser.add_argument('-w', '--workers', type=int, default=None, help='Jumlah proses worker')
+    arg_parser.add_argument('--max-pending', type=int, default=None, help='Batas antrean batch (default 2 x workers)')
+    arg_parser.add_argument('--batch-size', type=int, default=200, help='Jumlah record per batch worker')
+    arg_parser.add_argument('--log-level', default='WARNING', help='Level logging pipeline (ke stderr)')
+    args = arg_parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), stream=sys.stderr)
+    if not args.db:
+        arg_parser.error('--db atau env OCR_STORE_DB wajib diisi')
+
+    from extraction import get_extractor_version
+    from ocr_store import OcrStore
+
+    store = OcrStore(args.db)
+    version = get_extractor_version()
+    image_hashes = store.stale_hashes(version, force=args.all)
+    print(f"Versi extractor {version}: {len(image_hashes)} record akan diproses", file=sys.stderr)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else None
+    processed = failed = 0
+    start = time.perf_counter()
+    try:
+        for records in reextract(store, image_hashes, workers=args.workers, max_pending=args.max_pending,
+                                 batch_size=args.batch_size):
+            # Proses utama satu-satunya penulis SQLite; satu transaksi per batch
+            store.save_extractions([(r['image_hash'], r['result']) for r in records if 'result' in r], version)
+            for record in records:
+                processed += 1
+                if 'error' in record:
+                    failed += 1
+                    print(f"Error: {record['image_hash']}: {record['error']}", file=sys.stderr)
+                if out is not None:
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if out is not None:
+            out.close()
+        stats = store.stats(version)
+        store.close()
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0
+    print(f"Selesai: {processed} record ({failed} gagal) dalam {elapsed:.1f}s ({rate:.1f} record/s); "
+          f"tersisa {stats['stale']} basi dari {stats['records']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
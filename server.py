@@ -0,0 +1,151 @@
+"""
+Layanan HTTP OCR (headless) di sekitar process_receipt_image untuk pemakaian antar-service.
+
+Endpoint:
+    GET  /health      -> status service, backend OCR, konfigurasi pipeline
+    GET  /metrics     -> histogram durasi per tahap (teks Prometheus, atau JSON dengan ?format=json)
+    POST /ocr         -> satu gambar (multipart field "image" atau body raw bytes)
+    POST /ocr/batch   -> beberapa gambar (multipart field "images", boleh berulang)
+
+Parameter OCR opsional lewat query string: psm_strategy, denoise_method, confidence_target.
+Penanda near-duplicate (OCR_DEDUP=1) hanya membandingkan struk dengan header X-Client-Id yang sama;
+request tanpa header itu tidak ikut dedup.
+Histogram /metrics dihitung per proses worker gunicorn.
+
+Contoh:
+    gunicorn -c gunicorn.conf.py server:app
+    curl -F image=@struk.jpg http://localhost:8000/ocr
+    curl --data-binary @struk.jpg -H "Content-Type: image/jpeg" http://localhost:8000/ocr
+"""
+import logging
+import os
+import sys
+import time
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+# Tambahkan path ke direktori saat ini agar modul extraction dapat ditemukan
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Diimport di level modul supaya cv2/numpy/tesseract dimuat sekali saat gunicorn --preload
+from cache import cached_process_receipt_image
+from extraction import get_ocr_backend, get_pipeline_config
+from metrics import get_stage_metrics
+
+# --- Konfigurasi Service (bisa dioverride lewat environment) ---
+# Ukuran maksimum body request (byte); di atas ini dibalas 413
+SERVER_MAX_CONTENT_LENGTH = int(os.environ.get('OCR_MAX_CONTENT_LENGTH', 10 * 1024 * 1024))
+# Jumlah gambar maksimum per request /ocr/batch
+SERVER_MAX_BATCH_SIZE = int(os.environ.get('OCR_MAX_BATCH_SIZE', 16))
+# Batas waktu pemrosesan satu request batch (detik); gambar sisanya ditandai timeout
+SERVER_BATCH_DEADLINE_SECONDS = float(os.environ.get('OCR_BATCH_DEADLINE', 60))
+# Thread OCR per request; default 1 karena paralelisme sudah di level worker gunicorn
+SERVER_OCR_WORKERS = int(os.environ.get('OCR_REQUEST_WORKERS', 1))
+# Header id pemanggil/tenant; menjadi scope index near-duplicate (lihat cache.py)
+SERVER_CLIENT_ID_HEADER = os.environ.get('OCR_CLIENT_ID_HEADER', 'X-Client-Id')
+# Level logging (DEBUG menampilkan teks OCR mentah per request)
+SERVER_LOG_LEVEL = os.environ.get('OCR_LOG_LEVEL', 'INFO')
+# ----------------------------------------
+
+logging.basicConfig(level=SERVER_LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+OCR_PARAM_TYPES = {'psm_strategy': str, 'denoise_method': str, 'confidence_target': float}
+
+app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = SERVER_MAX_CONTENT_LENGTH
+
+
+def _ocr_kwargs_from_request():
+    """Ambil parameter OCR opsional dari query string."""
+    ocr_kwargs = {'ocr_workers': SERVER_OCR_WORKERS, 'dedup_scope': request.headers.get(SERVER_CLIENT_ID_HEADER)}
+    for name, cast in OCR_PARAM_TYPES.items():
+        value = request.args.get(name)
+        if value is not None:
+            try:
+                ocr_kwargs[name] = cast(value)
+            except ValueError:
+                raise ValueError(f"Parameter {name} tidak valid: {value!r}")
+    return ocr_kwargs
+
+
+def _run_ocr(image_bytes, ocr_kwargs):
+    start = time.perf_counter()
+    try:
+        result = cached_process_receipt_image(image_bytes, **ocr_kwargs)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    result['elapsed_s'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+@app.errorhandler(HTTPException)
+def handle_http_error(e):
+    return jsonify({'error': e.description}), e.code
+
+
+@app.get('/health')
+def health():
+    return jsonify({
+        'status': 'ok',
+        'ocr_backend': type(get_ocr_backend()).__name__,
+        'pipeline': get_pipeline_config(),
+        'limits': {
+            'max_content_length': SERVER_MAX_CONTENT_LENGTH,
+            'max_batch_size': SERVER_MAX_BATCH_SIZE,
+            'batch_deadline_s': SERVER_BATCH_DEADLINE_SECONDS,
+        },
+    })
+
+
+@app.get('/metrics')
+def metrics():
+    stage_metrics = get_stage_metrics()
+    if request.args.get('format') == 'json':
+        return jsonify(stage_metrics.snapshot())
+    return Response(stage_metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.post('/ocr')
+def ocr():
+    upload = request.files.get('image')
+    image_bytes = upload.read() if upload is not None else request.get_data()
+    if not image_bytes:
+        return jsonify({'error': "Gambar kosong: kirim multipart field 'image' atau raw bytes."}), 400
+    try:
+        ocr_kwargs = _ocr_kwargs_from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = _run_ocr(image_bytes, ocr_kwargs)
+    return jsonify(result), (422 if 'error' in result else 200)
+
+
+@app.post('/ocr/batch')
+def ocr_batch():
+    uploads = request.files.getlist('images')
+    if not uploads:
+        return jsonify({'error': "Tidak ada gambar: kirim multipart field 'images'."}), 400
+    if len(uploads) > SERVER_MAX_BATCH_SIZE:
+        return jsonify({'error': f"Maksimal {SERVER_MAX_BATCH_SIZE} gambar per batch."}), 413
+    try:
+        ocr_kwargs = _ocr_kwargs_from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    deadline = time.monotonic() + SERVER_BATCH_DEADLINE_SECONDS
+    results = []
+    for upload in uploads:
+        record = {'filename': upload.filename}
+        if time.monotonic() > deadline:
+            record['error'] = "Batas waktu batch terlampaui, gambar tidak diproses."
+        else:
+            record.update(_run_ocr(upload.read(), ocr_kwargs))
+        results.append(record)
+    failed = sum(1 for record in results if 'error' in record)
+    return jsonify({'results': results, 'processed': len(results), 'failed': failed})
+
+
+if __name__ == '__main__':
+    # Hanya untuk development; produksi pakai gunicorn -c gunicorn.conf.py server:app
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8000)))
@@ -0,0 +1,116 @@
+"""
+Startup: import modul berat secara lazy, warm-up OCR di background, dan laporan waktu boot.
+
+Modul ini sengaja hanya memakai standard library supaya bisa diimport paling awal oleh app.py
+tanpa menunggu cv2/numpy/pytesseract. Modul berat dimuat oleh warm_up() (di thread background
+untuk Streamlit, atau di post_fork gunicorn untuk server.py) dan waktu tiap tahap dicatat.
+"""
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# --- Konfigurasi Startup ---
+# Set OCR_WARMUP=0 untuk mematikan warm-up (misal saat development)
+STARTUP_WARMUP_ENABLED = os.environ.get('OCR_WARMUP', '1') != '0'
+# Urutan import saat warm-up; dependensi pihak ketiga dulu supaya waktunya terpisah dari modul repo
+WARMUP_MODULES = ('numpy', 'cv2', 'PIL.Image', 'pytesseract', 'dateutil.parser', 'merchants', 'extraction', 'cache',
+                  'jobs')
+# ----------------------------------------
+
+STARTUP_PENDING = 'pending'
+STARTUP_RUNNING = 'running'
+STARTUP_READY = 'ready'
+STARTUP_ERROR = 'error'
+
+# Titik nol laporan: saat modul ini pertama kali diimport (import pertama di app.py)
+_process_start = time.perf_counter()
+
+
+class StartupReport:
+    """Durasi tiap tahap boot (import per modul, backend OCR, OCR dummy) dan status warm-up."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = STARTUP_PENDING
+        self.error = None
+        self.phases = OrderedDict()
+        self.ready_after_s = None
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = round(seconds * 1000, 1)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'status': self.status,
+                'error': self.error,
+                'ready_after_s': self.ready_after_s,
+                'phases_ms': dict(self.phases),
+            }
+
+
+startup_report = StartupReport()
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def get_startup_report():
+    return startup_report.to_dict()
+
+
+def is_ready():
+    return startup_report.status == STARTUP_READY
+
+
+def _timed_phase(phase, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    startup_report.record(phase, time.perf_counter() - start)
+    return result
+
+
+def warm_up(ocr_threads=None):
+    """
+    Import modul berat, bangun index leksikon merchant, lalu jalankan OCR dummy di thread OCR
+    (extraction.warm_up_ocr; ocr_threads = jumlah thread OCR per request, default pool penuh).
+    Boleh dipanggil langsung (gunicorn post_fork) atau lewat start_background_warmup().
+    """
+    startup_report.status = STARTUP_RUNNING
+    try:
+        for module_name in WARMUP_MODULES:
+            if module_name in sys.modules:
+                continue
+            _timed_phase(f"import {module_name}", importlib.import_module, module_name)
+        _timed_phase('merchant_lexicon', importlib.import_module('merchants').get_default_lexicon)
+        extraction = importlib.import_module('extraction')
+        _timed_phase('ocr_backend', extraction.get_ocr_backend)
+        _timed_phase('ocr_warmup', extraction.warm_up_ocr, ocr_threads)
+    except Exception as e:
+        startup_report.status, startup_report.error = STARTUP_ERROR, f"{type(e).__name__}: {e}"
+        logger.warning("Warm-up gagal: %s", startup_report.error)
+        return startup_report.to_dict()
+
+    startup_report.ready_after_s = round(time.perf_counter() - _process_start, 2)
+    startup_report.status = STARTUP_READY
+    logger.info("Warm-up selesai dalam %.2fs sejak start: %s", startup_report.ready_after_s,
+                dict(startup_report.phases))
+    return startup_report.to_dict()
+
+
+def start_background_warmup():
+    """Jalankan warm_up() sekali per proses di thread daemon (aman dipanggil di setiap rerun Streamlit)."""
+    global _warmup_thread
+    if not STARTUP_WARMUP_ENABLED:
+        return None
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name='ocr-warmup', daemon=True)
+            _warmup_thread.start()
+        return _warmup_thread
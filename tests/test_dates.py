@@ -0,0 +1,61 @@
+"""Parser tanggal berbasis tabel (DATE_TOKEN_RE / parse_date_token / extract_date)."""
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import extract_date, parse_date_token  # noqa: E402
+
+
+@pytest.mark.parametrize('token, expected', [
+    ('2024-03-12', ('iso', date(2024, 3, 12))),
+    ('12/03/2024', ('num', date(2024, 3, 12))),
+    ('08/20/22', ('num', date(2022, 8, 20))),
+    ('05/11/2023 19:05', ('num_time', date(2023, 11, 5))),
+    ('5 Agu 24', ('dmy', date(2024, 8, 5))),
+    ('12-Jan-24', ('dmy', date(2024, 1, 12))),
+    ('7 Nopember 2023', ('dmy', date(2023, 11, 7))),
+    ('3 Sept. 2024', ('dmy', date(2024, 9, 3))),
+    ('March 12, 2024', ('mdy', date(2024, 3, 12))),
+])
+def test_parse_date_token(token, expected):
+    assert parse_date_token(token) == expected
+
+
+@pytest.mark.parametrize('token', ['31/02/2024', '1 Sepatu 2024', '2 Marjan 24', '12 Foo 2024'])
+def test_parse_date_token_rejects_invalid(token):
+    assert parse_date_token(token) is None
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Format yang sebelumnya diterima jalur dateutil
+    ('Tanggal 12/03/2024 14:22', '2024-03-12'),
+    ('WAL-MART 08/20/22 10:11', '2022-08-20'),
+    ('Date: 2023/5/7', '2023-05-07'),
+    ('Tanggal: 12.03.2024', '2024-03-12'),
+    ('Tgl: 1 Des 23', '2023-12-01'),
+    ('12 Januari 2024', '2024-01-12'),
+    ('5 Agustus 2023', '2023-08-05'),
+    ('Dec 5, 2022', '2022-12-05'),
+    ('Tanggal: Sep 1 2023 10:00', '2023-09-01'),
+    # Tanggal+jam transaksi menang atas tanggal lain di struk
+    ('Exp 2025-01-01\n05/11/2023 19:05', '2023-11-05'),
+])
+def test_extract_date(text, expected):
+    assert extract_date(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    # Kata yang diawali nama bulan bukan tanggal
+    '1 Sepatu 25.000\nTOTAL 25.000',
+    '2 Marjan 25.000',
+    'Asep 12, 2024',
+    # Angka setelah nama bulan yang merupakan harga, bukan tahun
+    '2 Mar 25.000',
+    'Subtotal 36.000\nTotal 39.600',
+])
+def test_extract_date_rejects_non_dates(text):
+    assert extract_date(text) is None
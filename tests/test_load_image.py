@@ -0,0 +1,30 @@
+"""Ukuran dari header gambar (peek_image_size) harus sama dengan hasil decode load_image."""
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import load_image, peek_image_size  # noqa: E402
+
+
+def _jpeg(width, height, orientation):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    Image.new('L', (width, height), 255).save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_peek_size_follows_exif_orientation(orientation):
+    data = _jpeg(300, 100, orientation)
+    height, width = load_image(data, grayscale=True).shape[:2]
+    assert peek_image_size(data) == (width, height)
+
+
+def test_peek_size_unreadable():
+    assert peek_image_size(b'bukan gambar') is None
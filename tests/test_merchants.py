@@ -0,0 +1,74 @@
+"""Leksikon merchant (MerchantLexicon.lookup / match) dan pemotongan baris header di extraction."""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import ReceiptText  # noqa: E402
+from merchants import MerchantLexicon  # noqa: E402
+
+ENTRIES = [
+    ('Indomaret', ['Indomaret']),
+    ('Circle K', ['Circle K']),
+    ('Lawson', ['Lawson']),
+    ('Kopi Kenangan', ['Kopi Kenangan']),
+    ("Momi & Toy's Crêperie", ["Momi & Toy's Crêperie", "Momi & Toy's"]),
+]
+
+
+@pytest.fixture(scope='module')
+def lexicon():
+    return MerchantLexicon(ENTRIES)
+
+
+@pytest.mark.parametrize('text, name', [
+    ('INDOMARET', 'Indomaret'),
+    ('Circle K', 'Circle K'),
+    ('CircleK', 'Circle K'),
+    ("MOMI & TOY'S", "Momi & Toy's Crêperie"),
+    ('Momi Toys Creperie', "Momi & Toy's Crêperie"),
+])
+def test_lookup_exact(lexicon, text, name):
+    canonical, score, _ = lexicon.lookup(text)
+    assert (canonical, score) == (name, 1.0)
+
+
+@pytest.mark.parametrize('text, name', [
+    ('lndomaret', 'Indomaret'),
+    ('Clrcle K', 'Circle K'),
+    ('Kopi Kenanqan', 'Kopi Kenangan'),
+])
+def test_lookup_fuzzy(lexicon, text, name):
+    canonical, score, _ = lexicon.lookup(text)
+    assert canonical == name
+    assert 0.8 <= score < 1.0
+
+
+@pytest.mark.parametrize('text', [
+    'Circle',      # alias dua kata, jendela satu kata
+    'Lawsn',       # key < 6 karakter harus sama persis
+    'Indomaret'[:5],
+    '123456789',
+    'Alfamart',
+])
+def test_lookup_rejected(lexicon, text):
+    assert lexicon.lookup(text) is None
+
+
+def test_match_prefers_exact_and_reports_line(lexicon):
+    found = lexicon.match(['Selamat datang', 'lndomaret', 'INDOMARET CABANG 2'])
+    assert found == {'name': 'Indomaret', 'score': 1.0, 'text': 'INDOMARET', 'line': 2}
+
+
+@pytest.mark.parametrize('text, name', [
+    ('Jl. Lawson No. 3\nTotal 5000', None),
+    ('Kasir: Lawson', None),
+    ('Circle\nJl. Sudirman', None),
+    ('KOPI KENANGAN\nJl. Merdeka No. 5', 'Kopi Kenangan'),
+    ('INDOMARET JL. MERDEKA', 'Indomaret'),
+])
+def test_receipt_header_skips_address_and_cashier_text(text, name):
+    found = ReceiptText(text).merchant_match()
+    assert (found and found['name']) == name
@@ -0,0 +1,31 @@
+"""Meta OCR yang dibaca kembali dari OcrStore sama tipenya dengan hasil process_receipt_image."""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_store import OcrStore  # noqa: E402
+
+LAYOUT = {
+    'width': 400,
+    'median_word_height': 20,
+    'lines': [{'text': 'TOTAL 12.500', 'conf': 90.0, 'bbox': [10, 10, 200, 30], 'words': [
+        {'text': 'TOTAL', 'conf': 92.0, 'bbox': [10, 10, 90, 30]},
+        {'text': '12.500', 'conf': 88.0, 'bbox': [100, 10, 200, 30]},
+    ]}],
+}
+
+
+@pytest.mark.parametrize('psm', [6, 11, 'roi', 'stream', None])
+def test_psm_round_trip(tmp_path, psm):
+    store = OcrStore(str(tmp_path / 'ocr.db'))
+    try:
+        store.save('abc', {'layout': LAYOUT, 'ocr': {'psm': psm, 'strategy': 'adaptive', 'confidence': 90.0}})
+        _, meta = store.get_layout('abc')
+        assert meta['psm'] == psm
+        [[(_, _, _, _, record_meta)]] = list(store.iter_records(['abc']))
+        assert record_meta == meta
+    finally:
+        store.close()
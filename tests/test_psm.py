@@ -0,0 +1,38 @@
+"""Pemilihan PSM adaptif (run_psm_adaptive) tidak bergantung ukuran batch paralel."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extraction  # noqa: E402
+from extraction import PsmWinStats, run_psm_adaptive  # noqa: E402
+
+CONFIDENCES = {6: 60.0, 3: 85.0, 4: 95.0, 11: None, 12: 70.0}
+
+
+@pytest.fixture
+def fake_psm(monkeypatch):
+    monkeypatch.setattr(extraction, '_run_psm_safe',
+                        lambda img, psm: (CONFIDENCES[psm], f"psm{psm}", {'lines': []}))
+
+
+@pytest.mark.parametrize('confidence_target', [80.0, 90.0, 99.0])
+def test_adaptive_result_independent_of_max_workers(fake_psm, confidence_target):
+    img = np.zeros((10, 10), np.uint8)
+    results = []
+    for max_workers in (1, 2, 4):
+        stats = PsmWinStats()
+        text, confidence, psm, scores, _ = run_psm_adaptive(
+            img, confidence_target=confidence_target, max_workers=max_workers, stats=stats)
+        results.append((text, confidence, psm, scores, stats.snapshot()))
+    assert results[0] == results[1] == results[2]
+
+
+def test_adaptive_stops_at_first_mode_reaching_target(fake_psm):
+    _, confidence, psm, scores, _ = run_psm_adaptive(
+        np.zeros((10, 10), np.uint8), confidence_target=80.0, max_workers=4, stats=PsmWinStats())
+    assert (psm, confidence) == (3, 85.0)
+    assert list(scores) == [6, 3]
@@ -0,0 +1,37 @@
+"""Deteksi baris dan pita header/items/totals untuk OCR per region (detect_text_bands)."""
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import detect_text_bands, detect_text_lines  # noqa: E402
+
+
+def _text_image(lines, height=800, pitch=60):
+    """Gambar biner (teks putih di atas hitam, seperti hasil preprocess_pipeline) dengan `lines` baris."""
+    img = np.zeros((height, 400), np.uint8)
+    for i in range(lines):
+        cv2.putText(img, 'TOTAL 12.500', (10, 40 + i * pitch), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 255, 2)
+    return img
+
+
+def test_bands_split_text_area_by_position():
+    img = _text_image(12)
+    # Tepi kertas dan noise kecil bukan baris teks
+    cv2.rectangle(img, (0, 0), (399, 799), 255, 1)
+    img[780, 300] = 255
+    assert len(detect_text_lines(img)) == 12
+
+    bands = detect_text_bands(img)
+    assert [band['name'] for band in bands] == ['header', 'items', 'totals']
+    assert [band['lines'] for band in bands] == [3, 5, 4]
+    for upper, lower in zip(bands, bands[1:]):
+        assert upper['bbox'][3] < lower['bbox'][1]
+
+
+def test_bands_skip_empty_bands():
+    assert detect_text_bands(np.zeros((200, 400), np.uint8)) == []
+    assert [band['name'] for band in detect_text_bands(_text_image(1))] == ['header']